@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Latency of the /api/analytics endpoints over a year of sales.
+
+Builds the app in-process on a temporary SQLite database, imports
+--invoices sales invoices spread over the last 365 days through
+POST /api/invoices/bulk, then times each analytics endpoint for a one-year
+range with the result cache disabled (every call runs the SQL) and reports
+p50/p95 per endpoint. Exits non-zero when a p95 exceeds --max-ms.
+
+    python benchmarks/analytics_benchmark.py --invoices 50000 --runs 20 --max-ms 250
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+CATEGORIES = ['Sarees', 'Kurtas', 'Dupattas', 'Fabrics', 'Accessories']
+
+
+def build_app(args):
+    from src.main import create_app
+
+    database_path = os.path.join(tempfile.mkdtemp(prefix='analytics-bench-'), 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{database_path}",
+        'ANALYTICS_CACHE_ENABLED': False,
+    })
+    seed(app, args)
+    return app
+
+
+def seed(app, args):
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    for i in range(1, args.customers + 1):
+        client.post('/api/customers', json={
+            'name': f"Customer {i}", 'phone_number': f"90000{i:05d}",
+            'customer_type': 'Wholesale' if i % 4 == 0 else 'Retail',
+        })
+    for i in range(1, args.products + 1):
+        client.post('/api/products', json={
+            'name': f"Product {i}", 'sku': f"SKU{i}", 'category': CATEGORIES[i % len(CATEGORIES)],
+            'retail_price': 100 + i, 'cost_price': 50 + i, 'stock_quantity': 10 ** 6,
+        })
+
+    first_day = date.today() - timedelta(days=364)
+    invoices = []
+    for i in range(args.invoices):
+        invoices.append({
+            'invoice_type': 'sales',
+            'customer_id': rng.randint(1, args.customers),
+            'invoice_date': (first_day + timedelta(days=rng.randrange(365))).isoformat(),
+            'status': 'cancelled' if i % 50 == 0 else 'sent',
+            'line_items': [
+                {'product_id': rng.randint(1, args.products), 'quantity': rng.randint(1, 5), 'tax_rate': 5}
+                for _ in range(rng.randint(1, args.max_lines))
+            ],
+        })
+    started = time.perf_counter()
+    for start in range(0, len(invoices), 10000):
+        response = client.post('/api/invoices/bulk', json=invoices[start:start + 10000])
+        if response.status_code != 201:
+            raise RuntimeError(f"Seeding failed: {response.get_json()}")
+    print(f"Seeded {args.invoices} invoices in {time.perf_counter() - started:.1f} s")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--invoices', type=int, default=50000)
+    parser.add_argument('--max-lines', type=int, default=5, help='Line items per invoice (1 to N)')
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--products', type=int, default=300)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--max-ms', type=float, default=None, help='Fail if any endpoint p95 exceeds this')
+    args = parser.parse_args()
+
+    client = build_app(args).test_client()
+    year = f"from={(date.today() - timedelta(days=364)).isoformat()}&to={date.today().isoformat()}"
+    paths = [
+        f"/api/analytics/top-products?{year}&by=revenue&limit=10",
+        f"/api/analytics/top-products?{year}&by=margin&limit=10",
+        f"/api/analytics/categories?{year}",
+        f"/api/analytics/revenue?{year}&granularity=month",
+        f"/api/analytics/summary?{year}",
+        f"/api/analytics/cogs?{year}&granularity=month",
+        f"/api/analytics/series?{year}&metric=sales&interval=day",
+        f"/api/analytics/series?{year}&metric=receipts&interval=week",
+        "/api/analytics/inventory-valuation",
+    ]
+
+    failures = []
+    print(f"{'endpoint':70} {'p50 ms':>8} {'p95 ms':>8}")
+    for path in paths:
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            response = client.get(path)
+            timings.append((time.perf_counter() - started) * 1000.0)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}: {response.get_json()}")
+        p50, p95 = statistics.median(timings), percentile(timings, 95)
+        print(f"{path:70} {p50:8.1f} {p95:8.1f}")
+        if args.max_ms is not None and p95 > args.max_ms:
+            failures.append(f"{path} p95 {p95:.1f} ms > budget {args.max_ms:.1f} ms")
+
+    for failure in failures:
+        print(f"✗ {failure}")
+    if args.max_ms is not None and not failures:
+        print("✓ Analytics endpoints within budget")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
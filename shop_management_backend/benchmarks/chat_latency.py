@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Load test for /api/chat and /api/chat/confirm without network access.
+
+By default the app is built in-process on a temporary SQLite database
+seeded with synthetic customers, products and invoices, and the LLM is the
+offline replay provider: recorded responses from --replay are served when
+present, synthetic plans otherwise, each after --llm-latency seconds. The
+local intent classifier and the plan cache are disabled so every chat turn
+takes the LLM path. Pass --url to drive a running server instead.
+
+Requests are sent from --concurrency threads and the report shows
+p50/p95/p99 of the wall time and of the queue/llm/db/serialize phases from
+each response's Server-Timing header.
+
+    python benchmarks/chat_latency.py --requests 500 --concurrency 16 --llm-latency 0.3
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+CHAT_MESSAGES = [
+    "Show me unpaid invoices",
+    "List all customers",
+    "Which items are low in stock?",
+    "Show payments received this month",
+    "Show invoices for Customer 7",
+    "Check stock for Product 3",
+    "Show paid invoices from last month",
+    "List suppliers",
+]
+PHASES = ('queue', 'llm', 'db', 'serialize')
+
+
+class InProcessClient:
+    """Calls the Flask app directly through its test client"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def post(self, path, payload):
+        response = self.app.test_client().post(path, json=payload)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class HttpClient:
+    """Calls a running server over HTTP"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def post(self, path, payload):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Server-Timing', '')
+
+
+def build_app(args):
+    from src.main import create_app
+    from src.services.llm import reset_llm_provider
+
+    database_path = os.path.join(tempfile.mkdtemp(prefix='chat-bench-'), 'bench.db')
+    reset_llm_provider()
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{database_path}",
+        'LLM_PROVIDER': 'replay',
+        'LLM_REPLAY_PATH': args.replay,
+        'FAKE_LLM_LATENCY_SECONDS': args.llm_latency,
+        'FAKE_LLM_JITTER_SECONDS': args.llm_jitter,
+        'LOCAL_INTENT_ENABLED': False,
+        'CHAT_CACHE_ENABLED': False,
+    })
+    seed(app, args)
+    return app
+
+
+def seed(app, args):
+    client = app.test_client()
+    for i in range(1, args.customers + 1):
+        client.post('/api/customers', json={'name': f"Customer {i}", 'phone_number': f"90000{i:05d}"})
+    client.post('/api/suppliers', json={'name': 'Textile Hub'})
+    for i in range(1, args.products + 1):
+        client.post('/api/products', json={
+            'name': f"Product {i}", 'sku': f"SKU{i}", 'retail_price': 100 + i, 'wholesale_price': 80 + i,
+            'cost_price': 50 + i, 'stock_quantity': 1000, 'min_stock_level': 10 if i % 5 else 2000,
+        })
+    for i in range(args.invoices):
+        product_id = i % args.products + 1
+        client.post('/api/invoices', json={
+            'invoice_type': 'sales',
+            'customer_id': i % args.customers + 1,
+            'line_items': [{'product_id': product_id, 'quantity': 1 + i % 3, 'unit_price': 100 + product_id}],
+        })
+
+
+def parse_server_timing(header):
+    phases = {}
+    for part in header.split(','):
+        name, _, duration = part.strip().partition(';dur=')
+        if duration:
+            phases[name] = float(duration)
+    return phases
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_requests(args):
+    requests = []
+    for i in range(args.requests):
+        if args.confirm_ratio and i % round(1 / args.confirm_ratio) == 0:
+            body = {'name': f"Bench Customer {i}", 'phone_number': f"80000{i:05d}"}
+            requests.append(('/api/chat/confirm', {'api_calls': [{'method': 'POST', 'endpoint': '/api/customers', 'body': body}]}))
+        else:
+            requests.append(('/api/chat', {'message': CHAT_MESSAGES[i % len(CHAT_MESSAGES)]}))
+    return requests
+
+
+def run(client, requests, concurrency):
+    def send(request):
+        path, payload = request
+        started = time.perf_counter()
+        status, server_timing = client.post(path, payload)
+        return path, status, (time.perf_counter() - started) * 1000.0, parse_server_timing(server_timing)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(send, requests))
+    return samples, time.perf_counter() - started
+
+
+def report(samples, elapsed):
+    print(f"{len(samples)} requests in {elapsed:.2f} s ({len(samples) / elapsed:.1f} req/s)")
+    print(f"{'endpoint':<20} {'metric':<10} {'p50':>9} {'p95':>9} {'p99':>9}  (ms)")
+    errors = 0
+    for path in sorted({sample[0] for sample in samples}):
+        rows = [sample for sample in samples if sample[0] == path]
+        errors += sum(1 for _, status, _, _ in rows if status >= 400)
+        series = {'total': [wall_ms for _, _, wall_ms, _ in rows]}
+        for phase in PHASES:
+            series[phase] = [phases.get(phase, 0.0) for _, _, _, phases in rows]
+        for metric, values in series.items():
+            print(f"{path:<20} {metric:<10} {statistics.median(values):9.2f} "
+                  f"{percentile(values, 95):9.2f} {percentile(values, 99):9.2f}")
+    if errors:
+        print(f"✗ {errors} requests failed")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Base URL of a running server (default: in-process app)')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--confirm-ratio', type=float, default=0.2, help='Share of requests sent to /api/chat/confirm')
+    parser.add_argument('--replay', help='JSONL file of recorded LLM responses')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='Simulated LLM round trip in seconds')
+    parser.add_argument('--llm-jitter', type=float, default=0.05, help='Random extra LLM latency in seconds')
+    parser.add_argument('--customers', type=int, default=50)
+    parser.add_argument('--products', type=int, default=40)
+    parser.add_argument('--invoices', type=int, default=300)
+    args = parser.parse_args()
+
+    client = HttpClient(args.url) if args.url else InProcessClient(build_app(args))
+    samples, elapsed = run(client, build_requests(args), args.concurrency)
+    return 1 if report(samples, elapsed) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Run time of the catalog-wide demand forecast.
+
+Builds the app in-process on a temporary SQLite database and inserts
+--products products and --invoices sales invoices over the forecast
+history directly through the ORM tables (the API would take far longer to
+seed a catalog this size), then times run_demand_forecast(), which reads
+the daily sales, computes every forecast and writes them back. Exits
+non-zero when a run exceeds --max-seconds.
+
+    python benchmarks/forecast_benchmark.py --products 50000 --invoices 100000 --max-seconds 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def build_app(args):
+    from src.main import create_app
+
+    database_path = os.path.join(tempfile.mkdtemp(prefix='forecast-bench-'), 'bench.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{database_path}"})
+    with app.app_context():
+        seed(app, args)
+    return app
+
+
+def seed(app, args):
+    from sqlalchemy import insert
+    from src.models.user import db
+    from src.models.product import Product
+    from src.models.invoice import Invoice, InvoiceLineItem
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    created = now - timedelta(days=app.config['FORECAST_HISTORY_DAYS'])
+    started = time.perf_counter()
+    db.session.execute(insert(Product), [
+        {
+            'name': f"Product {i}", 'sku': f"SKU{i}", 'retail_price': 100, 'wholesale_price': 80,
+            'cost_price': 50, 'stock_quantity': rng.randint(0, 200), 'is_active': True,
+            'created_at': created, 'updated_at': created,
+        }
+        for i in range(1, args.products + 1)
+    ])
+
+    first_day = date.today() - timedelta(days=app.config['FORECAST_HISTORY_DAYS'] - 1)
+    invoices, line_items = [], []
+    for invoice_id in range(1, args.invoices + 1):
+        invoices.append({
+            'id': invoice_id, 'invoice_number': f"B{invoice_id}", 'invoice_type': 'sales', 'status': 'sent',
+            'invoice_date': first_day + timedelta(days=rng.randrange(app.config['FORECAST_HISTORY_DAYS'])),
+            'created_at': now, 'updated_at': now,
+        })
+        for _ in range(rng.randint(1, args.max_lines)):
+            line_items.append({
+                'invoice_id': invoice_id, 'product_id': rng.randint(1, args.products), 'item_name': 'Item',
+                'quantity': rng.randint(1, 5), 'unit_price': 100, 'line_total': 100, 'created_at': now,
+            })
+    db.session.execute(insert(Invoice), invoices)
+    db.session.execute(insert(InvoiceLineItem), line_items)
+    db.session.commit()
+    print(f"Seeded {args.products} products, {args.invoices} invoices, {len(line_items)} lines "
+          f"in {time.perf_counter() - started:.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--invoices', type=int, default=100000)
+    parser.add_argument('--max-lines', type=int, default=5, help='Line items per invoice (1 to N)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--max-seconds', type=float, default=None, help='Fail if a run exceeds this')
+    args = parser.parse_args()
+
+    from src.models.user import db
+    from src.services.forecasting import run_demand_forecast
+
+    app = build_app(args)
+    timings = []
+    with app.app_context():
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            forecasts, updated = run_demand_forecast(app.config, apply_levels=True)
+            db.session.commit()
+            timings.append(time.perf_counter() - started)
+    print(f"Forecast {forecasts} products ({updated} levels updated): "
+          f"best {min(timings):.2f} s, worst {max(timings):.2f} s")
+
+    if args.max_seconds is not None and max(timings) > args.max_seconds:
+        print(f"✗ Forecast took {max(timings):.2f} s > budget {args.max_seconds:.2f} s")
+        return 1
+    if args.max_seconds is not None:
+        print("✓ Forecast within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
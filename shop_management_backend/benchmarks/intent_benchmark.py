@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Coverage and latency benchmark for the local chat intent classifier.
+
+Runs every message in ``intent_corpus.jsonl`` through
+``src.services.intent.classify`` against a fixed snapshot of customer,
+supplier and product names (exact and fuzzy indexes), then reports:
+
+* coverage  - share of messages answered locally (without the LLM)
+* accuracy  - share of locally answered messages with the expected plan
+* leakage   - messages labelled for the LLM that were answered locally
+* latency   - p50/p99 classification time
+
+Exits non-zero when accuracy drops below --min-accuracy, any LLM-labelled
+message leaks, or p99 latency exceeds --max-p99-ms.
+
+    python benchmarks/intent_benchmark.py --iterations 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from src.services.intent import KnownEntities, classify, DEFAULT_MIN_CONFIDENCE
+from src.services.entity_resolver import EntityResolver
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent_corpus.jsonl')
+
+CUSTOMERS = [
+    "Priya Sharma", "Rajesh Kumar", "Anjali Singh", "Sanjay Gupta", "Neha Kumari",
+    "Amit Verma", "Pooja Devi", "Vikas Yadav", "Shweta Mishra", "Rahul Singh",
+]
+SUPPLIERS = ["Textile Hub", "Fashion Forward", "Garment Galaxy", "Shoe Mart", "Accessory World"]
+PRODUCTS = [
+    "Cotton Kurta - Blue", "Silk Saree - Red", "Denim Jeans - Black", "Kanjivaram Silk",
+    "Formal Shirt - White", "Scarf - Silk", "Handbag - Leather",
+]
+
+
+def date_placeholders():
+    today = datetime.now().date()
+    first_of_month = today.replace(day=1)
+    last_month_end = first_of_month - timedelta(days=1)
+    return {
+        '{today}': today.isoformat(),
+        '{yesterday}': (today - timedelta(days=1)).isoformat(),
+        '{last_week}': (today - timedelta(days=7)).isoformat(),
+        '{this_month}': first_of_month.isoformat(),
+        '{last_month_start}': last_month_end.replace(day=1).isoformat(),
+        '{last_month_end}': last_month_end.isoformat(),
+    }
+
+
+def load_corpus(path):
+    placeholders = date_placeholders()
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            expected = entry.get('expected')
+            if expected:
+                expected['params'] = {
+                    key: placeholders.get(value, value) if isinstance(value, str) else value
+                    for key, value in expected.get('params', {}).items()
+                }
+            corpus.append(entry)
+    return corpus
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--iterations', type=int, default=100, help='Timing repetitions per message')
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE)
+    parser.add_argument('--min-accuracy', type=float, default=1.0)
+    parser.add_argument('--max-p99-ms', type=float, default=5.0)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    snapshot = {
+        'customer': list(enumerate(CUSTOMERS, start=1)),
+        'supplier': list(enumerate(SUPPLIERS, start=1)),
+        'product': list(enumerate(PRODUCTS, start=1)),
+    }
+    known = KnownEntities(snapshot['customer'], snapshot['supplier'], snapshot['product'])
+    resolver = EntityResolver()
+    for kind, rows in snapshot.items():
+        for entity_id, name in rows:
+            resolver.add(kind, entity_id, name)
+    corpus = load_corpus(args.corpus)
+
+    answered = correct = leaked = 0
+    expected_local = sum(1 for entry in corpus if entry['expected'])
+    problems = []
+    timings_ms = []
+
+    for entry in corpus:
+        message, expected = entry['message'], entry['expected']
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            plan = classify(message, known=known, resolver=resolver)
+            timings_ms.append((time.perf_counter() - started) * 1000.0)
+
+        local = plan if plan and plan['confidence'] >= args.min_confidence else None
+        if local is None:
+            if expected:
+                problems.append(f"missed   {message!r}")
+            continue
+
+        answered += 1
+        if expected is None:
+            leaked += 1
+            problems.append(f"leaked   {message!r} -> {local['action']}")
+            continue
+
+        call = local['api_calls'][0]
+        actual = {'action': local['action'], 'endpoint': call['endpoint'], 'params': call['params']}
+        if actual == expected:
+            correct += 1
+        else:
+            problems.append(f"wrong    {message!r}\n           expected {expected}\n           got      {actual}")
+
+    coverage = answered / len(corpus) if corpus else 0.0
+    recall = correct / expected_local if expected_local else 0.0
+    accuracy = correct / answered if answered else 0.0
+    p50 = statistics.median(timings_ms)
+    p99 = percentile(timings_ms, 99)
+
+    print(f"Messages:  {len(corpus)} ({expected_local} labelled local, {len(corpus) - expected_local} labelled LLM)")
+    print(f"Coverage:  {coverage:.1%} answered locally")
+    print(f"Recall:    {recall:.1%} of locally answerable messages")
+    print(f"Accuracy:  {accuracy:.1%} of local answers")
+    print(f"Leaked:    {leaked}")
+    print(f"Latency:   p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+    if args.verbose or problems:
+        for problem in problems:
+            print(f"  {problem}")
+
+    failures = []
+    if accuracy < args.min_accuracy:
+        failures.append(f"accuracy {accuracy:.1%} < {args.min_accuracy:.1%}")
+    if leaked:
+        failures.append(f"{leaked} LLM-labelled messages answered locally")
+    if p99 > args.max_p99_ms:
+        failures.append(f"p99 latency {p99:.3f} ms > {args.max_p99_ms} ms")
+    for failure in failures:
+        print(f"✗ {failure}")
+    if not failures:
+        print("✓ Intent classifier within budget")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
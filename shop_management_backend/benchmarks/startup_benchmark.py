@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Backend cold-start benchmark.
+
+Boots ``src.wsgi`` in a fresh interpreter under ``python -X importtime``
+several times and reports the import time and peak RSS after boot. The
+script exits non-zero when a budget is exceeded or when a module that must
+stay lazy (the LLM SDK) is imported at startup, so it can guard CI against
+startup regressions.
+
+    python benchmarks/startup_benchmark.py --runs 5 --max-import-ms 1500 --max-rss-mb 120
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must never be imported just by booting the app
+LAZY_MODULES = ['google.generativeai']
+
+BOOT_SNIPPET = """
+import json, resource, sys
+import src.wsgi
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss_kb //= 1024
+print(json.dumps({'rss_kb': rss_kb, 'modules': sorted(sys.modules)}))
+"""
+
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us)} from -X importtime output"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def boot_once(database_url):
+    env = dict(os.environ)
+    env['DATABASE_URL'] = database_url
+    env.setdefault('APP_ENV', 'production')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_SNIPPET],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Boot failed:\n{proc.stderr[-2000:]}")
+    payload = json.loads(proc.stdout.strip().splitlines()[-1])
+    timings = parse_importtime(proc.stderr)
+    return {
+        'import_ms': sum(self_us for self_us, _ in timings.values()) / 1000.0,
+        'rss_mb': payload['rss_kb'] / 1024.0,
+        'modules': set(payload['modules']),
+        'timings': timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=None, help='Fail if median import time exceeds this')
+    parser.add_argument('--max-rss-mb', type=float, default=None, help='Fail if median RSS after boot exceeds this')
+    parser.add_argument('--top', type=int, default=10, help='Show the N slowest top-level imports')
+    parser.add_argument('--json', action='store_true', help='Print machine readable results')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        runs = [boot_once(database_url) for _ in range(args.runs)]
+
+    import_ms = statistics.median(r['import_ms'] for r in runs)
+    rss_mb = statistics.median(r['rss_mb'] for r in runs)
+    eager = sorted({m for r in runs for m in LAZY_MODULES if m in r['modules']})
+
+    slowest = sorted(runs[-1]['timings'].items(), key=lambda kv: kv[1][1], reverse=True)[:args.top]
+
+    failures = []
+    if eager:
+        failures.append(f"modules imported eagerly at boot: {', '.join(eager)}")
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import time {import_ms:.1f} ms > budget {args.max_import_ms:.1f} ms")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"RSS {rss_mb:.1f} MB > budget {args.max_rss_mb:.1f} MB")
+
+    if args.json:
+        print(json.dumps({
+            'runs': args.runs,
+            'median_import_ms': round(import_ms, 1),
+            'median_rss_mb': round(rss_mb, 1),
+            'eager_modules': eager,
+            'failures': failures,
+        }))
+    else:
+        print(f"Runs: {args.runs}")
+        print(f"Median import time: {import_ms:.1f} ms")
+        print(f"Median RSS after boot: {rss_mb:.1f} MB")
+        print("Slowest imports (cumulative):")
+        for name, (_, cumulative_us) in slowest:
+            print(f"  {cumulative_us / 1000.0:8.1f} ms  {name}")
+        for failure in failures:
+            print(f"✗ {failure}")
+        if not failures:
+            print("✓ Startup within budget")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
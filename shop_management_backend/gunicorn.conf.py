@@ -0,0 +1,42 @@
+"""Gunicorn settings for the shop management backend.
+
+Every value can be tuned through the environment, e.g.
+
+    GUNICORN_WORKERS=8 GUNICORN_THREADS=4 gunicorn -c gunicorn.conf.py src.wsgi:app
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Worker model: processes x threads. gthread keeps a few threads per worker
+# so a slow request (e.g. an LLM call) does not block the whole process.
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers periodically to bound memory growth; the jitter keeps
+# them from all restarting at the same moment.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Import the app (and run the schema check) once in the master, then fork.
+# Workers share the already-imported modules copy-on-write, so cold starts
+# stay fast and consistent regardless of the worker count.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """Drop connections inherited from the master so each worker opens its own"""
+    from src.models.user import db
+    from src.wsgi import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,344 @@
+"""ASGI entry point with non-blocking chat endpoints.
+
+``POST /api/chat`` and ``POST /api/chat/stream`` are served by async
+handlers that await the LLM on the event loop and run their database work
+on a small thread pool, so a slow model call holds no thread while it is in
+flight. Every other request, including ``/api/chat/confirm``, goes to the
+regular Flask app, each on its own thread from a pool. (asgiref's
+WsgiToAsgi runs every request on one shared thread, so a single slow
+request would hold up all the others.)
+
+Run with uvicorn from the backend directory:
+
+    uvicorn src.asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+from flask import Response, jsonify
+
+from src.main import create_app
+from src.routes.chat import (
+    SSE_HEADERS, answer_chat, build_prompt, create_fallback_response, find_ready_plan,
+    plan_events, plan_from_llm_text, rejection_response, sse_event,
+)
+from src.services.chat_gateway import ChatRejected, get_async_chat_gateway
+from src.services.llm import get_llm_provider
+
+CHAT_PATH = '/api/chat'
+CHAT_STREAM_PATH = '/api/chat/stream'
+
+
+class PooledWsgiToAsgi:
+    """ASGI adapter that runs each request of a WSGI app on a thread of ``executor``.
+
+    The response is sent as the app yields it, so streamed responses are
+    not buffered.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        self.wsgi_application = wsgi_application
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type '{scope['type']}'")
+        body = await read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.run, build_environ(scope, body), send, loop)
+
+    def run(self, environ, send, loop):
+        """Run the WSGI app on this worker thread, sending through the event loop"""
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = {}
+        started = False
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            start.update({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+
+        result = self.wsgi_application(environ, start_response)
+        try:
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    started = True
+                    send_sync(start)
+                send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                started = True
+                send_sync(start)
+            send_sync({'type': 'http.response.body'})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+flask_app = create_app('production')
+wsgi_executor = ThreadPoolExecutor(
+    max_workers=flask_app.config.get('ASGI_WSGI_WORKERS', 16),
+    thread_name_prefix='wsgi',
+)
+wsgi_app = PooledWsgiToAsgi(flask_app, wsgi_executor)
+db_executor = ThreadPoolExecutor(
+    max_workers=flask_app.config.get('CHAT_ASYNC_DB_WORKERS', 8),
+    thread_name_prefix='chat-db',
+)
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope, so Flask can build a request"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': unquote(scope['path']),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1] or 80)
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def in_request(environ, fn, *args):
+    """Run fn on the database pool inside its own Flask request context"""
+    def run():
+        with flask_app.request_context(environ):
+            return fn(*args)
+
+    return await asyncio.get_running_loop().run_in_executor(db_executor, run)
+
+
+async def iterate_in_request(environ, fn):
+    """Async-iterate the generator fn() as it runs on the database pool
+    inside its own Flask request context"""
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    done = object()
+
+    def run():
+        try:
+            with flask_app.request_context(environ):
+                for item in fn():
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(items.put_nowait, done)
+
+    future = loop.run_in_executor(db_executor, run)
+    while True:
+        item = await items.get()
+        if item is done:
+            break
+        yield item
+    # Raises what fn raised
+    await future
+
+
+async def respond(environ, view, *args):
+    """Like in_request for a function returning a view result.
+
+    The response goes through after_request hooks (CORS) before the
+    context, and with it the database session, is torn down.
+    """
+    def run():
+        try:
+            response = flask_app.make_response(view(*args))
+        except ChatRejected as e:
+            response = rejection_response(e)
+        except Exception as e:
+            response = flask_app.make_response((jsonify({'error': str(e)}), 500))
+        return flask_app.process_response(response)
+
+    return await in_request(environ, run)
+
+
+def error(message, status_code):
+    return jsonify({'error': message}), status_code
+
+
+def sse_head():
+    """Status and headers of an event stream; the events are sent separately"""
+    return Response(mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+def read_message(environ):
+    """The chat message from the request body, or None"""
+    try:
+        data = json.loads(environ['wsgi.input'].getvalue() or b'null')
+    except ValueError:
+        return None
+    return data.get('message') if isinstance(data, dict) else None
+
+
+async def chat(environ):
+    """Async counterpart of the /chat route"""
+    user_message = read_message(environ)
+    if user_message is None:
+        return await respond(environ, error, 'Message is required', 400)
+
+    try:
+        plan, plan_source = await in_request(environ, find_ready_plan, user_message)
+    except Exception as e:
+        return await respond(environ, error, str(e), 500)
+    if plan is not None:
+        return await respond(environ, answer_chat, user_message, plan, plan_source)
+
+    try:
+        gateway = get_async_chat_gateway(flask_app.config)
+        admission = await gateway.admit()
+        try:
+            llm_started = time.perf_counter()
+            # Lets offline providers that read the database find the app
+            with flask_app.app_context():
+                response_text = await gateway.generate(admission, get_llm_provider(flask_app.config), build_prompt(user_message))
+            llm_ms = round((time.perf_counter() - llm_started) * 1000.0, 2)
+        finally:
+            # generate releases the slot itself, unless it was never reached
+            admission.release()
+    except ChatRejected as e:
+        return await respond(environ, rejection_response, e)
+    except Exception as e:
+        return await respond(environ, error, str(e), 500)
+
+    def answer():
+        llm_response = plan_from_llm_text(user_message, response_text)
+        if llm_response is None:
+            return create_fallback_response(user_message)
+        return answer_chat(user_message, llm_response, 'llm', admission.waited_ms, llm_ms)
+
+    return await respond(environ, answer)
+
+
+async def chat_stream(environ, send):
+    """Async counterpart of the /chat/stream route, with the same events"""
+    user_message = read_message(environ)
+    if user_message is None:
+        return await send_response(await respond(environ, error, 'Message is required', 400), send)
+    started = time.perf_counter()
+
+    # Admission happens before the stream starts so saturation is reported
+    # with a real 429/503 status instead of an error event
+    try:
+        plan, plan_source = await in_request(environ, find_ready_plan, user_message)
+        admission = None
+        if plan is None:
+            admission = await get_async_chat_gateway(flask_app.config).admit()
+    except ChatRejected as e:
+        return await send_response(await respond(environ, rejection_response, e), send)
+    except Exception as e:
+        return await send_response(await respond(environ, error, str(e), 500), send)
+
+    try:
+        await send_start(await respond(environ, sse_head), send)
+        await send_body(sse_event('ack', {'message': user_message}), send)
+        try:
+            chunks = []
+            if plan is None:
+                plan_source = 'llm'
+                gateway = get_async_chat_gateway(flask_app.config)
+                with flask_app.app_context():
+                    stream = gateway.stream(admission, get_llm_provider(flask_app.config), build_prompt(user_message))
+                    async for chunk in stream:
+                        chunks.append(chunk)
+                        await send_body(sse_event('token', {'text': chunk}), send)
+
+            def events():
+                llm_response = plan if plan is not None else plan_from_llm_text(user_message, ''.join(chunks))
+                yield from plan_events(user_message, llm_response, plan_source, started)
+
+            async for event in iterate_in_request(environ, events):
+                await send_body(event, send)
+        except ChatRejected as e:
+            await send_body(sse_event('error', {'error': e.message, 'status': e.status_code}), send)
+        except Exception as e:
+            await send_body(sse_event('error', {'error': str(e)}), send)
+        await send({'type': 'http.response.body'})
+    finally:
+        # Frees the slot even if the client disconnects before streaming starts
+        if admission is not None:
+            admission.release()
+
+
+async def send_start(response, send):
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.to_wsgi_list()]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+
+async def send_body(text, send):
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+
+async def send_response(response, send):
+    await send_start(response, send)
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            db_executor.shutdown(wait=False)
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application: async /api/chat and /api/chat/stream, everything else via Flask"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    path = scope.get('path', '').rstrip('/')
+    if scope['type'] == 'http' and scope['method'] == 'POST' and path in (CHAT_PATH, CHAT_STREAM_PATH):
+        body = await read_body(receive)
+        if body is None:
+            return
+        environ = build_environ(scope, body)
+        if path == CHAT_STREAM_PATH:
+            return await chat_stream(environ, send)
+        return await send_response(await chat(environ), send)
+    return await wsgi_app(scope, receive, send)
@@ -0,0 +1,147 @@
+import os
+
+BASE_DIR = os.path.dirname(__file__)
+DEFAULT_DATABASE_URI = f"sqlite:///{os.path.join(BASE_DIR, 'database', 'app.db')}"
+
+
+def env_bool(name, default=False):
+    """Read a boolean flag from the environment"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    """Read an integer setting from the environment"""
+    value = os.getenv(name)
+    if value is None or value.strip() == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+
+
+def env_float(name, default):
+    """Read a decimal setting from the environment"""
+    value = os.getenv(name)
+    if value is None or value.strip() == '':
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {value!r}")
+
+
+class Config:
+    """Base configuration shared by every environment"""
+    SECRET_KEY = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_pre_ping': True,
+    }
+
+    # Create missing tables when the app is built. In a preloaded gunicorn
+    # master this runs exactly once, before the workers are forked.
+    INIT_SCHEMA_ON_STARTUP = env_bool('INIT_SCHEMA_ON_STARTUP', True)
+
+    # LLM settings; the client itself is built lazily on the first chat call.
+    # LLM_PROVIDER=fake answers offline, for local development and tests.
+    # LLM_PROVIDER=replay serves responses recorded in LLM_REPLAY_PATH; with
+    # LLM_REPLAY_RECORD set, unknown messages go to Gemini and are recorded.
+    LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini')
+    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+    LLM_MODEL = os.getenv('LLM_MODEL', 'gemini-1.5-flash')
+    LLM_REPLAY_PATH = os.getenv('LLM_REPLAY_PATH')
+    LLM_REPLAY_RECORD = env_bool('LLM_REPLAY_RECORD', False)
+    # Simulated round trip for the fake and replay providers
+    FAKE_LLM_LATENCY_SECONDS = env_float('FAKE_LLM_LATENCY_SECONDS', 0.0)
+    FAKE_LLM_JITTER_SECONDS = env_float('FAKE_LLM_JITTER_SECONDS', 0.0)
+
+    # Cache of parsed LLM plans for /api/chat, keyed by normalized message
+    CHAT_CACHE_ENABLED = env_bool('CHAT_CACHE_ENABLED', True)
+    CHAT_CACHE_MAX_ENTRIES = env_int('CHAT_CACHE_MAX_ENTRIES', 1024)
+    CHAT_CACHE_MAX_BYTES = env_int('CHAT_CACHE_MAX_BYTES', 4 * 1024 * 1024)
+    CHAT_CACHE_TTL_SECONDS = env_int('CHAT_CACHE_TTL_SECONDS', 3600)
+
+    # Rule-based intent classifier that answers common queries without the LLM
+    LOCAL_INTENT_ENABLED = env_bool('LOCAL_INTENT_ENABLED', True)
+    LOCAL_INTENT_MIN_CONFIDENCE = env_float('LOCAL_INTENT_MIN_CONFIDENCE', 0.8)
+
+    # Fuzzy name matches (0-1) below this score are ignored by chat queries
+    ENTITY_MATCH_MIN_SCORE = env_float('ENTITY_MATCH_MIN_SCORE', 0.6)
+
+    # Bounded pool that runs the api_calls of one chat turn concurrently
+    CHAT_QUERY_WORKERS = env_int('CHAT_QUERY_WORKERS', 4)
+    CHAT_QUERY_TIMEOUT_SECONDS = env_int('CHAT_QUERY_TIMEOUT_SECONDS', 10)
+
+    # Admission control for chat turns that call the LLM: at most
+    # CHAT_MAX_CONCURRENT_LLM calls run at once, CHAT_MAX_QUEUE more wait up to
+    # CHAT_QUEUE_TIMEOUT_SECONDS (429 when full, 503 on timeout), and each
+    # call must finish within CHAT_LLM_TIMEOUT_SECONDS (504).
+    CHAT_MAX_CONCURRENT_LLM = env_int('CHAT_MAX_CONCURRENT_LLM', 4)
+    CHAT_MAX_QUEUE = env_int('CHAT_MAX_QUEUE', 16)
+    CHAT_QUEUE_TIMEOUT_SECONDS = env_float('CHAT_QUEUE_TIMEOUT_SECONDS', 5.0)
+    CHAT_LLM_TIMEOUT_SECONDS = env_float('CHAT_LLM_TIMEOUT_SECONDS', 30.0)
+
+    # The async chat handlers in src/asgi.py await the LLM instead of holding
+    # a thread, so they admit more concurrent calls; their database work runs
+    # on CHAT_ASYNC_DB_WORKERS threads. Every other route runs on the Flask
+    # app on ASGI_WSGI_WORKERS threads.
+    CHAT_ASYNC_MAX_CONCURRENT_LLM = env_int('CHAT_ASYNC_MAX_CONCURRENT_LLM', 32)
+    CHAT_ASYNC_MAX_QUEUE = env_int('CHAT_ASYNC_MAX_QUEUE', 64)
+    CHAT_ASYNC_DB_WORKERS = env_int('CHAT_ASYNC_DB_WORKERS', 8)
+    ASGI_WSGI_WORKERS = env_int('ASGI_WSGI_WORKERS', 16)
+
+    # Rows validated, resolved and inserted together by the bulk import
+    # endpoints (POST /api/invoices/bulk, POST /api/payments/bulk)
+    BULK_IMPORT_CHUNK_SIZE = env_int('BULK_IMPORT_CHUNK_SIZE', 1000)
+
+    # Short-lived cache of /api/analytics results, keyed by endpoint and query
+    ANALYTICS_CACHE_ENABLED = env_bool('ANALYTICS_CACHE_ENABLED', True)
+    ANALYTICS_CACHE_MAX_ENTRIES = env_int('ANALYTICS_CACHE_MAX_ENTRIES', 256)
+    ANALYTICS_CACHE_TTL_SECONDS = env_int('ANALYTICS_CACHE_TTL_SECONDS', 60)
+
+    # Rows per Arrow record batch / Parquet row group in /api/export
+    EXPORT_BATCH_SIZE = env_int('EXPORT_BATCH_SIZE', 50000)
+
+    # Demand forecast (flask forecast-demand): daily sales over the last
+    # FORECAST_HISTORY_DAYS, reorder point covering the supplier lead time at
+    # FORECAST_SERVICE_LEVEL, and a maximum that lasts FORECAST_REVIEW_DAYS more
+    FORECAST_HISTORY_DAYS = env_int('FORECAST_HISTORY_DAYS', 90)
+    FORECAST_MOVING_AVERAGE_DAYS = env_int('FORECAST_MOVING_AVERAGE_DAYS', 28)
+    FORECAST_SMOOTHING_ALPHA = env_float('FORECAST_SMOOTHING_ALPHA', 0.2)
+    FORECAST_LEAD_TIME_DAYS = env_int('FORECAST_LEAD_TIME_DAYS', 7)
+    FORECAST_REVIEW_DAYS = env_int('FORECAST_REVIEW_DAYS', 14)
+    FORECAST_SERVICE_LEVEL = env_float('FORECAST_SERVICE_LEVEL', 0.95)
+
+    # ABC classes (flask classify-products): A up to ABC_CLASS_A_SHARE of the
+    # revenue over ABC_HISTORY_DAYS, B up to ABC_CLASS_B_SHARE, C the rest.
+    # Products unsold for SLOW_MOVER_DAYS are slow movers.
+    ABC_HISTORY_DAYS = env_int('ABC_HISTORY_DAYS', 365)
+    ABC_CLASS_A_SHARE = env_float('ABC_CLASS_A_SHARE', 0.8)
+    ABC_CLASS_B_SHARE = env_float('ABC_CLASS_B_SHARE', 0.95)
+    SLOW_MOVER_DAYS = env_int('SLOW_MOVER_DAYS', 90)
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', 'sqlite://')
+    LLM_PROVIDER = 'fake'
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
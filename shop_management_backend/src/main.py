@@ -8,15 +8,21 @@ load_dotenv()
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+import click
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+from src.config import CONFIGS, DevelopmentConfig
+from src.schema import init_schema
+from src.services.export import DEFAULT_BATCH_SIZE, EXPORT_TABLES, FORMATS
 from src.models.user import db
 from src.models.company_profile import CompanyProfile
 from src.models.customer import Customer
 from src.models.supplier import Supplier
 from src.models.product import Product
 from src.models.invoice import Invoice, InvoiceLineItem
-from src.models.payment import Payment, LedgerEntry
+from src.models.payment import Payment, LedgerEntry, PaymentAllocation
+from src.models.analytics import DailySalesFact, CustomerMetric
+from src.models.inventory import CostLayer, CostLayerConsumption, ProductForecast
 from src.routes.user import user_bp
 from src.routes.company_profile import company_profile_bp
 from src.routes.customer import customer_bp
@@ -25,42 +31,143 @@ from src.routes.product import product_bp
 from src.routes.invoice import invoice_bp
 from src.routes.payment import payment_bp
 from src.routes.chat import chat_bp
+from src.routes.analytics import analytics_bp
+from src.routes.export import export_bp
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
-CORS(app)
-
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(company_profile_bp, url_prefix='/api')
-app.register_blueprint(customer_bp, url_prefix='/api')
-app.register_blueprint(supplier_bp, url_prefix='/api')
-app.register_blueprint(product_bp, url_prefix='/api')
-app.register_blueprint(invoice_bp, url_prefix='/api')
-app.register_blueprint(payment_bp, url_prefix='/api')
-app.register_blueprint(chat_bp, url_prefix='/api')
-
-# uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-with app.app_context():
-    db.create_all()
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
+
+def create_app(config=None):
+    """Build and configure a Flask application instance.
+
+    ``config`` may be a config class/object, a key of ``CONFIGS``
+    ('development', 'production', 'testing') or a plain mapping of
+    overrides. When omitted, ``APP_ENV`` selects the config class.
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+
+    if config is None:
+        config = os.getenv('APP_ENV', 'development')
+    if isinstance(config, str):
+        app.config.from_object(CONFIGS.get(config, DevelopmentConfig))
+    elif isinstance(config, dict):
+        app.config.from_object(DevelopmentConfig)
+        app.config.update(config)
     else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
+        app.config.from_object(config)
+
+    CORS(app)
+
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(company_profile_bp, url_prefix='/api')
+    app.register_blueprint(customer_bp, url_prefix='/api')
+    app.register_blueprint(supplier_bp, url_prefix='/api')
+    app.register_blueprint(product_bp, url_prefix='/api')
+    app.register_blueprint(invoice_bp, url_prefix='/api')
+    app.register_blueprint(payment_bp, url_prefix='/api')
+    app.register_blueprint(chat_bp, url_prefix='/api')
+    app.register_blueprint(analytics_bp, url_prefix='/api')
+    app.register_blueprint(export_bp, url_prefix='/api')
+
+    db.init_app(app)
+    if app.config.get('INIT_SCHEMA_ON_STARTUP'):
+        init_schema(app)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing database tables."""
+        init_schema(app)
+        print("✓ Database schema is up to date")
+
+    @app.cli.command('rebuild-sales-facts')
+    def rebuild_sales_facts_command():
+        """Recompute the daily sales rollup from the invoices."""
+        from src.services.sales_facts import rebuild_sales_facts
+        rows = rebuild_sales_facts()
+        db.session.commit()
+        print(f"✓ Rebuilt daily sales facts ({rows} rows)")
+
+    @app.cli.command('rebuild-cost-layers')
+    def rebuild_cost_layers_command():
+        """Recompute the FIFO cost layers by replaying the invoices."""
+        from src.services.cost_layers import rebuild_cost_layers
+        layers, consumptions = rebuild_cost_layers()
+        db.session.commit()
+        print(f"✓ Rebuilt cost layers ({layers} layers, {consumptions} consumptions)")
+
+    @app.cli.command('forecast-demand')
+    @click.option('--apply-levels', is_flag=True, help='Set min/max stock levels to the suggested ones')
+    @click.option('--as-of', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day of the sales history')
+    def forecast_demand_command(apply_levels, as_of):
+        """Forecast demand and reorder points for every active product."""
+        from src.services.forecasting import run_demand_forecast
+        forecasts, updated = run_demand_forecast(app.config, as_of.date() if as_of else None, apply_levels)
+        db.session.commit()
+        print(f"✓ Forecast demand for {forecasts} products")
+        if apply_levels:
+            print(f"  Updated min/max stock levels of {updated} products")
+
+    @app.cli.command('classify-products')
+    @click.option('--as-of', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day of the sales history')
+    def classify_products_command(as_of):
+        """Assign ABC classes and flag slow movers for every active product."""
+        from src.services.product_classes import classify_products
+        result = classify_products(app.config, as_of.date() if as_of else None)
+        db.session.commit()
+        print(f"✓ Classified products (A: {result['A']}, B: {result['B']}, C: {result['C']}, "
+              f"slow movers: {result['slow_movers']}; {result['updated']} changed)")
+
+    @app.cli.command('segment-customers')
+    @click.option('--as-of', type=click.DateTime(['%Y-%m-%d']), default=None, help='Day recency is measured from')
+    def segment_customers_command(as_of):
+        """Compute RFM scores and segments for every customer."""
+        from src.services.customer_segments import segment_customers
+        segments = segment_customers(as_of.date() if as_of else None)
+        db.session.commit()
+        print(f"✓ Segmented {sum(segments.values())} customers")
+        for segment, count in sorted(segments.items(), key=lambda item: -item[1]):
+            print(f"  {segment}: {count}")
+
+    @app.cli.command('export')
+    @click.argument('table_name', type=click.Choice(sorted(EXPORT_TABLES)))
+    @click.argument('path')
+    @click.option('--format', 'export_format', type=click.Choice(sorted(FORMATS)), default='parquet')
+    @click.option('--from', 'start', type=click.DateTime(['%Y-%m-%d']), default=None)
+    @click.option('--to', 'end', type=click.DateTime(['%Y-%m-%d']), default=None)
+    @click.option('--updated-since', type=click.DateTime(), default=None)
+    def export_command(table_name, path, export_format, start, end, updated_since):
+        """Write a table to a Parquet or Arrow IPC file."""
+        from src.services.export import write_export
+        table = EXPORT_TABLES[table_name]
+        filters = {
+            'start': start.date() if start else None,
+            'end': end.date() if end else None,
+            'updated_since': updated_since,
+        }
+        watermark = table.watermark(**filters)
+        with open(path, 'wb') as sink:
+            rows = write_export(
+                table, export_format, sink, app.config.get('EXPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE), updated_until=watermark, **filters
+            )
+        print(f"✓ Exported {rows} {table_name} rows to {path}")
+        if watermark is not None:
+            print(f"  Next incremental export: --updated-since {watermark.isoformat()} (rows at that time are repeated; de-duplicate by id)")
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
+                return "Static folder not configured", 404
+
+        if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
+            return send_from_directory(static_folder_path, path)
         else:
-            return "index.html not found", 404
+            index_path = os.path.join(static_folder_path, 'index.html')
+            if os.path.exists(index_path):
+                return send_from_directory(static_folder_path, 'index.html')
+            else:
+                return "index.html not found", 404
+
+    return app
 
 
 if __name__ == '__main__':
@@ -70,5 +177,6 @@ if __name__ == '__main__':
         print(f"✓ Gemini API Key loaded successfully")
     else:
         print("✗ Warning: Gemini API Key not found in environment variables")
-    
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+
+    app = create_app()
+    app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,92 @@
+from src.models.user import db
+from datetime import datetime
+
+
+class DailySalesFact(db.Model):
+    """Line items rolled up per day, product, customer type and invoice type.
+
+    Maintained by src.services.sales_facts whenever an invoice is created,
+    changed or cancelled, so revenue reports read a few hundred rows instead
+    of every line item. Cancelled invoices are not counted.
+    """
+    __tablename__ = 'daily_sales_facts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sale_date = db.Column(db.Date, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False, default=0)  # 0 for lines without a product
+    customer_type = db.Column(db.String(20), nullable=False, default='')  # '' for purchase invoices
+    invoice_type = db.Column(db.String(20), nullable=False)
+
+    # Measures
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # Net of tax
+    tax = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    cost = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # Quantity at the product's cost price when posted
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('sale_date', 'product_id', 'customer_type', 'invoice_type', name='uq_daily_sales_facts_key'),
+        db.Index('ix_daily_sales_facts_type_date', 'invoice_type', 'sale_date'),
+    )
+
+    def to_dict(self):
+        return {
+            'sale_date': self.sale_date.isoformat() if self.sale_date else None,
+            'product_id': self.product_id or None,
+            'customer_type': self.customer_type or None,
+            'invoice_type': self.invoice_type,
+            'line_count': self.line_count,
+            'quantity': float(self.quantity),
+            'revenue': float(self.revenue),
+            'tax': float(self.tax),
+            'cost': float(self.cost)
+        }
+
+
+class CustomerMetric(db.Model):
+    """Purchase activity and RFM (recency, frequency, monetary) segment of a customer.
+
+    Written for every customer by src.services.customer_segments; scores
+    run from 1 (lowest quintile) to 5 and are 0 for customers without a
+    purchase.
+    """
+    __tablename__ = 'customer_metrics'
+
+    customer_id = db.Column(db.Integer, primary_key=True)
+    computed_on = db.Column(db.Date, nullable=False)
+
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+    lifetime_value = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # Non-cancelled sales invoices
+    average_order_value = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    first_purchase_on = db.Column(db.Date, nullable=True)
+    last_purchase_on = db.Column(db.Date, nullable=True)
+    recency_days = db.Column(db.Integer, nullable=True)
+
+    recency_score = db.Column(db.Integer, nullable=False, default=0)
+    frequency_score = db.Column(db.Integer, nullable=False, default=0)
+    monetary_score = db.Column(db.Integer, nullable=False, default=0)
+    segment = db.Column(db.String(30), nullable=False)
+
+    # /api/customers filters by segment and sorts by lifetime value
+    __table_args__ = (
+        db.Index('ix_customer_metrics_segment_value', 'segment', 'lifetime_value'),
+        db.Index('ix_customer_metrics_value', 'lifetime_value'),
+    )
+
+    def to_dict(self):
+        return {
+            'computed_on': self.computed_on.isoformat() if self.computed_on else None,
+            'invoice_count': self.invoice_count,
+            'lifetime_value': float(self.lifetime_value),
+            'average_order_value': float(self.average_order_value),
+            'first_purchase_on': self.first_purchase_on.isoformat() if self.first_purchase_on else None,
+            'last_purchase_on': self.last_purchase_on.isoformat() if self.last_purchase_on else None,
+            'recency_days': self.recency_days,
+            'recency_score': self.recency_score,
+            'frequency_score': self.frequency_score,
+            'monetary_score': self.monetary_score,
+            'rfm_score': f"{self.recency_score}{self.frequency_score}{self.monetary_score}",
+            'segment': self.segment
+        }
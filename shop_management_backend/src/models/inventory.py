@@ -0,0 +1,116 @@
+from src.models.user import db
+from datetime import datetime
+
+
+class CostLayer(db.Model):
+    """Stock received at one unit cost (a purchase line, opening stock or an adjustment).
+
+    Sales consume the oldest layers of a product first; remaining_quantity
+    is what is still on hand at this cost.
+    """
+    __tablename__ = 'cost_layers'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # purchase, opening, adjustment
+    invoice_id = db.Column(db.Integer, nullable=True, index=True)
+    received_on = db.Column(db.Date, nullable=False)
+    unit_cost = db.Column(db.Numeric(12, 4), nullable=False, default=0)
+    quantity = db.Column(db.Numeric(12, 3), nullable=False)
+    remaining_quantity = db.Column(db.Numeric(12, 3), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Open layers of a product in FIFO order
+    __table_args__ = (
+        db.Index('ix_cost_layers_product_received', 'product_id', 'received_on', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'product_id': self.product_id,
+            'source': self.source,
+            'invoice_id': self.invoice_id,
+            'received_on': self.received_on.isoformat() if self.received_on else None,
+            'unit_cost': float(self.unit_cost),
+            'quantity': float(self.quantity),
+            'remaining_quantity': float(self.remaining_quantity)
+        }
+
+
+class CostLayerConsumption(db.Model):
+    """Quantity taken from a cost layer by a sale or a stock adjustment.
+
+    layer_id is empty when the product had no stock left in its layers; the
+    quantity is then valued at the product's cost price.
+    """
+    __tablename__ = 'cost_layer_consumptions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    layer_id = db.Column(db.Integer, db.ForeignKey('cost_layers.id'), nullable=True, index=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # sale, adjustment
+    invoice_id = db.Column(db.Integer, nullable=True, index=True)
+    consumed_on = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Numeric(12, 3), nullable=False)
+    unit_cost = db.Column(db.Numeric(12, 4), nullable=False)
+    cost = db.Column(db.Numeric(14, 4), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # COGS for a period
+    __table_args__ = (
+        db.Index('ix_cost_layer_consumptions_date', 'consumed_on', 'source', 'cost'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'layer_id': self.layer_id,
+            'product_id': self.product_id,
+            'source': self.source,
+            'invoice_id': self.invoice_id,
+            'consumed_on': self.consumed_on.isoformat() if self.consumed_on else None,
+            'quantity': float(self.quantity),
+            'unit_cost': float(self.unit_cost),
+            'cost': float(self.cost)
+        }
+
+
+class ProductForecast(db.Model):
+    """Demand forecast and suggested stock levels of a product.
+
+    Written for the whole catalog by src.services.forecasting; demand is in
+    units per day over the history window ending on computed_on.
+    """
+    __tablename__ = 'product_forecasts'
+
+    product_id = db.Column(db.Integer, primary_key=True)
+    computed_on = db.Column(db.Date, nullable=False)
+    history_days = db.Column(db.Integer, nullable=False)
+
+    average_demand = db.Column(db.Numeric(12, 4), nullable=False, default=0)  # Moving average
+    smoothed_demand = db.Column(db.Numeric(12, 4), nullable=False, default=0)  # Exponential smoothing
+    demand_std = db.Column(db.Numeric(12, 4), nullable=False, default=0)
+
+    lead_time_days = db.Column(db.Integer, nullable=False)
+    safety_stock = db.Column(db.Numeric(12, 3), nullable=False, default=0)
+    reorder_point = db.Column(db.Numeric(12, 3), nullable=False, default=0)
+    suggested_min = db.Column(db.Integer, nullable=False, default=0)
+    suggested_max = db.Column(db.Integer, nullable=False, default=0)
+    days_of_cover = db.Column(db.Numeric(10, 1), nullable=True)  # Stock at computation; empty without demand
+
+    def to_dict(self):
+        return {
+            'product_id': self.product_id,
+            'computed_on': self.computed_on.isoformat() if self.computed_on else None,
+            'history_days': self.history_days,
+            'average_demand': float(self.average_demand),
+            'smoothed_demand': float(self.smoothed_demand),
+            'demand_std': float(self.demand_std),
+            'lead_time_days': self.lead_time_days,
+            'safety_stock': float(self.safety_stock),
+            'reorder_point': float(self.reorder_point),
+            'suggested_min': self.suggested_min,
+            'suggested_max': self.suggested_max,
+            'days_of_cover': float(self.days_of_cover) if self.days_of_cover is not None else None
+        }
@@ -36,6 +36,12 @@ class Invoice(db.Model):
     # Relationships
     line_items = db.relationship('InvoiceLineItem', backref='invoice', lazy=True, cascade='all, delete-orphan')
     
+    # Open invoices of a party, oldest first (payment allocation, unpaid lists)
+    __table_args__ = (
+        db.Index('ix_invoices_customer_status_date', 'customer_id', 'status', 'invoice_date'),
+        db.Index('ix_invoices_supplier_status_date', 'supplier_id', 'status', 'invoice_date'),
+    )
+    
     def __repr__(self):
         return f'<Invoice {self.invoice_number}>'
     
@@ -69,20 +75,28 @@ class Invoice(db.Model):
         self.total_amount = subtotal + tax_amount - self.discount_amount
         self.updated_at = datetime.utcnow()
     
-    def to_dict(self):
-        # Get customer and supplier data using queries
+    def to_dict(self, names=None, line_items=None):
+        """Serialize the invoice; ``names`` (customer_name, supplier_name) and
+        ``line_items`` (serialized) skip the per-invoice lookups when given"""
         customer_name = None
         supplier_name = None
         
-        if self.customer_id:
-            from src.models.customer import Customer
-            customer = Customer.query.get(self.customer_id)
-            customer_name = customer.name if customer else None
-            
-        if self.supplier_id:
-            from src.models.supplier import Supplier
-            supplier = Supplier.query.get(self.supplier_id)
-            supplier_name = supplier.name if supplier else None
+        if names is not None:
+            customer_name, supplier_name = names
+        else:
+            # Get customer and supplier data using queries
+            if self.customer_id:
+                from src.models.customer import Customer
+                customer = Customer.query.get(self.customer_id)
+                customer_name = customer.name if customer else None
+                
+            if self.supplier_id:
+                from src.models.supplier import Supplier
+                supplier = Supplier.query.get(self.supplier_id)
+                supplier_name = supplier.name if supplier else None
+        
+        if line_items is None:
+            line_items = [item.to_dict() for item in self.line_items]
         
         return {
             'id': self.id,
@@ -105,7 +119,7 @@ class Invoice(db.Model):
             'is_paid': self.is_paid,
             'notes': self.notes,
             'terms_conditions': self.terms_conditions,
-            'line_items': [item.to_dict() for item in self.line_items],
+            'line_items': line_items,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -162,21 +176,39 @@ class InvoiceLineItem(db.Model):
     line_total = db.Column(db.Numeric(10, 2), nullable=False, default=0.00)
     tax_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0.00)
     
+    # Customer type and unit cost the line was added to the sales facts with,
+    # so it is taken out of the same fact row; NULL until first posted
+    fact_customer_type = db.Column(db.String(20), nullable=True)
+    fact_unit_cost = db.Column(db.Numeric(10, 2), nullable=True)
+    
+    # Per-product sales rollups (top products) read only this index
+    __table_args__ = (
+        db.Index('ix_invoice_line_items_product_invoice', 'product_id', 'invoice_id', 'quantity', 'line_total', 'tax_amount', 'fact_unit_cost'),
+    )
+    
     def __repr__(self):
         return f'<InvoiceLineItem {self.item_name}>'
     
     def calculate_amounts(self):
         """Calculate line total and tax amount"""
-        subtotal = self.quantity * self.unit_price
-        self.tax_amount = subtotal * (self.tax_rate / 100)
-        self.line_total = subtotal + self.tax_amount
+        self.line_total, self.tax_amount = InvoiceLineItem.compute_amounts(self.quantity, self.unit_price, self.tax_rate)
     
-    def to_dict(self):
-        # Get product data using query
+    @staticmethod
+    def compute_amounts(quantity, unit_price, tax_rate):
+        """Return (line_total, tax_amount) for the given Decimal values"""
+        subtotal = quantity * unit_price
+        tax_amount = subtotal * (tax_rate / 100)
+        return subtotal + tax_amount, tax_amount
+    
+    def to_dict(self, product=None):
+        """Serialize the line item; ``product`` (name, sku) skips the product lookup"""
         product_name = None
         product_sku = None
         
-        if self.product_id:
+        if product is not None:
+            product_name, product_sku = product
+        elif self.product_id:
+            # Get product data using query
             from src.models.product import Product
             product = Product.query.get(self.product_id)
             if product:
@@ -35,26 +35,36 @@ class Payment(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def to_dict(self):
-        # Get customer/supplier name using queries
+    # Receipts / payments per period (/api/analytics/series), read from the index alone
+    __table_args__ = (
+        db.Index('ix_payments_type_date', 'payment_type', 'payment_date', 'status', 'amount'),
+    )
+    
+    def to_dict(self, names=None):
+        """Serialize the payment; ``names`` (customer_name, supplier_name,
+        invoice_number) skips the per-payment lookups when given"""
         customer_name = None
         supplier_name = None
         invoice_number = None
         
-        if self.customer_id:
-            from src.models.customer import Customer
-            customer = Customer.query.get(self.customer_id)
-            customer_name = customer.name if customer else None
-            
-        if self.supplier_id:
-            from src.models.supplier import Supplier
-            supplier = Supplier.query.get(self.supplier_id)
-            supplier_name = supplier.name if supplier else None
-            
-        if self.invoice_id:
-            from src.models.invoice import Invoice
-            invoice = Invoice.query.get(self.invoice_id)
-            invoice_number = invoice.invoice_number if invoice else None
+        if names is not None:
+            customer_name, supplier_name, invoice_number = names
+        else:
+            # Get customer/supplier name using queries
+            if self.customer_id:
+                from src.models.customer import Customer
+                customer = Customer.query.get(self.customer_id)
+                customer_name = customer.name if customer else None
+                
+            if self.supplier_id:
+                from src.models.supplier import Supplier
+                supplier = Supplier.query.get(self.supplier_id)
+                supplier_name = supplier.name if supplier else None
+                
+            if self.invoice_id:
+                from src.models.invoice import Invoice
+                invoice = Invoice.query.get(self.invoice_id)
+                invoice_number = invoice.invoice_number if invoice else None
         
         return {
             'id': self.id,
@@ -100,6 +110,26 @@ class Payment(db.Model):
         return f"PAY-{timestamp}"
 
 
+class PaymentAllocation(db.Model):
+    """The part of a payment applied to one invoice"""
+    __tablename__ = 'payment_allocations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'), nullable=False, index=True)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False, index=True)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'payment_id': self.payment_id,
+            'invoice_id': self.invoice_id,
+            'amount': float(self.amount) if self.amount else 0.0,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
 class LedgerEntry(db.Model):
     __tablename__ = 'ledger_entries'
     
@@ -125,31 +155,36 @@ class LedgerEntry(db.Model):
     # Timestamps
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
-    def to_dict(self):
-        # Get related entity names using queries
+    def to_dict(self, names=None):
+        """Serialize the entry; ``names`` (customer_name, supplier_name,
+        invoice_number, payment_number) skips the per-entry lookups when given"""
         customer_name = None
         supplier_name = None
         invoice_number = None
         payment_number = None
         
-        if self.customer_id:
-            from src.models.customer import Customer
-            customer = Customer.query.get(self.customer_id)
-            customer_name = customer.name if customer else None
-            
-        if self.supplier_id:
-            from src.models.supplier import Supplier
-            supplier = Supplier.query.get(self.supplier_id)
-            supplier_name = supplier.name if supplier else None
-            
-        if self.invoice_id:
-            from src.models.invoice import Invoice
-            invoice = Invoice.query.get(self.invoice_id)
-            invoice_number = invoice.invoice_number if invoice else None
-            
-        if self.payment_id:
-            payment = Payment.query.get(self.payment_id)
-            payment_number = payment.payment_number if payment else None
+        if names is not None:
+            customer_name, supplier_name, invoice_number, payment_number = names
+        else:
+            # Get related entity names using queries
+            if self.customer_id:
+                from src.models.customer import Customer
+                customer = Customer.query.get(self.customer_id)
+                customer_name = customer.name if customer else None
+                
+            if self.supplier_id:
+                from src.models.supplier import Supplier
+                supplier = Supplier.query.get(self.supplier_id)
+                supplier_name = supplier.name if supplier else None
+                
+            if self.invoice_id:
+                from src.models.invoice import Invoice
+                invoice = Invoice.query.get(self.invoice_id)
+                invoice_number = invoice.invoice_number if invoice else None
+                
+            if self.payment_id:
+                payment = Payment.query.get(self.payment_id)
+                payment_number = payment.payment_number if payment else None
         
         return {
             'id': self.id,
@@ -168,4 +203,25 @@ class LedgerEntry(db.Model):
             'entry_type': self.entry_type,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+    
+    @staticmethod
+    def payment_entry_rows(payment_id, payment_number, payment_type, amount, payment_date, customer_id=None, supplier_id=None):
+        """Column values of the paired ledger entries recorded for a payment"""
+        if payment_type == 'received':
+            # Payment received from customer
+            # Debit: Cash/Bank, Credit: Customer Account
+            party = {'customer_id': customer_id}
+            descriptions = (f"Payment received from customer - {payment_number}", f"Payment received - {payment_number}")
+        elif payment_type == 'made':
+            # Payment made to supplier
+            # Debit: Supplier Account, Credit: Cash/Bank
+            party = {'supplier_id': supplier_id}
+            descriptions = (f"Payment made to supplier - {payment_number}", f"Payment made to supplier - {payment_number}")
+        else:
+            return []
+        common = {'entry_date': payment_date, 'payment_id': payment_id, 'entry_type': f"payment_{payment_type}", **party}
+        return [
+            {**common, 'description': descriptions[0], 'debit_amount': amount, 'credit_amount': 0},
+            {**common, 'description': descriptions[1], 'debit_amount': 0, 'credit_amount': amount},
+        ]
 
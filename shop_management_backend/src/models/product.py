@@ -23,9 +23,20 @@ class Product(db.Model):
     barcode = db.Column(db.String(100), nullable=True)
     tax_rate = db.Column(db.Numeric(5, 2), nullable=True, default=0.00)  # Tax percentage
     is_active = db.Column(db.Boolean, nullable=False, default=True)
+    
+    # Set by the classify-products batch job (src.services.product_classes)
+    abc_class = db.Column(db.String(1), nullable=True)  # A, B or C by share of revenue
+    last_sold_on = db.Column(db.Date, nullable=True)
+    is_slow_mover = db.Column(db.Boolean, nullable=False, default=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # /api/products filters on the classification
+    __table_args__ = (
+        db.Index('ix_products_abc_class', 'abc_class', 'is_slow_mover'),
+        db.Index('ix_products_slow_mover', 'is_slow_mover', 'last_sold_on'),
+    )
+    
     def __repr__(self):
         return f'<Product {self.name}>'
     
@@ -46,6 +57,9 @@ class Product(db.Model):
             'barcode': self.barcode,
             'tax_rate': float(self.tax_rate) if self.tax_rate else 0.00,
             'is_active': self.is_active,
+            'abc_class': self.abc_class,
+            'last_sold_on': self.last_sold_on.isoformat() if self.last_sold_on else None,
+            'is_slow_mover': bool(self.is_slow_mover),
             'is_low_stock': self.stock_quantity <= (self.min_stock_level or 0),
             'retail_stock_value': float(self.retail_price * self.stock_quantity) if self.retail_price else 0.00,
             'wholesale_stock_value': float(self.wholesale_price * self.stock_quantity) if self.wholesale_price else 0.00,
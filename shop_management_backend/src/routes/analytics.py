@@ -0,0 +1,567 @@
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import case, func, select
+from datetime import datetime, timedelta
+from src.models.user import db
+from src.models.analytics import DailySalesFact
+from src.models.invoice import Invoice, InvoiceLineItem
+from src.models.product import Product
+from src.models.inventory import CostLayer, CostLayerConsumption, ProductForecast
+from src.models.payment import Payment
+from src.services.analytics_cache import cached_result
+
+analytics_bp = Blueprint('analytics', __name__)
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Range used when the request does not give a start date
+DEFAULT_SPANS = {'day': timedelta(days=30), 'week': timedelta(weeks=26), 'month': timedelta(days=365)}
+
+RANKINGS = ('qty', 'revenue', 'margin')
+
+SERIES_METRICS = ('sales', 'purchases', 'receipts', 'payments')
+
+# Longest series /analytics/series returns; longer ranges need a coarser interval
+MAX_SERIES_POINTS = 1000
+
+@analytics_bp.route('/analytics/revenue', methods=['GET'])
+def get_revenue():
+    """Revenue, tax, cost and gross profit per day, week or month"""
+    try:
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+
+        try:
+            start, end = date_range(DEFAULT_SPANS[granularity])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        filters = fact_filters(start, end)
+
+        def compute():
+            period = period_expression(DailySalesFact.sale_date, granularity, db.session.get_bind().dialect.name)
+            query = (
+                select(period.label('period'), *measure_columns())
+                .where(*filters)
+                .group_by(period)
+                .order_by(period)
+            )
+            series = [measures_to_dict(row, period=row.period) for row in db.session.execute(query)]
+            totals = db.session.execute(select(*measure_columns()).where(*filters)).one()
+            return {
+                'granularity': granularity,
+                'from': start.isoformat(),
+                'to': end.isoformat(),
+                'invoice_type': request.args.get('invoice_type', 'sales'),
+                'series': series,
+                'totals': measures_to_dict(totals)
+            }
+
+        return jsonify(cached_result(('revenue', granularity, *fact_cache_key(start, end)), compute, current_app.config))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/analytics/summary', methods=['GET'])
+def get_summary():
+    """Totals for a date range, split by customer type"""
+    try:
+        try:
+            start, end = date_range(DEFAULT_SPANS['month'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        filters = fact_filters(start, end)
+
+        def compute():
+            by_customer_type = db.session.execute(
+                select(DailySalesFact.customer_type, *measure_columns())
+                .where(*filters)
+                .group_by(DailySalesFact.customer_type)
+                .order_by(DailySalesFact.customer_type)
+            ).all()
+            totals = db.session.execute(select(*measure_columns()).where(*filters)).one()
+            return {
+                'from': start.isoformat(),
+                'to': end.isoformat(),
+                'invoice_type': request.args.get('invoice_type', 'sales'),
+                'totals': measures_to_dict(totals),
+                'by_customer_type': [measures_to_dict(row, customer_type=row.customer_type or None) for row in by_customer_type]
+            }
+
+        return jsonify(cached_result(('summary', *fact_cache_key(start, end)), compute, current_app.config))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/analytics/top-products', methods=['GET'])
+def get_top_products():
+    """Best selling products by quantity, revenue or margin"""
+    try:
+        by = request.args.get('by', 'revenue')
+        if by not in RANKINGS:
+            return jsonify({'error': f"by must be one of: {', '.join(RANKINGS)}"}), 400
+        try:
+            start, end = date_range(DEFAULT_SPANS['day'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not request.args.get('limit', '10').isdigit():
+            return jsonify({'error': 'limit must be a positive integer'}), 400
+        limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+
+        def compute():
+            sales = product_sales(start, end)
+            product_rows = db.session.execute(
+                select(
+                    sales.c.product_id, Product.name, Product.sku, Product.category,
+                    sales.c.line_count, sales.c.quantity, sales.c.revenue, sales.c.cost
+                )
+                .outerjoin(Product, Product.id == sales.c.product_id)
+                .order_by(ranking_column(sales, by).desc(), sales.c.product_id)
+                .limit(limit)
+            )
+            return {
+                'from': start.isoformat(),
+                'to': end.isoformat(),
+                'by': by,
+                'products': [
+                    sales_to_dict(
+                        row, product_id=row.product_id, name=row.name, sku=row.sku,
+                        category=row.category or None, line_count=row.line_count
+                    )
+                    for row in product_rows
+                ]
+            }
+
+        return jsonify(cached_result(('top-products', start, end, by, limit), compute, current_app.config))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/analytics/categories', methods=['GET'])
+def get_category_performance():
+    """Sales, margin and revenue share per product category"""
+    try:
+        try:
+            start, end = date_range(DEFAULT_SPANS['day'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        def compute():
+            sales = product_sales(start, end)
+            category = func.coalesce(Product.category, '')
+            category_rows = db.session.execute(
+                select(
+                    category.label('category'),
+                    func.count(sales.c.product_id).label('product_count'),
+                    func.sum(sales.c.quantity).label('quantity'),
+                    func.sum(sales.c.revenue).label('revenue'),
+                    func.sum(sales.c.cost).label('cost'),
+                )
+                .outerjoin(Product, Product.id == sales.c.product_id)
+                .group_by(category)
+                .order_by(func.sum(sales.c.revenue).desc())
+            ).all()
+            total_revenue = sum(float(row.revenue) for row in category_rows)
+            categories = []
+            for row in category_rows:
+                category_sales = sales_to_dict(row, category=row.category or None, product_count=row.product_count)
+                category_sales['revenue_share_pct'] = round(category_sales['revenue'] / total_revenue * 100, 2) if total_revenue else 0.0
+                categories.append(category_sales)
+            return {'from': start.isoformat(), 'to': end.isoformat(), 'categories': categories}
+
+        return jsonify(cached_result(('categories', start, end), compute, current_app.config))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/analytics/cogs', methods=['GET'])
+def get_cogs():
+    """Cost of goods sold (FIFO) against revenue per day, week or month"""
+    try:
+        granularity = request.args.get('granularity', 'month')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+        try:
+            start, end = date_range(DEFAULT_SPANS[granularity])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        def compute():
+            dialect_name = db.session.get_bind().dialect.name
+            consumed = period_expression(CostLayerConsumption.consumed_on, granularity, dialect_name)
+            cogs_rows = db.session.execute(
+                select(
+                    consumed.label('period'),
+                    func.sum(CostLayerConsumption.cost).label('cogs'),
+                    func.sum(case((CostLayerConsumption.layer_id.is_(None), CostLayerConsumption.cost), else_=0)).label('unlayered_cost'),
+                )
+                .where(
+                    CostLayerConsumption.source == 'sale',
+                    CostLayerConsumption.consumed_on >= start,
+                    CostLayerConsumption.consumed_on <= end,
+                )
+                .group_by(consumed)
+            ).all()
+            sold = period_expression(DailySalesFact.sale_date, granularity, dialect_name)
+            revenue_rows = db.session.execute(
+                select(sold.label('period'), func.sum(DailySalesFact.revenue).label('revenue'))
+                .where(
+                    DailySalesFact.invoice_type == 'sales',
+                    DailySalesFact.sale_date >= start,
+                    DailySalesFact.sale_date <= end,
+                )
+                .group_by(sold)
+            ).all()
+
+            periods = {}
+            for row in revenue_rows:
+                periods.setdefault(row.period, [0.0, 0.0, 0.0])[0] = float(row.revenue or 0)
+            for row in cogs_rows:
+                period = periods.setdefault(row.period, [0.0, 0.0, 0.0])
+                period[1], period[2] = float(row.cogs or 0), float(row.unlayered_cost or 0)
+            series = [cogs_to_dict(*periods[period], period=period) for period in sorted(periods)]
+            totals = [sum(values[i] for values in periods.values()) for i in range(3)]
+            return {
+                'granularity': granularity,
+                'from': start.isoformat(),
+                'to': end.isoformat(),
+                'series': series,
+                'totals': cogs_to_dict(*totals)
+            }
+
+        return jsonify(cached_result(('cogs', granularity, start, end), compute, current_app.config))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/analytics/inventory-valuation', methods=['GET'])
+def get_inventory_valuation():
+    """Value of the stock on hand from the open FIFO cost layers"""
+    try:
+        category = request.args.get('category', '')
+        product_id = request.args.get('product_id', '')
+
+        def compute():
+            layers = (
+                select(
+                    CostLayer.product_id,
+                    func.sum(CostLayer.remaining_quantity).label('quantity'),
+                    func.sum(CostLayer.remaining_quantity * CostLayer.unit_cost).label('value'),
+                    func.min(CostLayer.received_on).label('oldest_layer'),
+                )
+                .where(CostLayer.remaining_quantity > 0)
+                .group_by(CostLayer.product_id)
+            )
+            if product_id:
+                layers = layers.where(CostLayer.product_id == int(product_id))
+            layers = layers.subquery()
+            query = (
+                select(layers, Product.name, Product.sku, Product.category, Product.stock_quantity)
+                .outerjoin(Product, Product.id == layers.c.product_id)
+                .order_by(layers.c.value.desc())
+            )
+            if category:
+                query = query.where(Product.category == category)
+
+            products = []
+            for row in db.session.execute(query):
+                quantity, value = float(row.quantity), round(float(row.value), 2)
+                products.append({
+                    'product_id': row.product_id,
+                    'name': row.name,
+                    'sku': row.sku,
+                    'category': row.category or None,
+                    'stock_quantity': row.stock_quantity,
+                    'quantity': quantity,
+                    'value': value,
+                    'average_unit_cost': round(value / quantity, 4) if quantity else 0.0,
+                    'oldest_layer': row.oldest_layer.isoformat() if hasattr(row.oldest_layer, 'isoformat') else row.oldest_layer
+                })
+            return {
+                'products': products,
+                'totals': {
+                    'product_count': len(products),
+                    'quantity': round(sum(product['quantity'] for product in products), 3),
+                    'value': round(sum(product['value'] for product in products), 2)
+                }
+            }
+
+        return jsonify(cached_result(('inventory-valuation', category, product_id), compute, current_app.config))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/analytics/reorder-suggestions', methods=['GET'])
+def get_reorder_suggestions():
+    """Products at or below the reorder point of their demand forecast, least cover first.
+
+    Forecasts are computed by ``flask forecast-demand``; the order quantity
+    tops the current stock up to the suggested maximum.
+    """
+    try:
+        category = request.args.get('category', '')
+        if not request.args.get('limit', '100').isdigit():
+            return jsonify({'error': 'limit must be a positive integer'}), 400
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+
+        def compute():
+            cover = Product.stock_quantity / ProductForecast.smoothed_demand
+            query = (
+                select(ProductForecast, Product.name, Product.sku, Product.category, Product.stock_quantity, cover.label('cover'))
+                .join(Product, Product.id == ProductForecast.product_id)
+                .where(
+                    Product.is_active.is_(True),
+                    ProductForecast.smoothed_demand > 0,
+                    Product.stock_quantity <= ProductForecast.reorder_point,
+                )
+                .order_by(cover, Product.id)
+                .limit(limit)
+            )
+            if category:
+                query = query.where(Product.category == category)
+
+            products = []
+            for row in db.session.execute(query):
+                forecast = row.ProductForecast.to_dict()
+                forecast.update({
+                    'name': row.name,
+                    'sku': row.sku,
+                    'category': row.category or None,
+                    'stock_quantity': row.stock_quantity,
+                    'days_of_cover': round(float(row.cover), 1),
+                    'order_quantity': max(forecast['suggested_max'] - row.stock_quantity, 0)
+                })
+                products.append(forecast)
+            return {
+                'computed_on': products[0]['computed_on'] if products else None,
+                'products': products
+            }
+
+        return jsonify(cached_result(('reorder-suggestions', category, limit), compute, current_app.config))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/analytics/series', methods=['GET'])
+def get_series():
+    """One metric per day, week or month for charts, with empty periods filled with zero.
+
+    sales / purchases: invoice value net of tax and line item count, from
+    the daily sales facts. receipts / payments: amount and number of
+    payments received from customers / made to suppliers.
+    """
+    try:
+        metric = request.args.get('metric', 'sales')
+        if metric not in SERIES_METRICS:
+            return jsonify({'error': f"metric must be one of: {', '.join(SERIES_METRICS)}"}), 400
+        interval = request.args.get('interval', 'day')
+        if interval not in GRANULARITIES:
+            return jsonify({'error': f"interval must be one of: {', '.join(GRANULARITIES)}"}), 400
+        try:
+            start, end = date_range(DEFAULT_SPANS[interval])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        periods = period_labels(start, end, interval)
+        if len(periods) > MAX_SERIES_POINTS:
+            return jsonify({'error': f"Range has more than {MAX_SERIES_POINTS} {interval}s; use a shorter range or a longer interval"}), 400
+
+        def compute():
+            buckets = {
+                row.period: row
+                for row in db.session.execute(series_query(metric, interval, start, end, db.session.get_bind().dialect.name))
+            }
+            series = []
+            for period in periods:
+                row = buckets.get(period)
+                series.append({
+                    'period': period,
+                    'value': round(float(row.value), 2) if row else 0.0,
+                    'count': int(row.count) if row else 0
+                })
+            return {
+                'metric': metric,
+                'interval': interval,
+                'from': start.isoformat(),
+                'to': end.isoformat(),
+                'series': series,
+                'totals': {
+                    'value': round(sum(point['value'] for point in series), 2),
+                    'count': sum(point['count'] for point in series)
+                }
+            }
+
+        return jsonify(cached_result(('series', metric, interval, start, end), compute, current_app.config))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Helper functions
+def date_range(default_span):
+    """The from/to query parameters as dates (inclusive); raises ValueError"""
+    try:
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else datetime.utcnow().date()
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else end - default_span
+    except ValueError:
+        raise ValueError('from and to must be dates in YYYY-MM-DD format')
+    if start > end:
+        raise ValueError('from must not be after to')
+    return start, end
+
+def fact_filters(start, end):
+    """WHERE conditions shared by the fact queries"""
+    conditions = [
+        DailySalesFact.invoice_type == request.args.get('invoice_type', 'sales'),
+        DailySalesFact.sale_date >= start,
+        DailySalesFact.sale_date <= end,
+    ]
+    if request.args.get('customer_type'):
+        conditions.append(DailySalesFact.customer_type == request.args['customer_type'])
+    if request.args.get('product_id'):
+        conditions.append(DailySalesFact.product_id == int(request.args['product_id']))
+    return conditions
+
+def fact_cache_key(start, end):
+    return (start, end, request.args.get('invoice_type', 'sales'), request.args.get('customer_type', ''), request.args.get('product_id', ''))
+
+def period_expression(column, granularity, dialect_name):
+    """Label of the day, week (its Monday) or month a date falls in"""
+    if dialect_name == 'sqlite':
+        if granularity == 'week':
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.strftime('%Y-%m-%d' if granularity == 'day' else '%Y-%m', column)
+    if granularity == 'week':
+        return func.to_char(func.date_trunc('week', column), 'YYYY-MM-DD')
+    return func.to_char(column, 'YYYY-MM-DD' if granularity == 'day' else 'YYYY-MM')
+
+def period_labels(start, end, granularity):
+    """Every period from start to end, labelled as period_expression labels them"""
+    if granularity == 'month':
+        labels, year, month = [], start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            labels.append(f"{year:04d}-{month:02d}")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return labels
+    step = timedelta(weeks=1) if granularity == 'week' else timedelta(days=1)
+    day = start - timedelta(days=start.weekday()) if granularity == 'week' else start
+    labels = []
+    while day <= end:
+        labels.append(day.isoformat())
+        day += step
+    return labels
+
+def series_query(metric, granularity, start, end, dialect_name):
+    """Value and count per period of a /analytics/series metric"""
+    if metric in ('sales', 'purchases'):
+        period = period_expression(DailySalesFact.sale_date, granularity, dialect_name)
+        columns = (func.sum(DailySalesFact.revenue).label('value'), func.sum(DailySalesFact.line_count).label('count'))
+        conditions = (
+            DailySalesFact.invoice_type == ('sales' if metric == 'sales' else 'purchase'),
+            DailySalesFact.sale_date >= start,
+            DailySalesFact.sale_date <= end,
+        )
+    else:
+        period = period_expression(Payment.payment_date, granularity, dialect_name)
+        columns = (func.sum(Payment.amount).label('value'), func.count().label('count'))
+        conditions = (
+            Payment.payment_type == ('received' if metric == 'receipts' else 'made'),
+            Payment.payment_date >= start,
+            Payment.payment_date <= end,
+            Payment.status != 'cancelled',
+        )
+    return select(period.label('period'), *columns).where(*conditions).group_by(period)
+
+def measure_columns():
+    return (
+        func.coalesce(func.sum(DailySalesFact.line_count), 0).label('line_count'),
+        func.coalesce(func.sum(DailySalesFact.quantity), 0).label('quantity'),
+        func.coalesce(func.sum(DailySalesFact.revenue), 0).label('revenue'),
+        func.coalesce(func.sum(DailySalesFact.tax), 0).label('tax'),
+        func.coalesce(func.sum(DailySalesFact.cost), 0).label('cost'),
+    )
+
+def measures_to_dict(row, **extra):
+    revenue = round(float(row.revenue), 2)
+    cost = round(float(row.cost), 2)
+    gross_profit = round(revenue - cost, 2)
+    return {
+        **extra,
+        'line_count': int(row.line_count),
+        'quantity': round(float(row.quantity), 3),
+        'revenue': revenue,
+        'tax': round(float(row.tax), 2),
+        'cost': cost,
+        'gross_profit': gross_profit,
+        'gross_margin_pct': round(gross_profit / revenue * 100, 2) if revenue else 0.0
+    }
+
+def product_sales(start, end):
+    """Subquery of quantity, revenue (net of tax) and cost per product sold in the range.
+
+    Each line is costed at coalesce(fact_unit_cost, Product.cost_price): the
+    unit cost it was posted to the sales facts with, so these figures agree
+    with the dashboard, or today's cost price for lines not posted yet.
+
+    One GROUP BY over the line items, read from their (product_id, invoice_id)
+    covering index. The non-cancelled sales invoices are matched with an IN
+    subquery, which SQLite probes in a temporary index instead of looking up
+    the invoice row of every line.
+    """
+    sales_invoices = select(Invoice.id).where(
+        Invoice.invoice_type == 'sales',
+        Invoice.status != 'cancelled',
+        Invoice.invoice_date >= start,
+        Invoice.invoice_date <= end,
+    )
+    line_sales = (
+        select(
+            InvoiceLineItem.product_id,
+            func.count().label('line_count'),
+            func.sum(InvoiceLineItem.quantity).label('quantity'),
+            func.sum(InvoiceLineItem.line_total - InvoiceLineItem.tax_amount).label('revenue'),
+            func.sum(InvoiceLineItem.quantity * InvoiceLineItem.fact_unit_cost).label('fact_cost'),
+            func.sum(case((InvoiceLineItem.fact_unit_cost.is_(None), InvoiceLineItem.quantity), else_=0)).label('unposted_quantity'),
+        )
+        .where(InvoiceLineItem.product_id.isnot(None), InvoiceLineItem.invoice_id.in_(sales_invoices))
+        .group_by(InvoiceLineItem.product_id)
+        .subquery()
+    )
+    # Lines without a fact_unit_cost fall back to the product's cost price
+    cost_price = (
+        select(func.coalesce(Product.cost_price, 0))
+        .where(Product.id == line_sales.c.product_id)
+        .scalar_subquery()
+    )
+    return select(
+        line_sales.c.product_id,
+        line_sales.c.line_count,
+        line_sales.c.quantity,
+        line_sales.c.revenue,
+        (func.coalesce(line_sales.c.fact_cost, 0)
+         + line_sales.c.unposted_quantity * func.coalesce(cost_price, 0)).label('cost'),
+    ).subquery()
+
+def ranking_column(sales, by):
+    if by == 'qty':
+        return sales.c.quantity
+    if by == 'margin':
+        return sales.c.revenue - sales.c.cost
+    return sales.c.revenue
+
+def sales_to_dict(row, **extra):
+    """Quantity, revenue, cost and margin of a product_sales row or group"""
+    revenue = round(float(row.revenue or 0), 2)
+    cost = round(float(row.cost or 0), 2)
+    margin = round(revenue - cost, 2)
+    return {
+        **extra,
+        'quantity': round(float(row.quantity or 0), 3),
+        'revenue': revenue,
+        'cost': cost,
+        'margin': margin,
+        'margin_pct': round(margin / revenue * 100, 2) if revenue else 0.0
+    }
+
+def cogs_to_dict(revenue, cogs, unlayered_cost, **extra):
+    gross_profit = round(revenue - cogs, 2)
+    return {
+        **extra,
+        'revenue': round(revenue, 2),
+        'cogs': round(cogs, 2),
+        'gross_profit': gross_profit,
+        'gross_margin_pct': round(gross_profit / revenue * 100, 2) if revenue else 0.0,
+        # Part of the COGS sold beyond the layered stock, valued at cost price
+        'unlayered_cost': round(unlayered_cost, 2)
+    }
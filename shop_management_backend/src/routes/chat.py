@@ -1,21 +1,30 @@
-from flask import Blueprint, request, jsonify
-import google.generativeai as genai
-import os
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 import json
 import re
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
 from src.models.customer import Customer
 from src.models.supplier import Supplier
 from src.models.product import Product
 from src.models.invoice import Invoice
 from src.models.payment import Payment
 from src.models.user import db
+from src.services.llm import get_llm_provider
+from src.services.chat_gateway import ChatRejected, get_chat_gateway, get_async_chat_gateway
+from src.services.chat_cache import get_chat_cache, cache_key
+from src.services.intent import classify as classify_intent
+from src.services.query_dsl import describe_query_dsl, run_query
+from src.services.entity_resolver import get_entity_resolver
+from src.routes.customer import build_customer
+from src.routes.supplier import build_supplier
+from src.routes.invoice import build_invoice
+from src.routes.payment import build_payments
 
 chat_bp = Blueprint('chat', __name__)
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-model = genai.GenerativeModel('gemini-1.5-flash')
+_query_executor = None
+_query_executor_lock = threading.Lock()
 
 # System prompt for the LLM
 SYSTEM_PROMPT = """
@@ -27,11 +36,21 @@ Available API endpoints and their parameters:
 2. GET /api/suppliers - Get all suppliers  
    - Parameters: search (string)
 3. GET /api/products - Get all products
-   - Parameters: search (string), min_price (float), max_price (float), category (string)
+   - Parameters: search (string), min_price (float), max_price (float), category (string), low_stock (bool)
 4. GET /api/invoices - Get all invoices
-   - Parameters: customer_id (int), status (string), search (string), start_date (YYYY-MM-DD), end_date (YYYY-MM-DD), limit (int)
+   - Parameters: customer_id (int), customer_name (string), supplier_name (string), invoice_type (sales/purchase), status (string), search (string), start_date (YYYY-MM-DD), end_date (YYYY-MM-DD), limit (int)
 5. GET /api/payments - Get all payments
-   - Parameters: customer_id (int), invoice_id (int), start_date (YYYY-MM-DD), end_date (YYYY-MM-DD)
+   - Parameters: customer_id (int), customer_name (string), supplier_name (string), invoice_id (int), start_date (YYYY-MM-DD), end_date (YYYY-MM-DD)
+
+Pass names exactly as the user wrote them (customer_name, supplier_name, search); they are matched to records even with typos or spelling variants.
+6. QUERY /api/query - Grouped and aggregated questions (top sellers, totals per customer, monthly revenue)
+   - Send {"method": "QUERY", "endpoint": "/api/query", "query": {...}} where query has:
+     entity, filters [{"field", "op", "value"}], group_by [fields], metrics [{"fn", "field", "as"}], order [{"field", "dir"}], limit
+   - ops: =, !=, >, >=, <, <=, in, contains, between. fns: count, count_distinct, sum, avg, min, max
+   - Entities and their fields:
+""" + describe_query_dsl() + """
+
+All list endpoints also accept order_by (a column name such as total_amount, invoice_date, amount, stock_quantity), order ("asc" or "desc") and limit (int, at most 10). Results include a total count, so never fetch everything just to count or find a maximum.
 
 Response format: Always respond with a JSON object containing:
 {
@@ -52,12 +71,18 @@ Response format: Always respond with a JSON object containing:
 For queries about balances, stock, or information - set requires_confirmation to false.
 For creating, updating, or deleting data - set requires_confirmation to true.
 
+Write operations use POST with a "body" on /api/customers, /api/suppliers, /api/invoices (invoice_type, customer_id or supplier_id, line_items [{product_id, quantity, unit_price}]) or /api/payments (amount, payment_type "received" or "made", customer_id or supplier_id, invoice_id, payment_method).
+They run together as one transaction. To use a record created by an earlier api_call in the same list, write "$<index>.id" (0-based), e.g. {"customer_id": "$0.id"}.
+
 Handle these types of queries:
 - "Show me unpaid invoices" -> GET /api/invoices with status="unpaid"
-- "Which customer has the most expensive invoice" -> GET /api/invoices (then analyze results)
-- "Which customer has the highest unpaid bill" -> GET /api/invoices with status="unpaid" (then analyze results)
+- "Which customer has the most expensive invoice" -> GET /api/invoices with order_by="total_amount", order="desc", limit=1
+- "Which customer has the highest unpaid bill" -> GET /api/invoices with status="unpaid", order_by="total_amount", order="desc", limit=1
 - "List all customers" -> GET /api/customers
 - "Check stock for Cotton Kurta" -> GET /api/products with search="Cotton Kurta"
+- "Which items are low in stock?" -> GET /api/products with low_stock=true
+- "Show me my top 5 selling items this month" -> QUERY /api/query with query={"entity": "line_items", "filters": [{"field": "invoice_type", "op": "=", "value": "sales"}, {"field": "invoice_date", "op": ">=", "value": "this month"}], "group_by": ["product_name"], "metrics": [{"fn": "sum", "field": "quantity", "as": "units_sold"}, {"fn": "sum", "field": "line_total", "as": "sales_value"}], "order": [{"field": "units_sold", "dir": "desc"}], "limit": 5}
+- "Total sales per month" -> QUERY /api/query with query={"entity": "invoices", "filters": [{"field": "invoice_type", "op": "=", "value": "sales"}], "group_by": ["invoice_month"], "metrics": [{"fn": "sum", "field": "total_amount", "as": "sales"}], "order": [{"field": "invoice_month", "dir": "asc"}], "limit": 12}
 
 Parse dates naturally (e.g., "last week", "yesterday", "October 15th").
 Extract entities like customer names, amounts, product names, etc.
@@ -65,79 +90,122 @@ Extract entities like customer names, amounts, product names, etc.
 IMPORTANT: Always return valid JSON. Do not include any text before or after the JSON object.
 """
 
-def parse_date_expression(date_str):
-    """Parse natural language date expressions into actual dates"""
-    today = datetime.now().date()
-    date_str = date_str.lower().strip()
-    
-    if date_str in ['today']:
-        return today.strftime('%Y-%m-%d')
-    elif date_str in ['yesterday']:
-        return (today - timedelta(days=1)).strftime('%Y-%m-%d')
-    elif date_str in ['last week']:
-        start_date = today - timedelta(days=7)
-        return start_date.strftime('%Y-%m-%d')
-    elif date_str in ['this month']:
-        start_date = today.replace(day=1)
-        return start_date.strftime('%Y-%m-%d')
-    elif date_str in ['last month']:
-        if today.month == 1:
-            start_date = today.replace(year=today.year-1, month=12, day=1)
-        else:
-            start_date = today.replace(month=today.month-1, day=1)
-        return start_date.strftime('%Y-%m-%d')
+# Most rows a chat answer ever lists; counts and sums cover the rest
+CHAT_RESULT_LIMIT = 10
+
+def run_list_query(key, query, params, sortable, default_sort, default_order='desc', sums=None):
+    """Run a chat list query with ordering, limit and aggregates pushed into SQL.
     
-    # Try to parse specific date formats
-    try:
-        # Try YYYY-MM-DD format
-        parsed_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        return parsed_date.strftime('%Y-%m-%d')
-    except ValueError:
-        pass
+    COUNT/SUM for the "Found N" header are computed by the database and only
+    the rows that will actually be displayed are loaded and serialized.
+    """
+    sums = sums or {}
+    summary = query.order_by(None).with_entities(
+        db.func.count(),
+        *[db.func.coalesce(db.func.sum(column), 0) for column in sums.values()]
+    ).one()
     
-    return None
+    if params.get('order_by') in sortable:
+        sort_column = sortable[params['order_by']]
+        order = params.get('order', 'desc')
+    else:
+        sort_column = sortable[default_sort]
+        order = params.get('order', default_order)
+    descending = str(order).lower() != 'asc'
+    query = query.order_by(sort_column.desc() if descending else sort_column.asc())
+    
+    limit = current_app.config.get('CHAT_RESULT_LIMIT', CHAT_RESULT_LIMIT)
+    if params.get('limit') not in (None, ''):
+        try:
+            requested = int(params['limit'])
+        except (TypeError, ValueError):
+            raise ValueError('limit must be a positive integer')
+        # LIMIT -1 means no limit in SQLite
+        limit = max(1, min(requested, limit))
+    
+    result = {key: [row.to_dict() for row in query.limit(limit).all()], 'total': summary[0]}
+    for name, value in zip(sums, summary[1:]):
+        result[name] = float(value)
+    return result
+
+def resolve_name_ids(kind, name):
+    """Ids of the customers, suppliers or products matching a name from the chat"""
+    min_score = current_app.config.get('ENTITY_MATCH_MIN_SCORE', 0.6)
+    return get_entity_resolver().matching_ids(kind, name, min_score=min_score)
+
+def filter_by_name(query, kind, column, name, name_column=None):
+    """Filter query to the ids a name resolves to.
+    
+    Falls back to a LIKE match on ``name_column`` when the resolver finds
+    nothing, or returns no rows when there is no name column to fall back on.
+    """
+    ids = resolve_name_ids(kind, name)
+    if ids:
+        return query.filter(column.in_(ids))
+    if name_column is not None:
+        return query.filter(name_column.ilike(f"%{name}%"))
+    return query.filter(db.false())
 
 def execute_api_call(api_call):
     """Execute an API call and return the result"""
-    method = api_call.get('method', 'GET')
     endpoint = api_call.get('endpoint', '')
     params = api_call.get('params', {})
     
     try:
-        if endpoint == '/api/customers':
+        if endpoint == '/api/query':
+            result = run_query(api_call.get('query') or params)
+            result['total'] = len(result['rows'])
+            return result
+            
+        elif endpoint == '/api/customers':
             query = Customer.query
             if params.get('search'):
-                search_term = f"%{params['search']}%"
-                query = query.filter(Customer.name.ilike(search_term))
-            customers = query.all()
-            return {'customers': [customer.to_dict() for customer in customers]}
+                query = filter_by_name(query, 'customer', Customer.id, params['search'], Customer.name)
+            return run_list_query('customers', query, params, {
+                'name': Customer.name,
+                'outstanding_balance': Customer.outstanding_balance,
+                'created_at': Customer.created_at
+            }, 'name', default_order='asc', sums={'total_outstanding': Customer.outstanding_balance})
             
         elif endpoint == '/api/suppliers':
             query = Supplier.query
             if params.get('search'):
-                search_term = f"%{params['search']}%"
-                query = query.filter(Supplier.name.ilike(search_term))
-            suppliers = query.all()
-            return {'suppliers': [supplier.to_dict() for supplier in suppliers]}
+                query = filter_by_name(query, 'supplier', Supplier.id, params['search'], Supplier.name)
+            return run_list_query('suppliers', query, params, {
+                'name': Supplier.name,
+                'outstanding_balance': Supplier.outstanding_balance,
+                'created_at': Supplier.created_at
+            }, 'name', default_order='asc', sums={'total_outstanding': Supplier.outstanding_balance})
             
         elif endpoint == '/api/products':
             query = Product.query
             if params.get('search'):
-                search_term = f"%{params['search']}%"
-                query = query.filter(Product.name.ilike(search_term))
+                query = filter_by_name(query, 'product', Product.id, params['search'], Product.name)
             if params.get('min_price'):
                 query = query.filter(Product.retail_price >= float(params['min_price']))
             if params.get('max_price'):
                 query = query.filter(Product.retail_price <= float(params['max_price']))
             if params.get('category'):
                 query = query.filter(Product.category.ilike(f"%{params['category']}%"))
-            products = query.all()
-            return {'products': [product.to_dict() for product in products]}
+            if params.get('low_stock'):
+                query = query.filter(Product.stock_quantity <= db.func.coalesce(Product.min_stock_level, 0))
+            return run_list_query('products', query, params, {
+                'name': Product.name,
+                'stock_quantity': Product.stock_quantity,
+                'retail_price': Product.retail_price,
+                'wholesale_price': Product.wholesale_price
+            }, 'name', default_order='asc', sums={'total_stock': Product.stock_quantity})
             
         elif endpoint == '/api/invoices':
             query = Invoice.query
             if params.get('customer_id'):
                 query = query.filter(Invoice.customer_id == int(params['customer_id']))
+            elif params.get('customer_name'):
+                query = filter_by_name(query, 'customer', Invoice.customer_id, params['customer_name'])
+            if params.get('supplier_name'):
+                query = filter_by_name(query, 'supplier', Invoice.supplier_id, params['supplier_name'])
+            if params.get('invoice_type') in ('sales', 'purchase'):
+                query = query.filter(Invoice.invoice_type == params['invoice_type'])
             if params.get('status'):
                 if params['status'] == 'unpaid':
                     query = query.filter(Invoice.paid_amount == 0)
@@ -152,34 +220,140 @@ def execute_api_call(api_call):
             if params.get('search'):
                 search_term = f"%{params['search']}%"
                 query = query.filter(Invoice.invoice_number.ilike(search_term))
-            
-            query = query.order_by(Invoice.invoice_date.desc())
-            if params.get('limit'):
-                query = query.limit(int(params['limit']))
-                
-            invoices = query.all()
-            return {'invoices': [invoice.to_dict() for invoice in invoices]}
+            return run_list_query('invoices', query, params, {
+                'invoice_date': Invoice.invoice_date,
+                'total_amount': Invoice.total_amount,
+                'paid_amount': Invoice.paid_amount,
+                'outstanding_amount': Invoice.total_amount - Invoice.paid_amount
+            }, 'invoice_date', sums={
+                'total_amount': Invoice.total_amount,
+                'total_outstanding': Invoice.total_amount - Invoice.paid_amount
+            })
             
         elif endpoint == '/api/payments':
             query = Payment.query
             if params.get('customer_id'):
                 query = query.filter(Payment.customer_id == int(params['customer_id']))
+            elif params.get('customer_name'):
+                query = filter_by_name(query, 'customer', Payment.customer_id, params['customer_name'])
+            if params.get('supplier_name'):
+                query = filter_by_name(query, 'supplier', Payment.supplier_id, params['supplier_name'])
             if params.get('invoice_id'):
                 query = query.filter(Payment.invoice_id == int(params['invoice_id']))
             if params.get('start_date'):
                 query = query.filter(Payment.payment_date >= params['start_date'])
             if params.get('end_date'):
                 query = query.filter(Payment.payment_date <= params['end_date'])
-                
-            payments = query.all()
-            return {'payments': [payment.to_dict() for payment in payments]}
+            return run_list_query('payments', query, params, {
+                'payment_date': Payment.payment_date,
+                'amount': Payment.amount
+            }, 'payment_date', sums={'total_amount': Payment.amount})
             
         else:
             return {'error': f'Unknown endpoint: {endpoint}'}
             
+    except ValueError as e:
+        # Bad parameter values from the plan
+        return {'error': str(e), 'status': 400}
     except Exception as e:
         return {'error': str(e)}
 
+def get_query_executor():
+    """Thread pool shared by all chat requests for running api_calls"""
+    global _query_executor
+    if _query_executor is None:
+        with _query_executor_lock:
+            if _query_executor is None:
+                _query_executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('CHAT_QUERY_WORKERS', 4),
+                    thread_name_prefix='chat-query'
+                )
+    return _query_executor
+
+def iter_api_calls(api_calls):
+    """Execute independent api_calls concurrently, yielding as each finishes.
+    
+    Every call runs in its own application context, so it gets its own
+    scoped database session. Yields (index, result, duration_ms) in
+    completion order.
+    """
+    if len(api_calls) == 1:
+        # Nothing to overlap; skip the thread hop
+        started = time.perf_counter()
+        result = execute_api_call(api_calls[0])
+        yield 0, result, (time.perf_counter() - started) * 1000
+        return
+    
+    app = current_app._get_current_object()
+    
+    def run(api_call):
+        started = time.perf_counter()
+        with app.app_context():
+            result = execute_api_call(api_call)
+        return result, (time.perf_counter() - started) * 1000
+    
+    timeout = app.config.get('CHAT_QUERY_TIMEOUT_SECONDS', 10)
+    futures = {get_query_executor().submit(run, api_call): index for index, api_call in enumerate(api_calls)}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            result, duration = future.result()
+            yield futures[future], result, duration
+    except FutureTimeoutError:
+        for future in pending:
+            future.cancel()
+            yield futures[future], {'error': 'Query timed out'}, timeout * 1000
+
+def execute_api_calls(api_calls):
+    """Execute api_calls concurrently and time each one.
+    
+    Returns (results, timings) with results in the same order as api_calls.
+    """
+    started = time.perf_counter()
+    results = [None] * len(api_calls)
+    durations = [None] * len(api_calls)
+    for index, result, duration in iter_api_calls(api_calls):
+        results[index] = result
+        durations[index] = duration
+    
+    timings = {
+        'queries_ms': round((time.perf_counter() - started) * 1000, 2),
+        'api_calls': [
+            {'endpoint': api_call.get('endpoint'), 'duration_ms': round(duration, 2)}
+            for api_call, duration in zip(api_calls, durations)
+        ]
+    }
+    return results, timings
+
+def analysis_type(llm_response, user_message):
+    """Which invoice analysis, if any, a plan asks for"""
+    user_message_lower = user_message.lower()
+    action = llm_response.get('action')
+    if action == 'find_most_expensive_invoice' or "most expensive invoice" in user_message_lower:
+        return "most_expensive"
+    if action == 'find_highest_unpaid_invoice' or "highest unpaid" in user_message_lower:
+        return "highest_unpaid"
+    return None
+
+def push_down_analysis(api_calls, query_type):
+    """Rewrite invoice api_calls so the database returns only the top row.
+    
+    Returns new api_call dicts; cached plans are never modified.
+    """
+    if query_type is None:
+        return api_calls
+    rewritten = []
+    for api_call in api_calls:
+        if api_call.get('endpoint') == '/api/invoices':
+            params = dict(api_call.get('params') or {})
+            params.update({'order_by': 'total_amount', 'order': 'desc', 'limit': 1})
+            if query_type == "highest_unpaid":
+                params['status'] = 'unpaid'
+            api_call = {**api_call, 'params': params}
+        rewritten.append(api_call)
+    return rewritten
+
 def analyze_invoices_for_query(invoices, query_type):
     """Analyze invoices to answer specific queries"""
     if not invoices:
@@ -200,6 +374,72 @@ def analyze_invoices_for_query(invoices, query_type):
     
     return "Analysis completed."
 
+def build_prompt(user_message):
+    """Create the full prompt for Gemini"""
+    return f"{SYSTEM_PROMPT}\n\nUser message: {user_message}\n\nPlease analyze this message and provide the structured JSON response:"
+
+def find_ready_plan(user_message):
+    """Look for a plan that does not need an LLM round trip.
+    
+    Returns (plan, source) where source is 'local' for the rule-based
+    classifier, 'cache' for a previously parsed LLM plan, or (None, None).
+    """
+    # Common read queries are resolved by local rules without the LLM
+    if current_app.config.get('LOCAL_INTENT_ENABLED', True):
+        local_plan = classify_intent(user_message)
+        if local_plan and local_plan['confidence'] >= current_app.config.get('LOCAL_INTENT_MIN_CONFIDENCE', 0.8):
+            return local_plan, 'local'
+    
+    # Reuse the parsed plan for messages we have already sent to the LLM.
+    # Only the LLM hop is skipped; the queries always run fresh.
+    cache = get_chat_cache(current_app.config)
+    if cache is not None:
+        cached_plan = cache.get(cache_key(user_message))
+        if cached_plan is not None:
+            return cached_plan, 'cache'
+    
+    return None, None
+
+def remember_plan(user_message, llm_response):
+    """Cache a freshly parsed LLM plan"""
+    # Write plans are never cached so each one is re-read by the LLM
+    cache = get_chat_cache(current_app.config)
+    if cache is not None and llm_response.get('intent') == 'query':
+        cache.set(cache_key(user_message), llm_response)
+
+def plan_api_calls(llm_response, user_message):
+    """The api_calls to execute for a plan, with analysis pushed into SQL"""
+    return push_down_analysis(llm_response['api_calls'], analysis_type(llm_response, user_message))
+
+def build_query_response(llm_response, user_message, results):
+    """Turn query results into the text shown to the user"""
+    # Check if this is a special analysis query
+    query_type = analysis_type(llm_response, user_message)
+    if query_type and 'invoices' in results[0]:
+        return analyze_invoices_for_query(results[0]['invoices'], query_type)
+    # Format the response based on the results, one section per api_call
+    return "\n\n".join(format_query_response(llm_response, [result]) for result in results)
+
+def timed_jsonify(payload, phases):
+    """jsonify payload and report phase durations in a Server-Timing header.
+    
+    ``phases`` maps phase names (llm, db, ...) to milliseconds; the time
+    spent serializing is measured here and reported as ``serialize``.
+    """
+    started = time.perf_counter()
+    response = jsonify(payload)
+    phases = {**phases, 'serialize': phases.get('serialize', 0.0) + (time.perf_counter() - started) * 1000.0}
+    response.headers['Server-Timing'] = ", ".join(f"{name};dur={duration:.2f}" for name, duration in phases.items())
+    return response
+
+def rejection_response(rejection):
+    """HTTP response for a chat request the gateway turned away"""
+    response = jsonify({'error': rejection.message})
+    response.status_code = rejection.status_code
+    if rejection.retry_after:
+        response.headers['Retry-After'] = str(rejection.retry_after)
+    return response
+
 @chat_bp.route('/chat', methods=['POST'])
 def chat():
     """Main chat endpoint for processing user messages"""
@@ -210,71 +450,224 @@ def chat():
         
         user_message = data['message']
         
-        # Create the full prompt for Gemini
-        full_prompt = f"{SYSTEM_PROMPT}\n\nUser message: {user_message}\n\nPlease analyze this message and provide the structured JSON response:"
+        llm_response, plan_source = find_ready_plan(user_message)
+        llm_ms = queue_ms = 0.0
         
-        # Call Gemini API
-        response = model.generate_content(full_prompt)
-        
-        # Parse the response with improved error handling
-        try:
-            response_text = response.text.strip()
-            
-            # Try to extract JSON from the response
-            json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                # Try to find JSON object in the response
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                else:
-                    json_str = response_text
+        if llm_response is None:
+            plan_source = 'llm'
             
-            llm_response = json.loads(json_str)
+            # Call the LLM (the client is created on the first chat request),
+            # waiting for a free slot so LLM calls cannot starve other routes
+            llm = get_llm_provider(current_app.config)
+            gateway = get_chat_gateway(current_app.config)
+            admission = gateway.admit()
+            queue_ms = admission.waited_ms
+            llm_started = time.perf_counter()
+            response_text = gateway.generate(admission, llm, build_prompt(user_message), app=current_app._get_current_object())
+            llm_ms = round((time.perf_counter() - llm_started) * 1000.0, 2)
             
-        except (json.JSONDecodeError, AttributeError) as e:
-            # If JSON parsing fails, create a fallback response
-            return create_fallback_response(user_message)
+            llm_response = plan_from_llm_text(user_message, response_text)
+            if llm_response is None:
+                # If JSON parsing fails, create a fallback response
+                return create_fallback_response(user_message)
         
-        # Execute API calls if this is a query
-        if llm_response.get('intent') == 'query' and llm_response.get('api_calls'):
-            results = []
-            for api_call in llm_response['api_calls']:
-                result = execute_api_call(api_call)
-                results.append(result)
-            
-            # Check if this is a special analysis query
-            user_message_lower = user_message.lower()
-            if "most expensive invoice" in user_message_lower and 'invoices' in results[0]:
-                formatted_response = analyze_invoices_for_query(results[0]['invoices'], "most_expensive")
-            elif "highest unpaid" in user_message_lower and 'invoices' in results[0]:
-                formatted_response = analyze_invoices_for_query(results[0]['invoices'], "highest_unpaid")
-            else:
-                # Format the response based on the results
-                formatted_response = format_query_response(llm_response, results)
-            
-            return jsonify({
-                'intent': llm_response.get('intent'),
-                'action': llm_response.get('action'),
-                'response': formatted_response,
-                'requires_confirmation': llm_response.get('requires_confirmation', False),
-                'data': results
-            })
+        return answer_chat(user_message, llm_response, plan_source, queue_ms, llm_ms)
+        
+    except ChatRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def plan_from_llm_text(user_message, response_text):
+    """Parse and cache the plan in an LLM reply; None when it is not valid JSON"""
+    try:
+        llm_response = parse_llm_response(response_text)
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    remember_plan(user_message, llm_response)
+    return llm_response
+
+def answer_chat(user_message, llm_response, plan_source, queue_ms=0.0, llm_ms=0.0):
+    """Run a query plan, or hand a write plan back for confirmation.
+    
+    Shared by /chat and the async ASGI chat handler.
+    """
+    # Execute API calls if this is a query
+    if llm_response.get('intent') == 'query' and llm_response.get('api_calls'):
+        results, timings = execute_api_calls(plan_api_calls(llm_response, user_message))
+        
+        format_started = time.perf_counter()
+        response_text = build_query_response(llm_response, user_message, results)
+        format_ms = (time.perf_counter() - format_started) * 1000.0
         
-        # For write operations, return the structured response for confirmation
-        return jsonify({
+        return timed_jsonify({
             'intent': llm_response.get('intent'),
             'action': llm_response.get('action'),
-            'response': llm_response.get('response_message'),
-            'requires_confirmation': llm_response.get('requires_confirmation', True),
-            'entities': llm_response.get('entities', {}),
-            'api_calls': llm_response.get('api_calls', [])
-        })
-        
+            'response': response_text,
+            'requires_confirmation': llm_response.get('requires_confirmation', False),
+            'data': results,
+            'meta': {'plan_source': plan_source, 'queue_ms': queue_ms, 'llm_ms': llm_ms, **timings}
+        }, {'queue': queue_ms, 'llm': llm_ms, 'db': timings['queries_ms'], 'serialize': format_ms})
+    
+    # For write operations, return the structured response for confirmation
+    return timed_jsonify({
+        'intent': llm_response.get('intent'),
+        'action': llm_response.get('action'),
+        'response': llm_response.get('response_message'),
+        'requires_confirmation': llm_response.get('requires_confirmation', True),
+        'entities': llm_response.get('entities', {}),
+        'api_calls': llm_response.get('api_calls', []),
+        'meta': {'plan_source': plan_source, 'queue_ms': queue_ms, 'llm_ms': llm_ms}
+    }, {'queue': queue_ms, 'llm': llm_ms, 'db': 0.0})
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+def sse_event(event, data):
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def plan_events(user_message, llm_response, plan_source, started):
+    """SSE events once the plan is known: ``plan``, one ``result`` per
+    api_call, ``response`` and ``done``.
+    
+    ``llm_response`` None (an LLM reply without a valid plan) streams the
+    fallback answer instead. Shared by /chat/stream and the async ASGI
+    stream handler.
+    """
+    if llm_response is None:
+        fallback = create_fallback_response(user_message)
+        if isinstance(fallback, tuple):
+            fallback = fallback[0]
+        payload = fallback.get_json()
+        if 'error' in payload:
+            yield sse_event('error', payload)
+        else:
+            yield sse_event('plan', {key: payload.get(key) for key in ('intent', 'action', 'requires_confirmation')} | {'plan_source': 'fallback'})
+            yield sse_event('response', payload)
+        yield sse_event('done', {'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)})
+        return
+    
+    is_query = llm_response.get('intent') == 'query' and bool(llm_response.get('api_calls'))
+    yield sse_event('plan', {
+        'intent': llm_response.get('intent'),
+        'action': llm_response.get('action'),
+        'requires_confirmation': llm_response.get('requires_confirmation', not is_query),
+        'entities': llm_response.get('entities', {}),
+        'api_calls': llm_response.get('api_calls', []),
+        'response_message': llm_response.get('response_message'),
+        'plan_source': plan_source
+    })
+    
+    if is_query:
+        api_calls = plan_api_calls(llm_response, user_message)
+        results = [None] * len(api_calls)
+        for index, result, duration in iter_api_calls(api_calls):
+            results[index] = result
+            yield sse_event('result', {
+                'index': index,
+                'endpoint': api_calls[index].get('endpoint'),
+                'duration_ms': round(duration, 2),
+                'data': result
+            })
+        response_text = build_query_response(llm_response, user_message, results)
+    else:
+        response_text = llm_response.get('response_message')
+    
+    yield sse_event('response', {'response': response_text})
+    yield sse_event('done', {'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)})
+
+@chat_bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming variant of /chat using Server-Sent Events.
+    
+    Events, in order: ``ack`` as soon as the request is accepted, ``token``
+    chunks while the LLM is generating (skipped when a local or cached plan
+    is used), ``plan`` with the parsed intent, one ``result`` per api_call as
+    it completes, then ``response`` with the formatted answer and ``done``.
+    Failures are reported as an ``error`` event.
+    """
+    data = request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    user_message = data['message']
+    started = time.perf_counter()
+    
+    # Admission happens before the stream starts so saturation is reported
+    # with a real 429/503 status instead of an error event
+    try:
+        llm_response, plan_source = find_ready_plan(user_message)
+        admission = None
+        if llm_response is None:
+            admission = get_chat_gateway(current_app.config).admit()
+    except ChatRejected as e:
+        return rejection_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        nonlocal llm_response, plan_source
+        yield sse_event('ack', {'message': user_message})
+        try:
+            if llm_response is None:
+                plan_source = 'llm'
+                llm = get_llm_provider(current_app.config)
+                gateway = get_chat_gateway(current_app.config)
+                chunks = []
+                for chunk in gateway.stream(admission, llm, build_prompt(user_message), app=current_app._get_current_object()):
+                    chunks.append(chunk)
+                    yield sse_event('token', {'text': chunk})
+                llm_response = plan_from_llm_text(user_message, ''.join(chunks))
+            
+            yield from plan_events(user_message, llm_response, plan_source, started)
+        except ChatRejected as e:
+            yield sse_event('error', {'error': e.message, 'status': e.status_code})
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+    if admission is not None:
+        # Frees the slot even if the client disconnects before streaming starts
+        response.call_on_close(admission.release)
+    return response
+
+def parse_llm_response(response_text):
+    """Extract the JSON plan from raw LLM output"""
+    response_text = response_text.strip()
+    
+    # Try to extract JSON from the response
+    json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
+    if json_match:
+        json_str = json_match.group(1)
+    else:
+        # Try to find JSON object in the response
+        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if json_match:
+            json_str = json_match.group(0)
+        else:
+            json_str = response_text
+    
+    return json.loads(json_str)
+
+@chat_bp.route('/chat/metrics', methods=['GET'])
+def chat_metrics():
+    """Admission control metrics: active LLM calls, queue depth and wait times"""
+    stats = get_chat_gateway(current_app.config).stats()
+    async_gateway = get_async_chat_gateway(create=False)
+    if async_gateway is not None:
+        stats['async'] = async_gateway.stats()
+    return jsonify(stats)
+
+@chat_bp.route('/chat/cache/stats', methods=['GET'])
+def chat_cache_stats():
+    """Hit-rate counters for the LLM response cache"""
+    cache = get_chat_cache(current_app.config)
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cache.stats()})
 
 def create_fallback_response(user_message):
     """Create a fallback response when LLM parsing fails"""
@@ -284,21 +677,23 @@ def create_fallback_response(user_message):
     if "unpaid" in user_message_lower and "invoice" in user_message_lower:
         # Query unpaid invoices
         try:
-            query = Invoice.query.filter(Invoice.paid_amount == 0).order_by(Invoice.invoice_date.desc())
-            invoices = query.all()
-            invoice_data = [invoice.to_dict() for invoice in invoices]
-            
             if "highest" in user_message_lower or "most" in user_message_lower:
-                response_text = analyze_invoices_for_query(invoice_data, "highest_unpaid")
+                result = execute_api_call({'endpoint': '/api/invoices', 'params': {'status': 'unpaid', 'order_by': 'total_amount', 'order': 'desc', 'limit': 1}})
+                if 'error' in result:
+                    raise Exception(result['error'])
+                response_text = analyze_invoices_for_query(result['invoices'], "highest_unpaid")
             else:
-                response_text = format_query_response({'action': 'list_unpaid_invoices'}, [{'invoices': invoice_data}])
+                result = execute_api_call({'endpoint': '/api/invoices', 'params': {'status': 'unpaid'}})
+                if 'error' in result:
+                    raise Exception(result['error'])
+                response_text = format_query_response({'action': 'list_unpaid_invoices'}, [result])
             
             return jsonify({
                 'intent': 'query',
                 'action': 'list_unpaid_invoices',
                 'response': response_text,
                 'requires_confirmation': False,
-                'data': [{'invoices': invoice_data}]
+                'data': [result]
             })
         except Exception as e:
             return jsonify({'error': f'Database query failed: {str(e)}'}), 500
@@ -306,18 +701,18 @@ def create_fallback_response(user_message):
     elif "most expensive" in user_message_lower and "invoice" in user_message_lower:
         # Query all invoices to find most expensive
         try:
-            query = Invoice.query.order_by(Invoice.total_amount.desc())
-            invoices = query.all()
-            invoice_data = [invoice.to_dict() for invoice in invoices]
+            result = execute_api_call({'endpoint': '/api/invoices', 'params': {'order_by': 'total_amount', 'order': 'desc', 'limit': 1}})
+            if 'error' in result:
+                raise Exception(result['error'])
             
-            response_text = analyze_invoices_for_query(invoice_data, "most_expensive")
+            response_text = analyze_invoices_for_query(result['invoices'], "most_expensive")
             
             return jsonify({
                 'intent': 'query',
                 'action': 'find_most_expensive_invoice',
                 'response': response_text,
                 'requires_confirmation': False,
-                'data': [{'invoices': invoice_data}]
+                'data': [result]
             })
         except Exception as e:
             return jsonify({'error': f'Database query failed: {str(e)}'}), 500
@@ -325,16 +720,17 @@ def create_fallback_response(user_message):
     elif "customer" in user_message_lower:
         # Query customers
         try:
-            customers = Customer.query.all()
-            customer_data = [customer.to_dict() for customer in customers]
-            response_text = format_query_response({'action': 'list_customers'}, [{'customers': customer_data}])
+            result = execute_api_call({'endpoint': '/api/customers', 'params': {}})
+            if 'error' in result:
+                raise Exception(result['error'])
+            response_text = format_query_response({'action': 'list_customers'}, [result])
             
             return jsonify({
                 'intent': 'query',
                 'action': 'list_customers',
                 'response': response_text,
                 'requires_confirmation': False,
-                'data': [{'customers': customer_data}]
+                'data': [result]
             })
         except Exception as e:
             return jsonify({'error': f'Database query failed: {str(e)}'}), 500
@@ -348,134 +744,211 @@ def create_fallback_response(user_message):
         'data': []
     })
 
+def format_query_value(value):
+    if isinstance(value, float):
+        return f"{value:,.2f}".rstrip('0').rstrip('.')
+    return value
+
 def format_query_response(llm_response, results):
     """Format the query results into a human-readable response"""
-    action = llm_response.get('action', '')
-    
     if not results or not results[0]:
         return "No results found for your query."
     
     result = results[0]
     
-    if 'customers' in result:
+    if 'error' in result:
+        return f"I couldn't run that query: {result['error']}"
+    
+    if 'rows' in result:
+        rows = result['rows']
+        if len(rows) == 0:
+            return "No results found for your query."
+        row_list = "\n".join([
+            "• " + ", ".join(f"{column}: {format_query_value(row[column])}" for column in result['columns'])
+            for row in rows
+        ])
+        return f"Found {len(rows)} {'row' if len(rows) == 1 else 'rows'}:\n{row_list}"
+    
+    elif 'customers' in result:
         customers = result['customers']
+        total = result.get('total', len(customers))
         if len(customers) == 0:
             return "No customers found matching your criteria."
-        elif len(customers) == 1:
+        elif total == 1:
             customer = customers[0]
-            return f"Found customer: {customer['name']} (Phone: {customer['phone']}, Address: {customer['address']})"
+            return f"Found customer: {customer['name']} (Phone: {customer.get('phone_number')}, Address: {customer['address']})"
         else:
-            customer_list = "\n".join([f"• {c['name']} (Phone: {c['phone']})" for c in customers[:10]])
-            return f"Found {len(customers)} customers:\n{customer_list}"
+            customer_list = "\n".join([f"• {c['name']} (Phone: {c.get('phone_number')})" for c in customers[:10]])
+            return f"Found {total} customers:\n{customer_list}"
     
     elif 'suppliers' in result:
         suppliers = result['suppliers']
+        total = result.get('total', len(suppliers))
         if len(suppliers) == 0:
             return "No suppliers found matching your criteria."
-        elif len(suppliers) == 1:
+        elif total == 1:
             supplier = suppliers[0]
-            return f"Found supplier: {supplier['name']} (Contact: {supplier['contact_person']}, Phone: {supplier['phone']})"
+            return f"Found supplier: {supplier['name']} (Contact: {supplier['contact_person']}, Phone: {supplier.get('phone_number')})"
         else:
             supplier_list = "\n".join([f"• {s['name']} (Contact: {s['contact_person']})" for s in suppliers[:10]])
-            return f"Found {len(suppliers)} suppliers:\n{supplier_list}"
+            return f"Found {total} suppliers:\n{supplier_list}"
     
     elif 'products' in result:
         products = result['products']
+        total = result.get('total', len(products))
         if len(products) == 0:
             return "No products found matching your criteria."
-        elif len(products) == 1:
+        elif total == 1:
             product = products[0]
             return f"Product: {product['name']}\nStock: {product['stock_quantity']} {product['unit_of_measurement']}\nRetail Price: ₹{product['retail_price']}\nWholesale Price: ₹{product['wholesale_price']}"
         else:
             product_list = "\n".join([f"• {p['name']} - Stock: {p['stock_quantity']} - Price: ₹{p['retail_price']}" for p in products[:10]])
-            return f"Found {len(products)} products:\n{product_list}"
+            return f"Found {total} products:\n{product_list}"
     
     elif 'invoices' in result:
         invoices = result['invoices']
+        total = result.get('total', len(invoices))
         if len(invoices) == 0:
             return "No invoices found matching your criteria."
-        elif len(invoices) == 1:
+        elif total == 1:
             invoice = invoices[0]
             status = "Paid" if invoice.get('is_paid') else ("Partially Paid" if invoice.get('paid_amount', 0) > 0 else "Unpaid")
             return f"Invoice: {invoice['invoice_number']}\nCustomer: {invoice.get('customer_name', 'N/A')}\nDate: {invoice['invoice_date']}\nAmount: ₹{invoice['total_amount']}\nStatus: {status}\nOutstanding: ₹{invoice.get('outstanding_amount', invoice['total_amount'] - invoice.get('paid_amount', 0))}"
         else:
             invoice_list = "\n".join([f"• {i['invoice_number']} - {i.get('customer_name', 'N/A')} - ₹{i['total_amount']} ({'Paid' if i.get('is_paid') else 'Unpaid'})" for i in invoices[:10]])
-            return f"Found {len(invoices)} invoices:\n{invoice_list}"
+            return f"Found {total} invoices:\n{invoice_list}"
     
     elif 'payments' in result:
         payments = result['payments']
+        total = result.get('total', len(payments))
         if len(payments) == 0:
             return "No payments found matching your criteria."
         else:
             payment_list = "\n".join([f"• ₹{p['amount']} on {p['payment_date']} via {p['payment_method']}" for p in payments[:10]])
-            return f"Found {len(payments)} payments:\n{payment_list}"
+            return f"Found {total} payments:\n{payment_list}"
     
     return "Query executed successfully."
 
 @chat_bp.route('/chat/confirm', methods=['POST'])
 def confirm_action():
-    """Confirm and execute a write action"""
+    """Confirm and execute a write action.
+    
+    All confirmed api_calls run in one transaction with a single commit: if
+    any of them fails, none of them is applied. A body value of the form
+    "$<index>.<field>" (e.g. "$0.id") refers to the record created by an
+    earlier api_call of the same request.
+    """
     try:
         data = request.get_json()
         if not data or 'api_calls' not in data:
             return jsonify({'error': 'API calls are required for confirmation'}), 400
         
         # Execute the confirmed API calls
-        results = []
-        for api_call in data['api_calls']:
-            # For now, we'll implement basic create operations
-            # This would need to be expanded based on the specific endpoints
-            result = execute_write_operation(api_call)
-            results.append(result)
+        started = time.perf_counter()
+        created = []
+        batch_start = 0
+        try:
+            for endpoint, batch_start, api_calls in write_batches(data['api_calls']):
+                bodies = [resolve_references(api_call.get('body', {}), created) for api_call in api_calls]
+                created.extend(execute_write_batch(endpoint, bodies))
+            db.session.commit()
+        except (ValueError, LookupError) as e:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': f"Operation {batch_start + 1} failed, nothing was saved: {e}",
+                'failed_index': batch_start
+            }), 400
+        db_ms = (time.perf_counter() - started) * 1000.0
+        
+        results = [{'success': True, WRITE_OPERATIONS[(api_call.get('method'), api_call.get('endpoint'))]: record.to_dict()}
+                   for api_call, record in zip(data['api_calls'], created)]
         
-        return jsonify({
+        return timed_jsonify({
             'success': True,
             'message': 'Action completed successfully',
             'results': results
-        })
+        }, {'llm': 0.0, 'db': db_ms})
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def execute_write_operation(api_call):
-    """Execute write operations (create, update, delete)"""
-    method = api_call.get('method')
-    endpoint = api_call.get('endpoint')
-    body = api_call.get('body', {})
+# Write operations the chatbot can confirm, and the result key for each
+WRITE_OPERATIONS = {
+    ('POST', '/api/customers'): 'customer',
+    ('POST', '/api/suppliers'): 'supplier',
+    ('POST', '/api/invoices'): 'invoice',
+    ('POST', '/api/payments'): 'payment',
+}
+
+REFERENCE_RE = re.compile(r'^\$(\d+)\.(\w+)$')
+
+def referenced_indexes(value):
+    """Indexes of earlier api_calls referenced anywhere in a request body"""
+    if isinstance(value, dict):
+        return {index for item in value.values() for index in referenced_indexes(item)}
+    if isinstance(value, list):
+        return {index for item in value for index in referenced_indexes(item)}
+    if isinstance(value, str):
+        match = REFERENCE_RE.match(value)
+        if match:
+            return {int(match.group(1))}
+    return set()
+
+def resolve_references(value, created):
+    """Replace "$<index>.<field>" strings with fields of records created earlier"""
+    if isinstance(value, dict):
+        return {key: resolve_references(item, created) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_references(item, created) for item in value]
+    if isinstance(value, str):
+        match = REFERENCE_RE.match(value)
+        if match:
+            index, field = int(match.group(1)), match.group(2)
+            if index >= len(created):
+                raise ValueError(f"{value} refers to an operation that has not run before it")
+            if not hasattr(created[index], field):
+                raise ValueError(f"{value} refers to an unknown field")
+            return getattr(created[index], field)
+    return value
+
+def write_batches(api_calls):
+    """Split api_calls into runs of the same operation.
     
-    try:
-        if method == 'POST' and endpoint == '/api/customers':
-            customer = Customer.from_dict(body)
-            db.session.add(customer)
-            db.session.commit()
-            return {'success': True, 'customer': customer.to_dict()}
-        
-        elif method == 'POST' and endpoint == '/api/suppliers':
-            supplier = Supplier.from_dict(body)
-            db.session.add(supplier)
-            db.session.commit()
-            return {'success': True, 'supplier': supplier.to_dict()}
-        
-        elif method == 'POST' and endpoint == '/api/payments':
-            payment = Payment.from_dict(body)
-            db.session.add(payment)
-            
-            # Update invoice paid amount
-            if payment.invoice_id:
-                invoice = Invoice.query.get(payment.invoice_id)
-                if invoice:
-                    invoice.paid_amount += payment.amount
-                    if invoice.paid_amount >= invoice.total_amount:
-                        invoice.status = 'paid'
-                    elif invoice.paid_amount > 0:
-                        invoice.status = 'partial'
-            
-            db.session.commit()
-            return {'success': True, 'payment': payment.to_dict()}
-        
+    Yields (endpoint, index of the first call, calls). Customers, suppliers
+    and payments in one run are inserted together with a single flush; a run
+    is cut where a call refers to a record created earlier in the same run.
+    """
+    batches = []
+    for index, api_call in enumerate(api_calls):
+        key = (api_call.get('method'), api_call.get('endpoint'))
+        if key not in WRITE_OPERATIONS:
+            raise ValueError(f"Unsupported operation: {key[0]} {key[1]}")
+        if (batches and batches[-1][0] == key[1]
+                and all(ref < batches[-1][1] for ref in referenced_indexes(api_call.get('body', {})))):
+            batches[-1][2].append(api_call)
         else:
-            return {'error': f'Unsupported operation: {method} {endpoint}'}
-            
-    except Exception as e:
-        db.session.rollback()
-        return {'error': str(e)}
\ No newline at end of file
+            batches.append((key[1], index, [api_call]))
+    return batches
+
+def execute_write_batch(endpoint, bodies):
+    """Add a run of same-type writes to the session and return the new records.
+    
+    Uses the same builders as the REST blueprints but never commits.
+    """
+    if endpoint == '/api/customers':
+        records = [build_customer(body) for body in bodies]
+        db.session.add_all(records)
+        db.session.flush()
+    elif endpoint == '/api/suppliers':
+        records = [build_supplier(body) for body in bodies]
+        db.session.add_all(records)
+        db.session.flush()
+    elif endpoint == '/api/invoices':
+        # Each invoice needs its own flush for its line items and stock
+        records = [build_invoice(body) for body in bodies]
+    else:
+        # Payments naming an invoice_id also settle that invoice
+        records = build_payments(bodies)
+    return records
\ No newline at end of file
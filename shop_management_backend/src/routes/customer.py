@@ -1,8 +1,16 @@
 from flask import Blueprint, jsonify, request
 from src.models.customer import Customer, db
+from src.models.analytics import CustomerMetric
+from src.services.customer_segments import SEGMENTS
 
 customer_bp = Blueprint('customer', __name__)
 
+# Orderings of GET /customers; lifetime_value walks ix_customer_metrics_value
+CUSTOMER_SORTS = {
+    'name': (Customer.name,),
+    'lifetime_value': (CustomerMetric.lifetime_value.desc(), CustomerMetric.customer_id.desc()),
+}
+
 @customer_bp.route('/customers', methods=['GET'])
 def get_customers():
     """Get all customers with optional search and filtering."""
@@ -12,9 +20,17 @@ def get_customers():
         customer_type = request.args.get('type', '').strip()
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 50))
-        
-        # Build query
-        query = Customer.query
+        segment = request.args.get('segment', '').strip()
+        sort = request.args.get('sort', 'name')
+        if sort not in CUSTOMER_SORTS:
+            return jsonify({'error': f"sort must be one of: {', '.join(CUSTOMER_SORTS)}"}), 400
+        
+        # Build query; metrics come from flask segment-customers, and
+        # customers not segmented yet are left out when filtering or sorting by them
+        by_metrics = sort != 'name' or segment or request.args.get('min_lifetime_value')
+        query = db.session.query(Customer, CustomerMetric).join(
+            CustomerMetric, CustomerMetric.customer_id == Customer.id, isouter=not by_metrics
+        )
         
         # Apply search filter
         if search:
@@ -29,13 +45,29 @@ def get_customers():
         if customer_type and customer_type in ['Retail', 'Wholesale']:
             query = query.filter(Customer.customer_type == customer_type)
         
+        # Apply segment / lifetime value filters
+        if segment:
+            segments = [value for value in segment.split(',') if value]
+            if any(value not in SEGMENTS for value in segments):
+                return jsonify({'error': f"segment must be one of: {', '.join(SEGMENTS)}"}), 400
+            query = query.filter(CustomerMetric.segment.in_(segments))
+        if request.args.get('min_lifetime_value'):
+            try:
+                min_lifetime_value = float(request.args['min_lifetime_value'])
+            except ValueError:
+                return jsonify({'error': 'min_lifetime_value must be a number'}), 400
+            query = query.filter(CustomerMetric.lifetime_value >= min_lifetime_value)
+        
         # Apply pagination
-        customers = query.order_by(Customer.name).paginate(
+        customers = query.order_by(*CUSTOMER_SORTS[sort]).paginate(
             page=page, per_page=per_page, error_out=False
         )
         
         return jsonify({
-            'customers': [customer.to_dict() for customer in customers.items],
+            'customers': [
+                {**customer.to_dict(), 'metrics': metric.to_dict() if metric else None}
+                for customer, metric in customers.items
+            ],
             'total': customers.total,
             'pages': customers.pages,
             'current_page': page,
@@ -51,17 +83,12 @@ def create_customer():
     try:
         data = request.json
         
-        # Validate required fields
-        if not data.get('name'):
-            return jsonify({'error': 'Customer name is required'}), 400
-        
-        # Validate customer type
-        customer_type = data.get('customer_type', 'Retail')
-        if customer_type not in ['Retail', 'Wholesale']:
-            return jsonify({'error': 'Customer type must be either Retail or Wholesale'}), 400
+        try:
+            customer = build_customer(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Create new customer
-        customer = Customer.from_dict(data)
         db.session.add(customer)
         db.session.commit()
         
@@ -138,3 +165,15 @@ def get_customer_ledger(customer_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def build_customer(data):
+    """Validate customer data and return an unsaved Customer"""
+    # Validate required fields
+    if not data.get('name'):
+        raise ValueError('Customer name is required')
+    
+    # Validate customer type
+    customer_type = data.get('customer_type', 'Retail')
+    if customer_type not in ['Retail', 'Wholesale']:
+        raise ValueError('Customer type must be either Retail or Wholesale')
+    
+    return Customer.from_dict(data)
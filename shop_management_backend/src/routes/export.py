@@ -0,0 +1,64 @@
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from datetime import datetime
+from src.services.export import (
+    DEFAULT_BATCH_SIZE, EXPORT_TABLES, FORMATS, ExportUnavailable, require_pyarrow, stream_export,
+)
+
+export_bp = Blueprint('export', __name__)
+
+@export_bp.route('/export/<table_name>', methods=['GET'])
+def export_table(table_name):
+    """Stream a table as an Arrow IPC stream or a Parquet file.
+
+    Filters: from/to (YYYY-MM-DD) on the table's date column and
+    updated_since (ISO timestamp, inclusive) for incremental pulls. The
+    X-Export-Watermark header holds the updated_since of the next pull,
+    which repeats the rows at that timestamp; de-duplicate them by id.
+    """
+    try:
+        table = EXPORT_TABLES.get(table_name)
+        if table is None:
+            return jsonify({'error': f"Unknown table; available: {', '.join(EXPORT_TABLES)}"}), 404
+        export_format = request.args.get('format', 'arrow')
+        if export_format not in FORMATS:
+            return jsonify({'error': f"format must be one of: {', '.join(FORMATS)}"}), 400
+        try:
+            require_pyarrow()
+        except ExportUnavailable as e:
+            return jsonify({'error': str(e)}), 501
+
+        try:
+            filters = export_filters()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Rows updated while the export runs are left for the next pull
+        watermark = table.watermark(**filters)
+        batch_size = current_app.config.get('EXPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        mimetype, extension = FORMATS[export_format]
+        headers = {'Content-Disposition': f'attachment; filename="{table_name}.{extension}"'}
+        if watermark is not None:
+            headers['X-Export-Watermark'] = watermark.isoformat() if hasattr(watermark, 'isoformat') else str(watermark)
+
+        chunks = stream_export(table, export_format, batch_size, updated_until=watermark, **filters)
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Helper functions
+def export_filters():
+    """from/to/updated_since query parameters; raises ValueError"""
+    filters = {}
+    try:
+        if request.args.get('from'):
+            filters['start'] = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+        if request.args.get('to'):
+            filters['end'] = datetime.strptime(request.args['to'], '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('from and to must be dates in YYYY-MM-DD format')
+    if request.args.get('updated_since'):
+        try:
+            filters['updated_since'] = datetime.fromisoformat(request.args['updated_since'])
+        except ValueError:
+            raise ValueError('updated_since must be an ISO 8601 timestamp')
+    return filters
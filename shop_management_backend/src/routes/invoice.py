@@ -1,11 +1,18 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from src.models.invoice import Invoice, InvoiceLineItem, db
 from src.models.product import Product
 from src.models.customer import Customer
 from src.models.supplier import Supplier
 from sqlalchemy import or_, and_
-from datetime import datetime, timedelta
-import uuid
+from src.services.sales_facts import SalesFactChanges, invoice_lines, record_invoice_change
+from src.services.cost_layers import post_invoice, repost_invoice, reverse_invoice
+from src.services.streaming import STREAM_BATCH_SIZE, batched, stream_list_response, streaming_format
+from src.services.bulk_import import (
+    DEFAULT_CHUNK_SIZE, NDJSON_MIMETYPES, InvoiceImporter, iter_json_rows, iter_ndjson_rows,
+)
+from datetime import datetime
+from decimal import Decimal
+import time
 
 invoice_bp = Blueprint('invoice', __name__)
 
@@ -48,6 +55,11 @@ def get_invoices():
                 )
             )
         
+        # Stream the list instead of building it in memory
+        stream_format = streaming_format()
+        if stream_format:
+            return stream_invoices(query.order_by(Invoice.invoice_date.desc(), Invoice.id.desc()), stream_format)
+        
         # Get invoices ordered by date (newest first)
         invoices = query.order_by(Invoice.invoice_date.desc()).all()
         invoices_data = [invoice.to_dict() for invoice in invoices]
@@ -89,71 +101,10 @@ def create_invoice():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Validate required fields
-        if not data.get('invoice_type') or data['invoice_type'] not in ['sales', 'purchase']:
-            return jsonify({'error': 'Valid invoice_type (sales/purchase) is required'}), 400
-        
-        if data['invoice_type'] == 'sales' and not data.get('customer_id'):
-            return jsonify({'error': 'customer_id is required for sales invoices'}), 400
-        
-        if data['invoice_type'] == 'purchase' and not data.get('supplier_id'):
-            return jsonify({'error': 'supplier_id is required for purchase invoices'}), 400
-        
-        # Generate invoice number if not provided
-        if not data.get('invoice_number'):
-            prefix = 'INV-S' if data['invoice_type'] == 'sales' else 'INV-P'
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            data['invoice_number'] = f"{prefix}-{timestamp}"
-        
-        # Check if invoice number already exists
-        existing_invoice = Invoice.query.filter_by(invoice_number=data['invoice_number']).first()
-        if existing_invoice:
-            return jsonify({'error': 'Invoice number already exists'}), 400
-        
-        # Create invoice
-        invoice = Invoice.from_dict(data)
-        db.session.add(invoice)
-        db.session.flush()  # Get the invoice ID
-        
-        # Add line items
-        line_items_data = data.get('line_items', [])
-        for item_data in line_items_data:
-            line_item = InvoiceLineItem.from_dict(item_data)
-            line_item.invoice_id = invoice.id
-            
-            # If product_id is provided, get product details
-            if line_item.product_id:
-                product = Product.query.get(line_item.product_id)
-                if product:
-                    line_item.item_name = product.name
-                    line_item.item_description = product.description
-                    if not item_data.get('unit_price'):
-                        line_item.unit_price = product.unit_price
-                    if not item_data.get('tax_rate'):
-                        line_item.tax_rate = product.tax_rate
-                    line_item.calculate_amounts()
-            
-            db.session.add(line_item)
-        
-        # Calculate totals
-        db.session.flush()  # Ensure line items are saved
-        invoice.calculate_totals()
-        
-        # Update product stock for sales invoices
-        if invoice.invoice_type == 'sales':
-            for line_item in invoice.line_items:
-                if line_item.product_id:
-                    product = Product.query.get(line_item.product_id)
-                    if product:
-                        product.adjust_stock(-int(line_item.quantity), 'sales_invoice')
-        
-        # Update product stock for purchase invoices (increase stock)
-        elif invoice.invoice_type == 'purchase':
-            for line_item in invoice.line_items:
-                if line_item.product_id:
-                    product = Product.query.get(line_item.product_id)
-                    if product:
-                        product.adjust_stock(int(line_item.quantity), 'purchase_invoice')
+        try:
+            invoice = build_invoice(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         db.session.commit()
         
@@ -174,6 +125,7 @@ def update_invoice(invoice_id):
         
         # Store old line items for stock adjustment reversal
         old_line_items = [(item.product_id, item.quantity) for item in invoice.line_items if item.product_id]
+        old_fact_lines = invoice_lines(invoice)
         
         # Update invoice fields
         invoice.update_from_dict(data)
@@ -196,15 +148,16 @@ def update_invoice(invoice_id):
                         line_item.item_name = product.name
                         line_item.item_description = product.description
                         if not item_data.get('unit_price'):
-                            line_item.unit_price = product.unit_price
+                            line_item.unit_price = default_unit_price(product, invoice.invoice_type)
                         if not item_data.get('tax_rate'):
                             line_item.tax_rate = product.tax_rate
                         line_item.calculate_amounts()
                 
                 db.session.add(line_item)
             
-            # Recalculate totals
+            # Recalculate totals from the new line items
             db.session.flush()
+            db.session.expire(invoice, ['line_items'])
             invoice.calculate_totals()
             
             # Reverse old stock adjustments
@@ -233,6 +186,8 @@ def update_invoice(invoice_id):
                         if product:
                             product.adjust_stock(int(line_item.quantity), 'purchase_invoice')
         
+        record_invoice_change(old_fact_lines, invoice)
+        repost_invoice(invoice)
         db.session.commit()
         
         return jsonify(invoice.to_dict())
@@ -260,6 +215,13 @@ def delete_invoice(invoice_id):
                     if product:
                         product.adjust_stock(-int(line_item.quantity), 'purchase_invoice_cancelled')
         
+        # Take the invoice out of the sales facts and cost layers
+        if invoice.status != 'cancelled':
+            changes = SalesFactChanges()
+            changes.remove_invoice(invoice)
+            changes.apply()
+            reverse_invoice(invoice.id)
+        
         # Soft delete - mark as cancelled
         invoice.status = 'cancelled'
         invoice.updated_at = datetime.utcnow()
@@ -285,19 +247,11 @@ def record_payment(invoice_id):
         if payment_amount <= 0:
             return jsonify({'error': 'Payment amount must be positive'}), 400
         
-        if invoice.paid_amount + payment_amount > invoice.total_amount:
-            return jsonify({'error': 'Payment amount exceeds outstanding balance'}), 400
-        
-        # Update paid amount
-        invoice.paid_amount += payment_amount
+        try:
+            apply_invoice_payment(invoice, payment_amount)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Update status based on payment
-        if invoice.is_paid:
-            invoice.status = 'paid'
-        elif invoice.paid_amount > 0:
-            invoice.status = 'partial'
-        
-        invoice.updated_at = datetime.utcnow()
         db.session.commit()
         
         return jsonify({
@@ -308,6 +262,34 @@ def record_payment(invoice_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@invoice_bp.route('/invoices/bulk', methods=['POST'])
+def bulk_create_invoices():
+    """Import many invoices from a JSON array or an NDJSON stream.
+    
+    Invalid rows are skipped and listed in ``errors`` with their position;
+    the valid rows are saved in one transaction.
+    """
+    try:
+        if request.mimetype in NDJSON_MIMETYPES:
+            rows = iter_ndjson_rows(request.stream)
+        else:
+            try:
+                rows = iter_json_rows(request.get_data())
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        started = time.perf_counter()
+        importer = InvoiceImporter(current_app.config.get('BULK_IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+        importer.import_rows(rows)
+        db.session.commit()
+        
+        summary = importer.summary()
+        summary['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return jsonify(summary), 201 if summary['created'] else 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @invoice_bp.route('/invoices/generate-number', methods=['POST'])
 def generate_invoice_number():
     """Generate a new invoice number"""
@@ -318,18 +300,7 @@ def generate_invoice_number():
         if invoice_type not in ['sales', 'purchase']:
             return jsonify({'error': 'Invalid invoice type'}), 400
         
-        prefix = 'INV-S' if invoice_type == 'sales' else 'INV-P'
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        invoice_number = f"{prefix}-{timestamp}"
-        
-        # Ensure uniqueness
-        counter = 1
-        original_number = invoice_number
-        while Invoice.query.filter_by(invoice_number=invoice_number).first():
-            invoice_number = f"{original_number}-{counter}"
-            counter += 1
-        
-        return jsonify({'invoice_number': invoice_number})
+        return jsonify({'invoice_number': next_invoice_number(invoice_type)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -379,3 +350,154 @@ def get_dashboard_data():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Helper functions
+def stream_invoices(query, stream_format):
+    """Stream invoices with their line items, reading names and line items
+    for a batch of invoices at a time"""
+    summary = {'total_invoices': 0, 'total_amount': 0, 'total_outstanding': 0, 'paid_invoices': 0}
+    
+    def invoices():
+        rows = (
+            query.outerjoin(Customer, Customer.id == Invoice.customer_id)
+            .outerjoin(Supplier, Supplier.id == Invoice.supplier_id)
+            .add_columns(Customer.name, Supplier.name)
+            .yield_per(STREAM_BATCH_SIZE)
+        )
+        for batch in batched(rows):
+            line_items = {invoice.id: [] for invoice, _, _ in batch}
+            items = (
+                db.session.query(InvoiceLineItem, Product.name, Product.sku)
+                .outerjoin(Product, Product.id == InvoiceLineItem.product_id)
+                .filter(InvoiceLineItem.invoice_id.in_(list(line_items)))
+                .order_by(InvoiceLineItem.id)
+            )
+            for item, product_name, product_sku in items:
+                line_items[item.invoice_id].append(item.to_dict(product=(product_name, product_sku)))
+            for invoice, customer_name, supplier_name in batch:
+                invoice_data = invoice.to_dict(names=(customer_name, supplier_name), line_items=line_items[invoice.id])
+                summary['total_invoices'] += 1
+                summary['total_amount'] += invoice_data['total_amount']
+                summary['total_outstanding'] += invoice_data['outstanding_amount']
+                summary['paid_invoices'] += 1 if invoice_data['is_paid'] else 0
+                yield invoice_data
+    
+    def tail():
+        return {'summary': {**summary, 'unpaid_invoices': summary['total_invoices'] - summary['paid_invoices']}}
+    
+    return stream_list_response(stream_format, 'invoices', invoices(), tail=tail)
+
+def default_unit_price(product, invoice_type):
+    """Price used for a line item that does not specify one"""
+    if invoice_type == 'purchase' and product.cost_price:
+        return product.cost_price
+    return product.retail_price
+
+def next_invoice_number(invoice_type):
+    """Generate an invoice number that is not taken yet"""
+    prefix = 'INV-S' if invoice_type == 'sales' else 'INV-P'
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    invoice_number = f"{prefix}-{timestamp}"
+    
+    # Ensure uniqueness; several invoices can be created in the same second
+    counter = 1
+    original_number = invoice_number
+    while Invoice.query.filter_by(invoice_number=invoice_number).first():
+        invoice_number = f"{original_number}-{counter}"
+        counter += 1
+    return invoice_number
+
+def build_invoice(data):
+    """Create an invoice with its line items and stock adjustments.
+    
+    The invoice is added and flushed but not committed, so callers can
+    combine it with other writes in one transaction. Raises ValueError
+    when the data is invalid.
+    """
+    # Validate required fields
+    if not data.get('invoice_type') or data['invoice_type'] not in ['sales', 'purchase']:
+        raise ValueError('Valid invoice_type (sales/purchase) is required')
+    
+    if data['invoice_type'] == 'sales' and not data.get('customer_id'):
+        raise ValueError('customer_id is required for sales invoices')
+    
+    if data['invoice_type'] == 'purchase' and not data.get('supplier_id'):
+        raise ValueError('supplier_id is required for purchase invoices')
+    
+    # Generate invoice number if not provided
+    if not data.get('invoice_number'):
+        data = {**data, 'invoice_number': next_invoice_number(data['invoice_type'])}
+    
+    # Check if invoice number already exists
+    existing_invoice = Invoice.query.filter_by(invoice_number=data['invoice_number']).first()
+    if existing_invoice:
+        raise ValueError('Invoice number already exists')
+    
+    # Create invoice
+    invoice = Invoice.from_dict(data)
+    db.session.add(invoice)
+    db.session.flush()  # Get the invoice ID
+    
+    # Add line items
+    line_items_data = data.get('line_items', [])
+    for item_data in line_items_data:
+        line_item = InvoiceLineItem.from_dict(item_data)
+        line_item.invoice_id = invoice.id
+        
+        # If product_id is provided, get product details
+        if line_item.product_id:
+            product = Product.query.get(line_item.product_id)
+            if product:
+                line_item.item_name = product.name
+                line_item.item_description = product.description
+                if not item_data.get('unit_price'):
+                    line_item.unit_price = default_unit_price(product, invoice.invoice_type)
+                if not item_data.get('tax_rate'):
+                    line_item.tax_rate = product.tax_rate
+                line_item.calculate_amounts()
+        
+        db.session.add(line_item)
+    
+    # Calculate totals
+    db.session.flush()  # Ensure line items are saved
+    invoice.calculate_totals()
+    
+    # Update product stock for sales invoices
+    if invoice.invoice_type == 'sales':
+        for line_item in invoice.line_items:
+            if line_item.product_id:
+                product = Product.query.get(line_item.product_id)
+                if product:
+                    product.adjust_stock(-int(line_item.quantity), 'sales_invoice')
+    
+    # Update product stock for purchase invoices (increase stock)
+    elif invoice.invoice_type == 'purchase':
+        for line_item in invoice.line_items:
+            if line_item.product_id:
+                product = Product.query.get(line_item.product_id)
+                if product:
+                    product.adjust_stock(int(line_item.quantity), 'purchase_invoice')
+    
+    changes = SalesFactChanges()
+    changes.add_invoice(invoice)
+    changes.apply()
+    post_invoice(invoice)
+    
+    return invoice
+
+def apply_invoice_payment(invoice, amount):
+    """Add a payment to an invoice's paid amount and update its status"""
+    # Freshly flushed invoices still hold the float column default
+    paid_amount = Decimal(str(invoice.paid_amount or 0)) + Decimal(str(amount))
+    if paid_amount > Decimal(str(invoice.total_amount)):
+        raise ValueError('Payment amount exceeds outstanding balance')
+    
+    # Update paid amount
+    invoice.paid_amount = paid_amount
+    
+    # Update status based on payment
+    if invoice.is_paid:
+        invoice.status = 'paid'
+    elif invoice.paid_amount > 0:
+        invoice.status = 'partial'
+    
+    invoice.updated_at = datetime.utcnow()
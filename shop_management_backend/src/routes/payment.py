@@ -1,6 +1,16 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from src.models.user import db
-from src.models.payment import Payment, LedgerEntry
+from src.models.payment import Payment, LedgerEntry, PaymentAllocation
+from src.models.customer import Customer
+from src.models.supplier import Supplier
+from src.models.invoice import Invoice
+from src.services.allocation import allocate_payment, release_allocations, settle_invoice
+from src.services.bulk_import import (
+    CSV_MIMETYPES, DEFAULT_CHUNK_SIZE, PaymentImporter, iter_csv_rows, iter_json_rows,
+)
+from src.services.streaming import STREAM_BATCH_SIZE, stream_list_response, streaming_format
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
 from datetime import datetime
 from decimal import Decimal
 
@@ -28,6 +38,11 @@ def get_payments():
         if status:
             query = query.filter(Payment.status == status)
         
+        # Stream the list instead of building it in memory
+        stream_format = streaming_format()
+        if stream_format:
+            return stream_payments(query.order_by(Payment.payment_date.desc(), Payment.id.desc()), stream_format)
+        
         payments = query.order_by(Payment.payment_date.desc()).all()
         
         return jsonify({
@@ -44,20 +59,14 @@ def create_payment():
     try:
         data = request.get_json()
         
-        # Generate payment number if not provided
-        if not data.get('payment_number'):
-            data['payment_number'] = Payment.generate_payment_number()
-        
-        # Create payment
-        payment = Payment.from_dict(data)
-        db.session.add(payment)
-        db.session.flush()  # Get the payment ID
-        
-        # Create ledger entries
-        create_payment_ledger_entries(payment)
-        
-        # Update customer/supplier outstanding balance
-        update_outstanding_balance(payment)
+        try:
+            payment = build_payments([data])[0]
+        except LookupError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 404
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         db.session.commit()
         
@@ -70,6 +79,42 @@ def create_payment():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@payment_bp.route('/payments/bulk', methods=['POST'])
+def bulk_create_payments():
+    """Post a batch of payments from CSV (with a header row) or JSON.
+    
+    The batch is saved in one transaction: if any row is invalid nothing is
+    saved and every problem is listed in ``errors``.
+    """
+    try:
+        try:
+            if request.mimetype in CSV_MIMETYPES:
+                rows = iter_csv_rows(request.get_data())
+            else:
+                rows = iter_json_rows(request.get_data(), key='payments')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        importer = PaymentImporter(current_app.config.get('BULK_IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+        importer.import_rows(rows)
+        summary = importer.summary()
+        
+        if summary['failed']:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'No payments were saved', 'created': 0,
+                            'failed': summary['failed'], 'errors': summary['errors']}), 400
+        
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': f"{summary['created']} payments created successfully",
+            'created': summary['created']
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @payment_bp.route('/payments/<int:payment_id>', methods=['GET'])
 def get_payment(payment_id):
     """Get a specific payment"""
@@ -118,6 +163,14 @@ def update_payment(payment_id):
             # Update balances
             reverse_outstanding_balance_update(old_amount, old_customer_id, old_supplier_id, old_payment_type)
             update_outstanding_balance(payment)
+            
+            # Re-apply an allocated payment with its new amount
+            if release_allocations(payment.id):
+                try:
+                    allocate_payment(payment)
+                except (LookupError, ValueError) as e:
+                    db.session.rollback()
+                    return jsonify({'success': False, 'error': str(e)}), 400
         
         db.session.commit()
         
@@ -142,6 +195,9 @@ def delete_payment(payment_id):
         # Reverse outstanding balance update
         reverse_outstanding_balance_update(payment.amount, payment.customer_id, payment.supplier_id, payment.payment_type)
         
+        # Take the payment back off the invoices it was applied to
+        release_allocations(payment.id)
+        
         db.session.delete(payment)
         db.session.commit()
         
@@ -153,6 +209,45 @@ def delete_payment(payment_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@payment_bp.route('/payments/<int:payment_id>/allocate', methods=['POST'])
+def allocate(payment_id):
+    """Apply the unallocated part of a payment to the party's oldest open invoices"""
+    try:
+        payment = Payment.query.get_or_404(payment_id)
+        
+        try:
+            allocations, unallocated = allocate_payment(payment)
+        except (LookupError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 400
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'allocations': [{'invoice_id': allocation['invoice_id'], 'amount': float(allocation['amount'])} for allocation in allocations],
+            'unallocated_amount': float(unallocated)
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@payment_bp.route('/payments/<int:payment_id>/allocations', methods=['GET'])
+def get_allocations(payment_id):
+    """List the invoices a payment has been applied to"""
+    try:
+        payment = Payment.query.get_or_404(payment_id)
+        allocations = PaymentAllocation.query.filter_by(payment_id=payment.id).order_by(PaymentAllocation.id).all()
+        allocated = sum(float(allocation.amount) for allocation in allocations)
+        
+        return jsonify({
+            'success': True,
+            'allocations': [allocation.to_dict() for allocation in allocations],
+            'allocated_amount': round(allocated, 2),
+            'unallocated_amount': round(float(payment.amount) - allocated, 2)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @payment_bp.route('/ledger', methods=['GET'])
 def get_ledger_entries():
     """Get ledger entries with optional filtering"""
@@ -178,6 +273,11 @@ def get_ledger_entries():
         if end_date:
             query = query.filter(LedgerEntry.entry_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
         
+        # Stream the entries, with the running balance computed by the database
+        stream_format = streaming_format()
+        if stream_format:
+            return stream_ledger_entries(query, stream_format)
+        
         entries = query.order_by(LedgerEntry.entry_date.desc(), LedgerEntry.created_at.desc()).all()
         
         # Calculate running balance if filtering by customer or supplier
@@ -240,63 +340,105 @@ def get_balances():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # Helper functions
-def create_payment_ledger_entries(payment):
-    """Create ledger entries for a payment"""
-    if payment.payment_type == 'received':
-        # Payment received from customer
-        # Debit: Cash/Bank, Credit: Customer Account
-        
-        # Cash/Bank entry
-        cash_entry = LedgerEntry(
-            entry_date=payment.payment_date,
-            description=f"Payment received from customer - {payment.payment_number}",
-            debit_amount=payment.amount,
-            credit_amount=0,
-            customer_id=payment.customer_id,
-            payment_id=payment.id,
-            entry_type='payment_received'
+def stream_payments(query, stream_format):
+    """Stream payments with customer, supplier and invoice names joined in"""
+    total = {'total': 0}
+    
+    def payments():
+        rows = (
+            query.outerjoin(Customer, Customer.id == Payment.customer_id)
+            .outerjoin(Supplier, Supplier.id == Payment.supplier_id)
+            .outerjoin(Invoice, Invoice.id == Payment.invoice_id)
+            .add_columns(Customer.name, Supplier.name, Invoice.invoice_number)
+            .yield_per(STREAM_BATCH_SIZE)
         )
-        db.session.add(cash_entry)
-        
-        # Customer account entry
-        customer_entry = LedgerEntry(
-            entry_date=payment.payment_date,
-            description=f"Payment received - {payment.payment_number}",
-            debit_amount=0,
-            credit_amount=payment.amount,
-            customer_id=payment.customer_id,
-            payment_id=payment.id,
-            entry_type='payment_received'
-        )
-        db.session.add(customer_entry)
-        
-    elif payment.payment_type == 'made':
-        # Payment made to supplier
-        # Debit: Supplier Account, Credit: Cash/Bank
-        
-        # Supplier account entry
-        supplier_entry = LedgerEntry(
-            entry_date=payment.payment_date,
-            description=f"Payment made to supplier - {payment.payment_number}",
-            debit_amount=payment.amount,
-            credit_amount=0,
-            supplier_id=payment.supplier_id,
-            payment_id=payment.id,
-            entry_type='payment_made'
-        )
-        db.session.add(supplier_entry)
-        
-        # Cash/Bank entry
-        cash_entry = LedgerEntry(
-            entry_date=payment.payment_date,
-            description=f"Payment made to supplier - {payment.payment_number}",
-            debit_amount=0,
-            credit_amount=payment.amount,
-            supplier_id=payment.supplier_id,
-            payment_id=payment.id,
-            entry_type='payment_made'
+        for payment, *names in rows:
+            total['total'] += 1
+            yield payment.to_dict(names=names)
+    
+    return stream_list_response(stream_format, 'payments', payments(), head={'success': True}, tail=lambda: total)
+
+def stream_ledger_entries(query, stream_format):
+    """Stream ledger entries newest first with a window-function running balance"""
+    chronological = (LedgerEntry.entry_date, LedgerEntry.created_at, LedgerEntry.id)
+    running_balance = func.sum(LedgerEntry.debit_amount - LedgerEntry.credit_amount).over(order_by=chronological)
+    linked_payment = aliased(Payment)
+    totals = {'total': 0, 'final_balance': 0}
+    
+    def entries():
+        rows = (
+            query.outerjoin(Customer, Customer.id == LedgerEntry.customer_id)
+            .outerjoin(Supplier, Supplier.id == LedgerEntry.supplier_id)
+            .outerjoin(Invoice, Invoice.id == LedgerEntry.invoice_id)
+            .outerjoin(linked_payment, linked_payment.id == LedgerEntry.payment_id)
+            .add_columns(Customer.name, Supplier.name, Invoice.invoice_number, linked_payment.payment_number, running_balance)
+            .order_by(*(column.desc() for column in chronological))
+            .yield_per(STREAM_BATCH_SIZE)
         )
-        db.session.add(cash_entry)
+        for entry, customer_name, supplier_name, invoice_number, payment_number, balance in rows:
+            entry_data = entry.to_dict(names=(customer_name, supplier_name, invoice_number, payment_number))
+            entry_data['running_balance'] = float(balance or 0)
+            if not totals['total']:
+                # Newest entry first: its running balance is the final one
+                totals['final_balance'] = entry_data['running_balance']
+            totals['total'] += 1
+            yield entry_data
+    
+    return stream_list_response(stream_format, 'entries', entries(), head={'success': True}, tail=lambda: totals)
+
+def next_payment_number(reserved=()):
+    """Generate a payment number not used in the database or in ``reserved``"""
+    payment_number = Payment.generate_payment_number()
+    counter = 1
+    original_number = payment_number
+    while payment_number in reserved or Payment.query.filter_by(payment_number=payment_number).first():
+        payment_number = f"{original_number}-{counter}"
+        counter += 1
+    return payment_number
+
+def build_payments(data_list):
+    """Create payments with their ledger entries and balance updates.
+    
+    All payments are inserted with a single flush; nothing is committed, so
+    callers can combine them with other writes in one transaction. A payment
+    naming an ``invoice_id`` settles that invoice (see settle_invoice, which
+    raises LookupError and ValueError); one sent with ``auto_allocate`` is
+    applied to the party's oldest open invoices.
+    """
+    payments = []
+    numbers = set()
+    for data in data_list:
+        # Generate payment number if not provided
+        if not data.get('payment_number'):
+            data = {**data, 'payment_number': next_payment_number(numbers)}
+        numbers.add(data['payment_number'])
+        payments.append(Payment.from_dict(data))
+    
+    db.session.add_all(payments)
+    db.session.flush()  # Get the payment IDs
+    
+    for payment in payments:
+        # Create ledger entries
+        create_payment_ledger_entries(payment)
+        
+        # Update customer/supplier outstanding balance
+        update_outstanding_balance(payment)
+    
+    for payment, data in zip(payments, data_list):
+        if payment.invoice_id:
+            settle_invoice(payment)
+        elif data.get('auto_allocate'):
+            allocate_payment(payment)
+    
+    return payments
+
+def create_payment_ledger_entries(payment):
+    """Create ledger entries for a payment"""
+    for values in LedgerEntry.payment_entry_rows(
+        payment.id, payment.payment_number, payment.payment_type, payment.amount,
+        payment.payment_date, customer_id=payment.customer_id, supplier_id=payment.supplier_id,
+    ):
+        db.session.add(LedgerEntry(**values))
 
 def reverse_payment_ledger_entries(payment, old_amount, old_customer_id, old_supplier_id, old_payment_type):
     """Reverse ledger entries for a payment"""
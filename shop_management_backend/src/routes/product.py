@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from src.models.product import Product, db
+from src.services.cost_layers import post_stock_change
 from sqlalchemy import or_
 
 product_bp = Blueprint("product", __name__)
@@ -13,6 +14,8 @@ def get_products():
         category = request.args.get("category", "").strip()
         low_stock = request.args.get("low_stock", "").lower() == "true"
         active_only = request.args.get("active_only", "true").lower() == "true"
+        abc_class = request.args.get("abc_class", "").strip().upper()
+        slow_movers = request.args.get("slow_movers", "").lower()
         
         # Build query
         query = Product.query
@@ -36,6 +39,15 @@ def get_products():
         if category:
             query = query.filter(Product.category.ilike(f"%{category}%"))
         
+        # Classification filters (set by flask classify-products)
+        if abc_class:
+            classes = [value for value in abc_class.split(",") if value]
+            if any(value not in ("A", "B", "C") for value in classes):
+                return jsonify({"error": "abc_class must be A, B or C"}), 400
+            query = query.filter(Product.abc_class.in_(classes))
+        if slow_movers in ("true", "false"):
+            query = query.filter(Product.is_slow_mover == (slow_movers == "true"))
+        
         # Get all products first
         products = query.order_by(Product.name).all()
         
@@ -87,6 +99,9 @@ def create_product():
         
         product = Product.from_dict(data)
         db.session.add(product)
+        db.session.flush()
+        if product.stock_quantity:
+            post_stock_change(product, product.stock_quantity, 'opening')
         db.session.commit()
         
         return jsonify(product.to_dict()), 201
@@ -110,7 +125,10 @@ def update_product(product_id):
             if existing_product:
                 return jsonify({"error": "SKU already exists"}), 400
         
+        old_stock_quantity = product.stock_quantity
         product.update_from_dict(data)
+        if product.stock_quantity != old_stock_quantity:
+            post_stock_change(product, int(product.stock_quantity) - old_stock_quantity)
         db.session.commit()
         
         return jsonify(product.to_dict())
@@ -150,6 +168,7 @@ def adjust_stock(product_id):
             return jsonify({"error": "quantity_change must be a number"}), 400
         
         adjustment_result = product.adjust_stock(int(quantity_change), reason)
+        post_stock_change(product, adjustment_result['new_quantity'] - adjustment_result['old_quantity'])
         db.session.commit()
         
         return jsonify({
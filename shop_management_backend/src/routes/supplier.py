@@ -47,12 +47,12 @@ def create_supplier():
     try:
         data = request.json
         
-        # Validate required fields
-        if not data.get('name'):
-            return jsonify({'error': 'Supplier name is required'}), 400
+        try:
+            supplier = build_supplier(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Create new supplier
-        supplier = Supplier.from_dict(data)
         db.session.add(supplier)
         db.session.commit()
         
@@ -128,3 +128,10 @@ def get_supplier_ledger(supplier_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def build_supplier(data):
+    """Validate supplier data and return an unsaved Supplier"""
+    # Validate required fields
+    if not data.get('name'):
+        raise ValueError('Supplier name is required')
+    
+    return Supplier.from_dict(data)
@@ -0,0 +1,55 @@
+from sqlalchemy import inspect, literal, text
+from src.models.user import db
+
+
+def init_schema(app):
+    """Create any missing tables and indexes for the registered models"""
+    with app.app_context():
+        db.create_all()
+        add_missing_columns()
+        create_missing_indexes()
+
+
+def add_missing_columns():
+    """Add columns declared on models to tables that already existed.
+
+    create_all() never alters an existing table. Existing rows get the
+    column's scalar default; a NOT NULL column without one is added as
+    nullable.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    dialect = db.engine.dialect
+    preparer = dialect.identifier_preparer
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                definition = f"{preparer.format_column(column)} {column.type.compile(dialect=dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    default = literal(column.default.arg, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+                    definition += f" DEFAULT {default}"
+                    if not column.nullable:
+                        definition += " NOT NULL"
+                connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}"))
+
+
+def create_missing_indexes():
+    """Add indexes declared on models to tables that already existed.
+    
+    create_all() only creates indexes together with a new table, so indexes
+    added to an existing model would otherwise never reach older databases.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
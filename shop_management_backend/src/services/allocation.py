@@ -0,0 +1,195 @@
+"""FIFO allocation of payments across a party's open invoices.
+
+A payment received from a customer is applied to their oldest open sales
+invoices (a payment made to a supplier to their oldest purchase invoices)
+until it is used up. The open invoices are read with one windowed query on
+the (party, status, invoice_date) index that returns only the invoices the
+payment reaches; the allocations are inserted with one executemany and the
+invoices' paid_amount and status are updated with one UPDATE.
+
+A payment that names its invoice (``invoice_id``) settles that invoice
+instead, recorded as an allocation too, so editing or deleting the payment
+takes it back off the invoice the same way.
+"""
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import case, func, insert, select, update
+from src.models.user import db
+from src.models.invoice import Invoice
+from src.models.payment import PaymentAllocation
+from src.models.customer import Customer
+from src.models.supplier import Supplier
+
+# Invoices that can still take a payment
+OPEN_STATUSES = ('draft', 'sent', 'partial', 'overdue')
+
+# payment_type -> (party column on Invoice, party model, invoice_type)
+PARTIES = {
+    'received': (Invoice.customer_id, Customer, 'sales'),
+    'made': (Invoice.supplier_id, Supplier, 'purchase'),
+}
+
+CENT = Decimal('0.01')
+
+
+def allocated_amount(payment_id):
+    """Total already allocated from a payment"""
+    total = db.session.scalar(
+        select(func.coalesce(func.sum(PaymentAllocation.amount), 0)).where(PaymentAllocation.payment_id == payment_id)
+    )
+    return Decimal(str(total)).quantize(CENT)
+
+
+def open_invoices_until(party_column, party_id, invoice_type, amount):
+    """(invoice_id, outstanding) of the oldest open invoices that ``amount`` reaches"""
+    outstanding = Invoice.total_amount - Invoice.paid_amount
+    ranked = (
+        select(
+            Invoice.id.label('invoice_id'),
+            outstanding.label('outstanding'),
+            (func.sum(outstanding).over(order_by=(Invoice.invoice_date, Invoice.id)) - outstanding).label('before'),
+        )
+        .where(party_column == party_id, Invoice.status.in_(OPEN_STATUSES), Invoice.invoice_type == invoice_type)
+        .where(outstanding > 0)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(ranked.c.invoice_id, ranked.c.outstanding)
+        .where(ranked.c.before < amount)
+        .order_by(ranked.c.before)
+    ).all()
+    return [(invoice_id, Decimal(str(value)).quantize(CENT)) for invoice_id, value in rows]
+
+
+def apply_paid_amounts(amounts, now=None):
+    """Add ``{invoice_id: amount}`` to paid_amount and refresh status in one UPDATE.
+
+    Negative amounts take money back off the invoices.
+    """
+    if not amounts:
+        return
+    delta = case(amounts, value=Invoice.id, else_=0)
+    paid_amount = Invoice.paid_amount + delta
+    db.session.execute(
+        update(Invoice)
+        .where(Invoice.id.in_(list(amounts)))
+        .values(
+            paid_amount=paid_amount,
+            status=case(
+                (Invoice.status == 'cancelled', Invoice.status),
+                (paid_amount >= Invoice.total_amount, 'paid'),
+                (paid_amount > 0, 'partial'),
+                # Money taken back off an invoice that was paid or partial
+                (Invoice.status.in_(('paid', 'partial')), 'sent'),
+                else_=Invoice.status,
+            ),
+            updated_at=now or datetime.utcnow(),
+        )
+        .execution_options(synchronize_session='fetch')
+    )
+
+
+def settlement_error(payment_type, party_id, invoice):
+    """Why a payment of payment_type from party_id cannot settle ``invoice``, or None.
+
+    ``invoice`` is an Invoice or a row with its invoice_type, customer_id,
+    supplier_id and status.
+    """
+    party_column, party_model, invoice_type = PARTIES.get(payment_type, (None, None, None))
+    if invoice_type is None:
+        return f"Unknown payment_type '{payment_type}'"
+    if invoice.invoice_type != invoice_type:
+        return f"Invoice {invoice.id} is a {invoice.invoice_type} invoice, not a {invoice_type} invoice"
+    if getattr(invoice, party_column.key) != party_id:
+        return f"Invoice {invoice.id} belongs to a different {'customer' if party_model is Customer else 'supplier'}"
+    if invoice.status == 'cancelled':
+        return f"Invoice {invoice.id} is cancelled"
+    return None
+
+
+def settle_invoice(payment):
+    """Apply the unallocated part of a payment to the invoice it names, as an allocation.
+
+    Returns the allocated amount. Raises LookupError for an unknown invoice
+    and ValueError for an invoice of another party or type, a cancelled
+    one, or a payment above its outstanding balance. Nothing is committed.
+    """
+    invoice = db.session.get(Invoice, payment.invoice_id)
+    if invoice is None:
+        raise LookupError(f"Invoice {payment.invoice_id} not found")
+    party_id = payment.customer_id if payment.payment_type == 'received' else payment.supplier_id
+    problem = settlement_error(payment.payment_type, party_id, invoice)
+    if problem:
+        raise ValueError(problem)
+
+    amount = Decimal(str(payment.amount)).quantize(CENT) - allocated_amount(payment.id)
+    if amount <= 0:
+        return Decimal('0')
+    # Freshly flushed invoices still hold the float column default
+    outstanding = Decimal(str(invoice.total_amount or 0)) - Decimal(str(invoice.paid_amount or 0))
+    if amount > outstanding:
+        raise ValueError('Payment amount exceeds outstanding balance')
+
+    now = datetime.utcnow()
+    db.session.add(PaymentAllocation(payment_id=payment.id, invoice_id=invoice.id, amount=amount, created_at=now))
+    apply_paid_amounts({invoice.id: amount}, now)
+    return amount
+
+
+def allocate_payment(payment):
+    """Apply the unallocated part of a payment to the party's oldest open invoices.
+
+    Returns ``(allocations, unallocated)`` where allocations is a list of
+    ``{'invoice_id', 'amount'}``. A payment that names its invoice only
+    ever settles that one (see settle_invoice). Nothing is committed.
+    """
+    if payment.payment_type not in PARTIES or payment.status == 'cancelled':
+        return [], Decimal('0')
+    if payment.invoice_id:
+        amount = settle_invoice(payment)
+        return ([{'invoice_id': payment.invoice_id, 'amount': amount}] if amount else []), Decimal('0')
+    party_column, party_model, invoice_type = PARTIES[payment.payment_type]
+    party_id = payment.customer_id if payment.payment_type == 'received' else payment.supplier_id
+    if not party_id:
+        return [], Decimal('0')
+
+    # Serialize allocations per party on databases with row locks
+    db.session.execute(select(party_model.id).where(party_model.id == party_id).with_for_update())
+
+    remaining = Decimal(str(payment.amount)).quantize(CENT) - allocated_amount(payment.id)
+    if remaining <= 0:
+        return [], max(remaining, Decimal('0'))
+
+    allocations = []
+    for invoice_id, outstanding in open_invoices_until(party_column, party_id, invoice_type, remaining):
+        amount = min(outstanding, remaining)
+        allocations.append({'invoice_id': invoice_id, 'amount': amount})
+        remaining -= amount
+        if remaining <= 0:
+            break
+    if not allocations:
+        return [], remaining
+
+    now = datetime.utcnow()
+    db.session.execute(
+        insert(PaymentAllocation),
+        [{'payment_id': payment.id, 'created_at': now, **allocation} for allocation in allocations],
+    )
+    apply_paid_amounts({allocation['invoice_id']: allocation['amount'] for allocation in allocations}, now)
+    return allocations, remaining
+
+
+def release_allocations(payment_id):
+    """Take a payment's allocations back off its invoices and delete them"""
+    rows = db.session.execute(
+        select(PaymentAllocation.invoice_id, func.sum(PaymentAllocation.amount))
+        .where(PaymentAllocation.payment_id == payment_id)
+        .group_by(PaymentAllocation.invoice_id)
+    ).all()
+    if not rows:
+        return 0
+    apply_paid_amounts({invoice_id: -Decimal(str(amount)) for invoice_id, amount in rows})
+    db.session.execute(
+        PaymentAllocation.__table__.delete().where(PaymentAllocation.payment_id == payment_id)
+    )
+    return len(rows)
@@ -0,0 +1,43 @@
+import threading
+from src.services.cache import LRUTTLCache
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analytics_cache(config=None):
+    """Return the process-wide analytics result cache, or None when disabled"""
+    global _cache
+    config = config or {}
+    if not config.get('ANALYTICS_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LRUTTLCache(
+                    max_entries=config.get('ANALYTICS_CACHE_MAX_ENTRIES', 256),
+                    ttl=config.get('ANALYTICS_CACHE_TTL_SECONDS', 60),
+                )
+    return _cache
+
+
+def cached_result(key, compute, config=None):
+    """Return the cached value for key, computing and storing it on a miss.
+
+    Results may be up to ANALYTICS_CACHE_TTL_SECONDS old.
+    """
+    cache = get_analytics_cache(config)
+    if cache is None:
+        return compute()
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
+
+
+def reset_analytics_cache():
+    """Forget the cache (used when the configuration changes)"""
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,542 @@
+"""Bulk import of invoices and payments for migrations, POS syncs and
+bank statement reconciliation.
+
+Rows are validated and processed in chunks: customers, suppliers, products
+and document numbers for a whole chunk are resolved with a handful of IN
+queries, rows are written with executemany INSERTs, and derived totals
+(stock per product, outstanding balance per party) are applied with one
+set-based UPDATE at the end, along with the daily sales facts and the
+FIFO cost layers.
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import case, func, insert, select, update
+from src.models.user import db
+from src.models.invoice import Invoice, InvoiceLineItem
+from src.models.customer import Customer
+from src.models.supplier import Supplier
+from src.models.product import Product
+from src.models.payment import Payment, LedgerEntry, PaymentAllocation
+from src.services.sales_facts import SalesFactChanges
+from src.services.cost_layers import CostLayerPosting
+from src.services.allocation import CENT, apply_paid_amounts, settlement_error
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Keeps every IN (...) list and CASE expression well below the bound
+# parameter limits of SQLite and PostgreSQL
+IN_BATCH_SIZE = 500
+
+INVOICE_PREFIXES = {'sales': 'INV-S', 'purchase': 'INV-P'}
+PAYMENT_TYPES = {'received': 'customer_id', 'made': 'supplier_id'}
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+CSV_MIMETYPES = ('text/csv', 'application/csv')
+
+# CSV cells are strings; these columns hold ids
+CSV_INTEGER_FIELDS = ('customer_id', 'supplier_id', 'invoice_id')
+
+
+class RowError(ValueError):
+    """A row that cannot be imported"""
+
+
+def iter_json_rows(raw, key='invoices'):
+    """Rows from a JSON array or an object holding the array under ``key``"""
+    data = json.loads(raw)
+    if isinstance(data, dict):
+        data = data.get(key)
+    if not isinstance(data, list):
+        raise ValueError(f"Expected a JSON array of {key}")
+    return iter(data)
+
+
+def iter_csv_rows(raw):
+    """Rows from CSV text with a header line; empty cells are left out"""
+    text = raw.decode('utf-8-sig') if isinstance(raw, bytes) else raw
+    for record in csv.DictReader(io.StringIO(text)):
+        row = {}
+        for field, value in record.items():
+            if field is None or value is None or not value.strip():
+                continue
+            field, value = field.strip(), value.strip()
+            if field in CSV_INTEGER_FIELDS:
+                try:
+                    value = int(value)
+                except ValueError:
+                    row = RowError(f"{field} must be an integer")
+                    break
+            row[field] = value
+        yield row
+
+
+def iter_ndjson_rows(lines):
+    """Rows from newline-delimited JSON; a line that does not parse is yielded as a RowError"""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield RowError(f"Invalid JSON: {e}")
+
+
+def chunked(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fetch_in(columns, key_column, keys):
+    """Rows of ``columns`` whose key_column is in keys, queried in batches"""
+    rows = []
+    for batch in chunked(keys, IN_BATCH_SIZE):
+        rows.extend(db.session.execute(select(*columns).where(key_column.in_(batch))).all())
+    return rows
+
+
+def existing_ids(model, ids):
+    ids = [entity_id for entity_id in ids if entity_id]
+    return {entity_id for entity_id, in fetch_in((model.id,), model.id, ids)}
+
+
+def to_decimal(value, field):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise RowError(f"{field} must be a number")
+
+
+def to_date(value, field):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be a date in YYYY-MM-DD format")
+
+
+def validate_row(row):
+    """Check the shape of one row; references are checked per chunk"""
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('Each invoice must be a JSON object')
+    if row.get('invoice_type') not in INVOICE_PREFIXES:
+        raise RowError('Valid invoice_type (sales/purchase) is required')
+    if row['invoice_type'] == 'sales' and not row.get('customer_id'):
+        raise RowError('customer_id is required for sales invoices')
+    if row['invoice_type'] == 'purchase' and not row.get('supplier_id'):
+        raise RowError('supplier_id is required for purchase invoices')
+    line_items = row.get('line_items', [])
+    if not isinstance(line_items, list) or not all(isinstance(item, dict) for item in line_items):
+        raise RowError('line_items must be a list of objects')
+    return row
+
+
+class NumberAllocator:
+    """Hands out unique <prefix>-<timestamp>-<n> document numbers"""
+
+    def __init__(self, column):
+        self.column = column
+        self.seen = set()
+        self.counters = defaultdict(int)
+        self.timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+
+    def taken(self, numbers):
+        """The numbers that already exist in the database"""
+        return {number for number, in fetch_in((self.column,), self.column, list(numbers))}
+
+    def is_duplicate(self, number, taken):
+        return number in taken or number in self.seen
+
+    def reserve(self, number):
+        self.seen.add(number)
+
+    def assign(self, records, field, prefix_for):
+        """Fill in ``field`` for records that came without a number"""
+        pending = [record for record in records if not record[field]]
+        while pending:
+            candidates = {}
+            for record in pending:
+                prefix = prefix_for(record)
+                self.counters[prefix] += 1
+                number = f"{prefix}-{self.timestamp}-{self.counters[prefix]}"
+                if number not in self.seen:
+                    candidates[number] = record
+            taken = self.taken(candidates)
+            for number, record in candidates.items():
+                if number not in taken:
+                    record[field] = number
+                    self.seen.add(number)
+            pending = [record for record in pending if not record[field]]
+
+
+class ChunkedImporter:
+    """Feeds rows to add() chunk_size at a time, then calls finish() once.
+
+    Everything runs in the current transaction; the caller commits.
+    """
+
+    # Row field echoed next to each error so the caller can find the row
+    number_field = None
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.errors = []
+
+    def import_rows(self, rows):
+        """Import an iterable of rows, chunk_size at a time"""
+        chunk = []
+        for index, row in enumerate(rows):
+            chunk.append((index, row))
+            if len(chunk) >= self.chunk_size:
+                self.add(chunk)
+                chunk = []
+        if chunk:
+            self.add(chunk)
+        self.finish()
+        return self
+
+    def fail(self, index, row, error):
+        number = row.get(self.number_field) if isinstance(row, dict) else None
+        self.errors.append({'row': index, self.number_field: number, 'error': str(error)})
+
+    def add(self, chunk):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+    def summary(self):
+        return {
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+
+class InvoiceImporter(ChunkedImporter):
+    """Imports invoices; invalid rows are skipped and reported"""
+
+    number_field = 'invoice_number'
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__(chunk_size)
+        self.stock_deltas = defaultdict(int)
+        self.facts = SalesFactChanges()
+        self.cost_layers = CostLayerPosting()
+        self.numbers = NumberAllocator(Invoice.invoice_number)
+
+    def add(self, chunk):
+        """Validate, resolve and insert one chunk of (index, row) pairs"""
+        valid = []
+        for index, row in chunk:
+            try:
+                valid.append((index, validate_row(row)))
+            except RowError as e:
+                self.fail(index, row, e)
+
+        customers = existing_ids(Customer, {row.get('customer_id') for _, row in valid})
+        suppliers = existing_ids(Supplier, {row.get('supplier_id') for _, row in valid})
+        product_ids = {item.get('product_id') for _, row in valid for item in row.get('line_items', [])}
+        products = {
+            product.id: product
+            for product in fetch_in(
+                (Product.id, Product.name, Product.description, Product.retail_price, Product.cost_price, Product.tax_rate),
+                Product.id, [product_id for product_id in product_ids if product_id],
+            )
+        }
+        explicit_numbers = [row['invoice_number'] for _, row in valid if row.get('invoice_number')]
+        taken = self.numbers.taken(explicit_numbers)
+
+        invoices, line_items, deltas = [], [], []
+        for index, row in valid:
+            try:
+                invoice, items = self._build(row, customers, suppliers, products, taken)
+            except RowError as e:
+                self.fail(index, row, e)
+                continue
+            if invoice['invoice_number']:
+                self.numbers.reserve(invoice['invoice_number'])
+            invoices.append(invoice)
+            line_items.append(items)
+            deltas.append((row['invoice_type'], items))
+
+        self.numbers.assign(invoices, 'invoice_number', lambda invoice: INVOICE_PREFIXES[invoice['invoice_type']])
+        if not invoices:
+            return
+
+        # insertmanyvalues batches the rows and returns ids in parameter order
+        ids = db.session.scalars(
+            insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True), invoices
+        ).all()
+        rows = []
+        for invoice_id, items in zip(ids, line_items):
+            for item in items:
+                item['invoice_id'] = invoice_id
+                rows.append(item)
+        if rows:
+            db.session.execute(insert(InvoiceLineItem), rows)
+
+        for invoice_type, items in deltas:
+            sign = -1 if invoice_type == 'sales' else 1
+            for item in items:
+                if item['product_id']:
+                    self.stock_deltas[item['product_id']] += sign * int(item['quantity'])
+        for invoice_id, invoice, items in zip(ids, invoices, line_items):
+            if invoice['status'] != 'cancelled':
+                for item in items:
+                    self.facts.add_line(
+                        invoice['invoice_type'], invoice['invoice_date'], invoice['customer_id'], item['product_id'],
+                        item['quantity'], item['line_total'] - item['tax_amount'], item['tax_amount'],
+                        invoice_id=invoice_id,
+                    )
+                    self.cost_layers.add_line(
+                        invoice['invoice_type'], invoice_id, item['product_id'], item['quantity'],
+                        item['unit_price'], invoice['invoice_date'],
+                    )
+        self.created += len(invoices)
+
+    def _build(self, row, customers, suppliers, products, taken):
+        """Insert parameters for one invoice and its line items"""
+        invoice_type = row['invoice_type']
+        if invoice_type == 'sales' and row['customer_id'] not in customers:
+            raise RowError(f"Customer {row['customer_id']} not found")
+        if invoice_type == 'purchase' and row['supplier_id'] not in suppliers:
+            raise RowError(f"Supplier {row['supplier_id']} not found")
+
+        number = row.get('invoice_number')
+        if number and self.numbers.is_duplicate(number, taken):
+            raise RowError('Invoice number already exists')
+
+        items = []
+        for position, item in enumerate(row.get('line_items', []), start=1):
+            product_id = item.get('product_id')
+            product = products.get(product_id) if product_id else None
+            if product_id and product is None:
+                raise RowError(f"Line {position}: product {product_id} not found")
+            quantity = to_decimal(item.get('quantity', 1), f"Line {position}: quantity")
+            unit_price = to_decimal(item.get('unit_price', 0), f"Line {position}: unit_price")
+            tax_rate = to_decimal(item.get('tax_rate', 0), f"Line {position}: tax_rate")
+            item_name = item.get('item_name', '')
+            item_description = item.get('item_description', '')
+            if product is not None:
+                # Same defaults as build_invoice
+                item_name, item_description = product.name, product.description
+                if not item.get('unit_price'):
+                    unit_price = Decimal(str(
+                        product.cost_price if invoice_type == 'purchase' and product.cost_price else product.retail_price
+                    ))
+                if not item.get('tax_rate'):
+                    tax_rate = Decimal(str(product.tax_rate or 0))
+            line_total, tax_amount = InvoiceLineItem.compute_amounts(quantity, unit_price, tax_rate)
+            items.append({
+                'product_id': product_id,
+                'item_name': item_name,
+                'item_description': item_description,
+                'quantity': quantity,
+                'unit_price': unit_price,
+                'tax_rate': tax_rate,
+                'line_total': line_total,
+                'tax_amount': tax_amount,
+            })
+
+        # Same arithmetic as Invoice.calculate_totals
+        subtotal = sum((item['line_total'] for item in items), Decimal('0'))
+        tax_amount = sum((item['tax_amount'] for item in items), Decimal('0'))
+        discount_amount = to_decimal(row.get('discount_amount', 0), 'discount_amount')
+        now = datetime.utcnow()
+        invoice = {
+            'invoice_number': number,
+            'invoice_type': invoice_type,
+            'customer_id': row.get('customer_id'),
+            'supplier_id': row.get('supplier_id'),
+            'invoice_date': to_date(row['invoice_date'], 'invoice_date') if row.get('invoice_date') else now.date(),
+            'due_date': to_date(row['due_date'], 'due_date') if row.get('due_date') else None,
+            'subtotal': subtotal,
+            'tax_amount': tax_amount,
+            'discount_amount': discount_amount,
+            'total_amount': subtotal + tax_amount - discount_amount,
+            'paid_amount': Decimal('0'),
+            'status': row.get('status', 'draft'),
+            'notes': row.get('notes', ''),
+            'terms_conditions': row.get('terms_conditions', ''),
+            'created_at': now,
+            'updated_at': now,
+        }
+        return invoice, items
+
+    def finish(self):
+        """Apply the net stock change of every imported invoice, clamped at zero,
+        and add the invoices to the sales facts and cost layers"""
+        self.facts.apply()
+        self.cost_layers.apply()
+        deltas = [(product_id, delta) for product_id, delta in self.stock_deltas.items() if delta]
+        now = datetime.utcnow()
+        for batch in chunked(deltas, IN_BATCH_SIZE):
+            new_quantity = Product.stock_quantity + case(dict(batch), value=Product.id, else_=0)
+            db.session.execute(
+                update(Product)
+                .where(Product.id.in_([product_id for product_id, _ in batch]))
+                .values(stock_quantity=case((new_quantity < 0, 0), else_=new_quantity), updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        self.stock_deltas.clear()
+
+
+def validate_payment_row(row):
+    """Check one payment row and convert its amount and date"""
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('Each payment must be a JSON object')
+    payment_type = row.get('payment_type', 'received')
+    if payment_type not in PAYMENT_TYPES:
+        raise RowError('Valid payment_type (received/made) is required')
+    party_field = PAYMENT_TYPES[payment_type]
+    if not row.get(party_field):
+        raise RowError(f"{party_field} is required for {payment_type} payments")
+    amount = to_decimal(row.get('amount'), 'amount')
+    if amount <= 0:
+        raise RowError('amount must be greater than zero')
+    payment_date = to_date(row['payment_date'], 'payment_date') if row.get('payment_date') else datetime.utcnow().date()
+    return {**row, 'payment_type': payment_type, 'amount': amount, 'payment_date': payment_date}
+
+
+class PaymentImporter(ChunkedImporter):
+    """Imports payments with their paired ledger entries.
+
+    Outstanding balances are updated once per customer or supplier with
+    the net amount of all their payments. A payment naming an invoice_id
+    settles that invoice like POST /payments: it is recorded as an
+    allocation, and the paid amounts of all settled invoices are updated
+    together at the end.
+    """
+
+    number_field = 'payment_number'
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__(chunk_size)
+        self.balance_deltas = {Customer: defaultdict(Decimal), Supplier: defaultdict(Decimal)}
+        self.numbers = NumberAllocator(Payment.payment_number)
+        # invoice_id -> amount settled by imported payments, applied in finish()
+        self.settlements = defaultdict(Decimal)
+
+    def add(self, chunk):
+        """Validate, resolve and insert one chunk of (index, row) pairs"""
+        valid = []
+        for index, row in chunk:
+            try:
+                valid.append((index, validate_payment_row(row)))
+            except RowError as e:
+                self.fail(index, row, e)
+
+        invoices = {
+            invoice.id: invoice
+            for invoice in fetch_in(
+                (Invoice.id, Invoice.invoice_type, Invoice.customer_id, Invoice.supplier_id, Invoice.status,
+                 Invoice.total_amount, Invoice.paid_amount),
+                Invoice.id, list({row['invoice_id'] for _, row in valid if row.get('invoice_id')}),
+            )
+        }
+
+        parties = {
+            'customer_id': existing_ids(Customer, {row.get('customer_id') for _, row in valid}),
+            'supplier_id': existing_ids(Supplier, {row.get('supplier_id') for _, row in valid}),
+        }
+        taken = self.numbers.taken(row['payment_number'] for _, row in valid if row.get('payment_number'))
+
+        payments = []
+        for index, row in valid:
+            party_field = PAYMENT_TYPES[row['payment_type']]
+            number = row.get('payment_number')
+            if row[party_field] not in parties[party_field]:
+                self.fail(index, row, f"{'Customer' if party_field == 'customer_id' else 'Supplier'} {row[party_field]} not found")
+                continue
+            if number and self.numbers.is_duplicate(number, taken):
+                self.fail(index, row, 'Payment number already exists')
+                continue
+            if row.get('invoice_id'):
+                invoice = invoices.get(row['invoice_id'])
+                if invoice is None:
+                    self.fail(index, row, f"Invoice {row['invoice_id']} not found")
+                    continue
+                problem = settlement_error(row['payment_type'], row[party_field], invoice)
+                outstanding = (
+                    Decimal(str(invoice.total_amount)) - Decimal(str(invoice.paid_amount or 0))
+                    - self.settlements[invoice.id]
+                )
+                if not problem and row['amount'].quantize(CENT) > outstanding:
+                    problem = 'Payment amount exceeds outstanding balance'
+                if problem:
+                    self.fail(index, row, problem)
+                    continue
+                if row.get('status', 'completed') != 'cancelled':
+                    self.settlements[invoice.id] += row['amount'].quantize(CENT)
+            if number:
+                self.numbers.reserve(number)
+            now = datetime.utcnow()
+            payments.append({
+                'payment_number': number,
+                'payment_date': row['payment_date'],
+                'amount': row['amount'],
+                'payment_method': row.get('payment_method', 'cash'),
+                'reference_number': row.get('reference_number', ''),
+                'notes': row.get('notes', ''),
+                'invoice_id': row.get('invoice_id'),
+                'customer_id': row.get('customer_id') if party_field == 'customer_id' else None,
+                'supplier_id': row.get('supplier_id') if party_field == 'supplier_id' else None,
+                'payment_type': row['payment_type'],
+                'status': row.get('status', 'completed'),
+                'created_at': now,
+                'updated_at': now,
+            })
+
+        self.numbers.assign(payments, 'payment_number', lambda payment: 'PAY')
+        if not payments:
+            return
+
+        ids = db.session.scalars(
+            insert(Payment).returning(Payment.id, sort_by_parameter_order=True), payments
+        ).all()
+        entries = []
+        for payment_id, payment in zip(ids, payments):
+            entries.extend(LedgerEntry.payment_entry_rows(
+                payment_id, payment['payment_number'], payment['payment_type'], payment['amount'],
+                payment['payment_date'], customer_id=payment['customer_id'], supplier_id=payment['supplier_id'],
+            ))
+            if payment['customer_id']:
+                self.balance_deltas[Customer][payment['customer_id']] -= payment['amount']
+            else:
+                self.balance_deltas[Supplier][payment['supplier_id']] -= payment['amount']
+        db.session.execute(insert(LedgerEntry), entries)
+        allocations = [
+            {'payment_id': payment_id, 'invoice_id': payment['invoice_id'], 'amount': payment['amount'].quantize(CENT),
+             'created_at': payment['created_at']}
+            for payment_id, payment in zip(ids, payments)
+            if payment['invoice_id'] and payment['status'] != 'cancelled'
+        ]
+        if allocations:
+            db.session.execute(insert(PaymentAllocation), allocations)
+        self.created += len(payments)
+
+    def finish(self):
+        """Apply the net balance change of each customer and supplier in one UPDATE per batch,
+        and the settled amounts to the invoices in one UPDATE per batch"""
+        for batch in chunked(self.settlements.items(), IN_BATCH_SIZE):
+            apply_paid_amounts(dict(batch))
+        self.settlements.clear()
+        for model, deltas in self.balance_deltas.items():
+            for batch in chunked(deltas.items(), IN_BATCH_SIZE):
+                db.session.execute(
+                    update(model)
+                    .where(model.id.in_([party_id for party_id, _ in batch]))
+                    .values(outstanding_balance=func.coalesce(model.outstanding_balance, 0) + case(dict(batch), value=model.id, else_=0))
+                    .execution_options(synchronize_session=False)
+                )
+            deltas.clear()
@@ -0,0 +1,87 @@
+import re
+import threading
+from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from src.models.customer import Customer
+from src.models.supplier import Supplier
+from src.models.product import Product
+from src.services.cache import LRUTTLCache
+
+# Models whose rows can be baked into a cached plan (ids, names, categories).
+# Committed inserts, deletes or changes to these columns drop the cache;
+# routine updates such as stock adjustments do not.
+WATCHED_MODELS = (Customer, Supplier, Product)
+WATCHED_COLUMNS = ('name', 'category')
+
+_cache = None
+_cache_lock = threading.Lock()
+_invalidation_callbacks = []
+
+
+def normalize_message(message):
+    """Canonical form of a chat message used as the cache key"""
+    message = message.lower().strip()
+    message = re.sub(r"[^\w\s₹.@/-]", ' ', message)
+    message = re.sub(r"\s+", ' ', message)
+    return message.strip(' .')
+
+
+def cache_key(message):
+    # Relative dates ("this month", "yesterday") are resolved by the LLM, so a
+    # plan is only reusable on the day it was produced.
+    return f"{datetime.now().date().isoformat()}|{normalize_message(message)}"
+
+
+def get_chat_cache(config=None):
+    """Return the process-wide LLM response cache, or None when disabled"""
+    global _cache
+    config = config or {}
+    if not config.get('CHAT_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LRUTTLCache(
+                    max_entries=config.get('CHAT_CACHE_MAX_ENTRIES', 1024),
+                    max_bytes=config.get('CHAT_CACHE_MAX_BYTES', 4 * 1024 * 1024),
+                    ttl=config.get('CHAT_CACHE_TTL_SECONDS', 3600),
+                )
+    return _cache
+
+
+def register_invalidation_callback(callback):
+    """Call ``callback()`` whenever cached chat data goes stale"""
+    _invalidation_callbacks.append(callback)
+
+
+def invalidate_chat_cache():
+    if _cache is not None:
+        _cache.clear()
+    for callback in _invalidation_callbacks:
+        callback()
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_watched_changes(session, flush_context):
+    for obj in (*session.new, *session.deleted):
+        if isinstance(obj, WATCHED_MODELS):
+            session.info['chat_cache_stale'] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, WATCHED_MODELS):
+            attrs = inspect(obj).attrs
+            if any(column in attrs.keys() and attrs[column].history.has_changes() for column in WATCHED_COLUMNS):
+                session.info['chat_cache_stale'] = True
+                return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('chat_cache_stale', False):
+        invalidate_chat_cache()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop('chat_cache_stale', None)
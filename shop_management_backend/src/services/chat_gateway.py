@@ -0,0 +1,355 @@
+"""Admission control for chat requests that need the LLM.
+
+At most ``max_concurrent`` LLM calls run at once. Further requests wait in a
+bounded FIFO queue for up to ``queue_timeout`` seconds; when the queue is
+full they are rejected straight away (429), and when the wait times out
+they get a 503. Every admitted call also has a deadline (504 when it is
+missed), so a slow model cannot hold a worker thread indefinitely.
+
+ChatGateway serves the sync WSGI routes; AsyncChatGateway applies the same
+limits to coroutines on an event loop, where a waiting request costs no
+thread at all.
+"""
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class ChatRejected(Exception):
+    """A chat request that was not admitted or did not finish in time"""
+
+    def __init__(self, message, status_code, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Admission:
+    """A slot held by one admitted request; release() is idempotent"""
+
+    def __init__(self, gateway, waited_ms):
+        self._gateway = gateway
+        self._released = False
+        self.waited_ms = waited_ms
+
+    def release(self):
+        with self._gateway._lock:
+            if self._released:
+                return
+            self._released = True
+        self._gateway._release_slot()
+
+
+class _GatewayBase:
+    """Limits, counters and stats shared by the sync and async gateways"""
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout, llm_timeout, window):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.llm_timeout = llm_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._wait_ms = deque(maxlen=window)
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.deadline_exceeded = 0
+        self.peak_queued = 0
+
+    def _queued(self):
+        raise NotImplementedError
+
+    def _busy(self, status_code):
+        if status_code == 429:
+            self.rejected_queue_full += 1
+        else:
+            self.rejected_timeout += 1
+        return ChatRejected('The assistant is busy, please try again shortly.', status_code,
+                            retry_after=max(1, int(self.queue_timeout)))
+
+    def _admitted(self, started):
+        waited_ms = (time.monotonic() - started) * 1000.0
+        self.admitted += 1
+        self._wait_ms.append(waited_ms)
+        return Admission(self, round(waited_ms, 2))
+
+    def _deadline_missed(self):
+        with self._lock:
+            self.deadline_exceeded += 1
+        return ChatRejected('The assistant took too long to answer, please try again.', 504)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._wait_ms)
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout_seconds': self.queue_timeout,
+                'llm_timeout_seconds': self.llm_timeout,
+                'active': self._active,
+                'queued': self._queued(),
+                'peak_queued': self.peak_queued,
+                'admitted': self.admitted,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_timeout': self.rejected_timeout,
+                'deadline_exceeded': self.deadline_exceeded,
+                'wait_ms': {
+                    'samples': len(waits),
+                    'p50': _percentile(waits, 50),
+                    'p95': _percentile(waits, 95),
+                    'p99': _percentile(waits, 99),
+                    'max': round(waits[-1], 2) if waits else 0.0,
+                },
+            }
+
+
+class ChatGateway(_GatewayBase):
+    """Bounded concurrency, bounded queue and deadlines for LLM calls"""
+
+    _DONE = object()
+
+    def __init__(self, max_concurrent=4, max_queue=16, queue_timeout=5.0, llm_timeout=30.0, window=1024):
+        super().__init__(max_concurrent, max_queue, queue_timeout, llm_timeout, window)
+        self._waiters = deque()  # FIFO of threading.Event, one per queued request
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='chat-llm')
+
+    def _queued(self):
+        return len(self._waiters)
+
+    def admit(self):
+        """Take a slot, waiting in the queue if needed.
+
+        Returns an Admission or raises ChatRejected.
+        """
+        started = time.monotonic()
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                return self._admitted(started)
+            if len(self._waiters) >= self.max_queue:
+                raise self._busy(429)
+            turn = threading.Event()
+            self._waiters.append(turn)
+            self.peak_queued = max(self.peak_queued, len(self._waiters))
+
+        if not turn.wait(self.queue_timeout):
+            with self._lock:
+                if turn in self._waiters:
+                    self._waiters.remove(turn)
+                    raise self._busy(503)
+            # The slot was handed over just as the wait timed out
+        with self._lock:
+            return self._admitted(started)
+
+    def _release_slot(self):
+        with self._lock:
+            if self._waiters:
+                # Hand the slot straight to the oldest waiter
+                self._waiters.popleft().set()
+            else:
+                self._active -= 1
+
+    @staticmethod
+    def _in_context(app, fn, *args):
+        # Offline providers may read the database, so give the worker
+        # thread its own app context (and therefore its own session)
+        if app is None:
+            return fn(*args)
+        with app.app_context():
+            return fn(*args)
+
+    def generate(self, admission, provider, prompt, timeout=None, app=None):
+        """Run provider.generate(prompt) within the deadline.
+
+        The slot is released when the call actually ends, so a call that
+        overran its deadline keeps counting against the limit.
+        """
+        future = self._executor.submit(self._in_context, app, provider.generate, prompt)
+        future.add_done_callback(lambda _: admission.release())
+        try:
+            return future.result(timeout=timeout or self.llm_timeout)
+        except FutureTimeoutError:
+            raise self._deadline_missed()
+
+    def stream(self, admission, provider, prompt, timeout=None, app=None):
+        """Yield provider.stream(prompt) chunks until the deadline"""
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+
+        def pump():
+            try:
+                for chunk in provider.stream(prompt):
+                    if cancelled.is_set():
+                        break
+                    chunks.put(chunk)
+                chunks.put(self._DONE)
+            except Exception as e:
+                chunks.put(e)
+
+        future = self._executor.submit(self._in_context, app, pump)
+        future.add_done_callback(lambda _: admission.release())
+        deadline = time.monotonic() + (timeout or self.llm_timeout)
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    raise self._deadline_missed()
+                if item is self._DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+
+
+class AsyncChatGateway(_GatewayBase):
+    """ChatGateway for coroutines: queued requests await instead of blocking.
+
+    Every method must be called from the event loop that serves the chat
+    handler.
+    """
+
+    def __init__(self, max_concurrent=32, max_queue=64, queue_timeout=5.0, llm_timeout=30.0, window=1024):
+        super().__init__(max_concurrent, max_queue, queue_timeout, llm_timeout, window)
+        self._waiters = deque()  # FIFO of asyncio.Future, one per queued request
+
+    def _queued(self):
+        return len(self._waiters)
+
+    async def admit(self):
+        """Take a slot, awaiting a turn in the queue if needed"""
+        started = time.monotonic()
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                return self._admitted(started)
+            if len(self._waiters) >= self.max_queue:
+                raise self._busy(429)
+            turn = asyncio.get_running_loop().create_future()
+            self._waiters.append(turn)
+            self.peak_queued = max(self.peak_queued, len(self._waiters))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(turn), self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if turn in self._waiters:
+                    self._waiters.remove(turn)
+                    raise self._busy(503)
+            # The slot was handed over just as the wait timed out
+        except BaseException:
+            # Cancelled (e.g. the client went away): leave the queue, or pass
+            # on a slot that was handed over meanwhile
+            with self._lock:
+                handed_over = turn not in self._waiters
+                if not handed_over:
+                    self._waiters.remove(turn)
+            if handed_over:
+                self._release_slot()
+            raise
+        with self._lock:
+            return self._admitted(started)
+
+    def _release_slot(self):
+        with self._lock:
+            while self._waiters:
+                turn = self._waiters.popleft()
+                if not turn.cancelled():
+                    # Hand the slot straight to the oldest live waiter
+                    turn.set_result(True)
+                    return
+            self._active -= 1
+
+    async def generate(self, admission, provider, prompt, timeout=None):
+        """Await provider.agenerate(prompt) within the deadline.
+
+        A missed deadline cancels the call, so unlike ChatGateway.generate
+        the slot is released straight away.
+        """
+        try:
+            return await asyncio.wait_for(provider.agenerate(prompt), timeout or self.llm_timeout)
+        except asyncio.TimeoutError:
+            raise self._deadline_missed()
+        finally:
+            admission.release()
+
+    async def stream(self, admission, provider, prompt, timeout=None):
+        """Async-iterate provider.astream(prompt) chunks until the deadline.
+
+        The slot is released when the stream ends, fails or is closed.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.llm_timeout)
+        chunks = provider.astream(prompt)
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, deadline - loop.time()))
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise self._deadline_missed()
+                yield chunk
+        finally:
+            admission.release()
+            await chunks.aclose()
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return round(ordered[index], 2)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_chat_gateway(config=None):
+    """Return the process-wide chat gateway, built from the app config"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                config = config or {}
+                _gateway = ChatGateway(
+                    max_concurrent=config.get('CHAT_MAX_CONCURRENT_LLM', 4),
+                    max_queue=config.get('CHAT_MAX_QUEUE', 16),
+                    queue_timeout=config.get('CHAT_QUEUE_TIMEOUT_SECONDS', 5.0),
+                    llm_timeout=config.get('CHAT_LLM_TIMEOUT_SECONDS', 30.0),
+                )
+    return _gateway
+
+
+def reset_chat_gateway():
+    global _gateway, _async_gateway
+    with _gateway_lock:
+        _gateway = None
+        _async_gateway = None
+
+
+_async_gateway = None
+
+
+def get_async_chat_gateway(config=None, create=True):
+    """Return the process-wide async gateway (None if not created and create is False)"""
+    global _async_gateway
+    if _async_gateway is None and create:
+        with _gateway_lock:
+            if _async_gateway is None:
+                config = config or {}
+                _async_gateway = AsyncChatGateway(
+                    max_concurrent=config.get('CHAT_ASYNC_MAX_CONCURRENT_LLM', 32),
+                    max_queue=config.get('CHAT_ASYNC_MAX_QUEUE', 64),
+                    queue_timeout=config.get('CHAT_QUEUE_TIMEOUT_SECONDS', 5.0),
+                    llm_timeout=config.get('CHAT_LLM_TIMEOUT_SECONDS', 30.0),
+                )
+    return _async_gateway
@@ -0,0 +1,269 @@
+"""FIFO cost layers for COGS and stock valuation.
+
+Every purchase line adds a cost layer (quantity at its unit price), and
+every sales line consumes the product's oldest open layers, recording one
+CostLayerConsumption per layer it draws from. COGS for a period is then a
+sum over the consumptions and stock valuation a sum over the open layers,
+without replaying the purchase history.
+
+Postings are collected in a CostLayerPosting and applied together: the
+open layers of all products involved are read with one query, consumed
+in memory and written back with executemany INSERTs and one CASE UPDATE.
+"""
+from collections import defaultdict, deque
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import case, func, insert, select, update
+from src.models.user import db
+from src.models.inventory import CostLayer, CostLayerConsumption
+from src.models.invoice import Invoice, InvoiceLineItem
+from src.models.product import Product
+
+# Keys per IN list / CASE, within SQLite's bound parameter limit
+BATCH_SIZE = 500
+
+# Invoices replayed per posting by rebuild_cost_layers()
+REBUILD_CHUNK_SIZE = 1000
+
+
+class CostLayerPosting:
+    """Stock receipts and issues to post to the cost layers, applied together"""
+
+    def __init__(self):
+        self._receipts = []
+        self._issues = []
+
+    def add_invoice(self, invoice, retained=None):
+        """Post the product lines of an invoice; cancelled invoices post nothing.
+
+        ``retained`` ({product_id: quantity}, from reverse_invoice) is stock of a
+        reposted purchase that was already sold from its old layers and must
+        not be received again.
+        """
+        if invoice.status == 'cancelled':
+            return
+        retained = dict(retained or {})
+        for item in invoice.line_items:
+            quantity = Decimal(str(item.quantity))
+            if invoice.invoice_type == 'purchase' and retained.get(item.product_id):
+                already = min(retained[item.product_id], quantity)
+                retained[item.product_id] -= already
+                quantity -= already
+            self.add_line(
+                invoice.invoice_type, invoice.id, item.product_id, quantity,
+                Decimal(str(item.unit_price)), invoice.invoice_date,
+            )
+
+    def add_line(self, invoice_type, invoice_id, product_id, quantity, unit_cost, posted_on):
+        if invoice_type == 'purchase':
+            self.receive(product_id, quantity, unit_cost, posted_on, 'purchase', invoice_id)
+        else:
+            self.issue(product_id, quantity, posted_on, 'sale', invoice_id)
+
+    def receive(self, product_id, quantity, unit_cost, received_on, source, invoice_id=None):
+        if not product_id or quantity <= 0:
+            return
+        self._receipts.append({
+            'product_id': product_id, 'source': source, 'invoice_id': invoice_id, 'received_on': received_on,
+            'unit_cost': unit_cost, 'quantity': quantity, 'remaining_quantity': quantity,
+        })
+
+    def issue(self, product_id, quantity, issued_on, source, invoice_id=None):
+        if not product_id or quantity <= 0:
+            return
+        self._issues.append((issued_on, product_id, quantity, source, invoice_id))
+
+    def apply(self):
+        """Insert the new layers, then consume layers for the issues in date order"""
+        now = datetime.utcnow()
+        if self._receipts:
+            db.session.execute(insert(CostLayer), [{**receipt, 'created_at': now} for receipt in self._receipts])
+        if self._issues:
+            self._consume(now)
+        self._receipts.clear()
+        self._issues.clear()
+
+    def _consume(self, now):
+        product_ids = sorted({issue[1] for issue in self._issues})
+        open_layers = defaultdict(deque)
+        for batch in _chunked(product_ids):
+            rows = db.session.execute(
+                select(CostLayer.id, CostLayer.product_id, CostLayer.remaining_quantity, CostLayer.unit_cost)
+                .where(CostLayer.product_id.in_(batch), CostLayer.remaining_quantity > 0)
+                .order_by(CostLayer.product_id, CostLayer.received_on, CostLayer.id)
+                .with_for_update()
+            )
+            for layer_id, product_id, remaining, unit_cost in rows:
+                open_layers[product_id].append([layer_id, Decimal(str(remaining)), Decimal(str(unit_cost))])
+        fallback_costs = {}
+        for batch in _chunked(product_ids):
+            fallback_costs.update(db.session.execute(
+                select(Product.id, Product.cost_price).where(Product.id.in_(batch))
+            ).all())
+
+        consumptions, remaining_by_layer = [], {}
+        for issued_on, product_id, quantity, source, invoice_id in sorted(self._issues, key=lambda issue: issue[0]):
+            layers = open_layers[product_id]
+            while quantity > 0:
+                if layers:
+                    layer = layers[0]
+                    layer_id, unit_cost = layer[0], layer[2]
+                    taken = min(quantity, layer[1])
+                    layer[1] -= taken
+                    remaining_by_layer[layer_id] = layer[1]
+                    if layer[1] <= 0:
+                        layers.popleft()
+                else:
+                    # Sold beyond the layered stock: value at the current cost price
+                    layer_id, unit_cost = None, Decimal(str(fallback_costs.get(product_id) or 0))
+                    taken = quantity
+                consumptions.append({
+                    'layer_id': layer_id, 'product_id': product_id, 'source': source, 'invoice_id': invoice_id,
+                    'consumed_on': issued_on, 'quantity': taken, 'unit_cost': unit_cost,
+                    'cost': taken * unit_cost, 'created_at': now,
+                })
+                quantity -= taken
+
+        db.session.execute(insert(CostLayerConsumption), consumptions)
+        set_remaining_quantities(remaining_by_layer)
+
+
+def set_remaining_quantities(remaining_by_layer):
+    """Write ``{layer_id: remaining_quantity}`` with one UPDATE per batch"""
+    for batch in _chunked(list(remaining_by_layer.items())):
+        db.session.execute(
+            update(CostLayer)
+            .where(CostLayer.id.in_([layer_id for layer_id, _ in batch]))
+            .values(remaining_quantity=case(dict(batch), value=CostLayer.id))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def post_invoice(invoice):
+    posting = CostLayerPosting()
+    posting.add_invoice(invoice)
+    posting.apply()
+
+
+def post_stock_change(product, quantity_change, source='adjustment'):
+    """Post a stock change made outside invoices (opening stock, manual adjustments).
+
+    Increases are received at the product's cost price; decreases consume
+    the oldest layers like a sale but do not count towards COGS.
+    """
+    posting = CostLayerPosting()
+    quantity_change = Decimal(str(quantity_change))
+    today = datetime.utcnow().date()
+    if quantity_change > 0:
+        posting.receive(product.id, quantity_change, Decimal(str(product.cost_price or 0)), today, source)
+    else:
+        posting.issue(product.id, -quantity_change, today, source)
+    posting.apply()
+
+
+def reverse_invoice(invoice_id):
+    """Undo an invoice's postings.
+
+    Quantities its sales lines consumed go back to their layers. Its
+    purchase layers lose their unsold stock; stock already sold from them
+    keeps its cost, and is returned as ``{product_id: quantity}``.
+    """
+    returned = db.session.execute(
+        select(CostLayerConsumption.layer_id, func.sum(CostLayerConsumption.quantity))
+        .where(CostLayerConsumption.invoice_id == invoice_id, CostLayerConsumption.layer_id.isnot(None))
+        .group_by(CostLayerConsumption.layer_id)
+    ).all()
+    if returned:
+        for batch in _chunked(returned):
+            added = case({layer_id: quantity for layer_id, quantity in batch}, value=CostLayer.id, else_=0)
+            db.session.execute(
+                update(CostLayer)
+                .where(CostLayer.id.in_([layer_id for layer_id, _ in batch]))
+                .values(remaining_quantity=CostLayer.remaining_quantity + added)
+                .execution_options(synchronize_session=False)
+            )
+    db.session.execute(CostLayerConsumption.__table__.delete().where(CostLayerConsumption.invoice_id == invoice_id))
+
+    retained = defaultdict(Decimal)
+    for product_id, quantity, remaining in db.session.execute(
+        select(CostLayer.product_id, CostLayer.quantity, CostLayer.remaining_quantity)
+        .where(CostLayer.invoice_id == invoice_id)
+    ):
+        sold = Decimal(str(quantity)) - Decimal(str(remaining))
+        if sold > 0:
+            retained[product_id] += sold
+    db.session.execute(
+        update(CostLayer)
+        .where(CostLayer.invoice_id == invoice_id)
+        .values(quantity=CostLayer.quantity - CostLayer.remaining_quantity, remaining_quantity=0)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        CostLayer.__table__.delete().where(CostLayer.invoice_id == invoice_id, CostLayer.quantity <= 0)
+    )
+    return dict(retained)
+
+
+def repost_invoice(invoice):
+    """Replace an edited invoice's postings with its current lines"""
+    retained = reverse_invoice(invoice.id)
+    posting = CostLayerPosting()
+    posting.add_invoice(invoice, retained)
+    posting.apply()
+
+
+def rebuild_cost_layers():
+    """Recompute all layers by replaying the invoices in date order.
+
+    Stock not explained by the invoices (opening stock, manual adjustments)
+    becomes an opening layer at the product's cost price, dated before the
+    first invoice. Returns (layers, consumptions).
+    """
+    db.session.execute(CostLayerConsumption.__table__.delete())
+    db.session.execute(CostLayer.__table__.delete())
+
+    signed_quantity = case((Invoice.invoice_type == 'purchase', InvoiceLineItem.quantity), else_=-InvoiceLineItem.quantity)
+    net_moves = dict(db.session.execute(
+        select(InvoiceLineItem.product_id, func.sum(signed_quantity))
+        .join(Invoice, Invoice.id == InvoiceLineItem.invoice_id)
+        .where(Invoice.status != 'cancelled', InvoiceLineItem.product_id.isnot(None))
+        .group_by(InvoiceLineItem.product_id)
+    ).all())
+    first_date = db.session.scalar(select(func.min(Invoice.invoice_date))) or datetime.utcnow().date()
+
+    posting = CostLayerPosting()
+    for product_id, stock_quantity, cost_price in db.session.execute(
+        select(Product.id, Product.stock_quantity, Product.cost_price)
+    ):
+        opening = Decimal(str(stock_quantity or 0)) - Decimal(str(net_moves.get(product_id) or 0))
+        posting.receive(product_id, opening, Decimal(str(cost_price or 0)), first_date, 'opening')
+    posting.apply()
+
+    invoices = (
+        select(Invoice.id, Invoice.invoice_type, Invoice.invoice_date)
+        .where(Invoice.status != 'cancelled')
+        .order_by(Invoice.invoice_date, Invoice.id)
+    )
+    for chunk in _chunked(db.session.execute(invoices).all(), REBUILD_CHUNK_SIZE):
+        invoice_ids = [invoice_id for invoice_id, _, _ in chunk]
+        lines = defaultdict(list)
+        for invoice_id, product_id, quantity, unit_price in db.session.execute(
+            select(InvoiceLineItem.invoice_id, InvoiceLineItem.product_id, InvoiceLineItem.quantity, InvoiceLineItem.unit_price)
+            .where(InvoiceLineItem.invoice_id.in_(invoice_ids), InvoiceLineItem.product_id.isnot(None))
+            .order_by(InvoiceLineItem.id)
+        ):
+            lines[invoice_id].append((product_id, Decimal(str(quantity)), Decimal(str(unit_price))))
+        for invoice_id, invoice_type, invoice_date in chunk:
+            for product_id, quantity, unit_price in lines[invoice_id]:
+                posting.add_line(invoice_type, invoice_id, product_id, quantity, unit_price, invoice_date)
+        posting.apply()
+
+    return (
+        db.session.scalar(select(func.count()).select_from(CostLayer)),
+        db.session.scalar(select(func.count()).select_from(CostLayerConsumption)),
+    )
+
+
+def _chunked(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,140 @@
+"""RFM (recency, frequency, monetary) segmentation of the customers.
+
+One grouped query over the non-cancelled sales invoices gives every
+customer's invoice count, lifetime value and first and last purchase.
+Each measure is scored 1-5 by its quintile among the buying customers
+with a NumPy sort and searchsorted, the recency and frequency scores pick
+the segment, and the customer_metrics table is replaced with one DELETE
+and an executemany INSERT.
+"""
+from datetime import datetime
+import numpy as np
+from sqlalchemy import Float, func, insert, select, type_coerce
+from src.models.user import db
+from src.models.analytics import CustomerMetric
+from src.models.customer import Customer
+from src.models.invoice import Invoice
+
+SCORE_BINS = 5
+
+# (segment, minimum recency score, maximum recency score, minimum frequency score, maximum frequency score), first match wins
+SEGMENT_RULES = (
+    ('champions', 4, 5, 4, 5),
+    ('loyal', 3, 5, 3, 5),
+    ('promising', 4, 5, 1, 2),
+    ('at_risk', 1, 2, 3, 5),
+    ('lost', 1, 1, 1, 2),
+    ('hibernating', 2, 2, 1, 2),
+)
+
+# Buyers matching no rule (average recency, low frequency)
+DEFAULT_SEGMENT = 'needs_attention'
+
+NO_PURCHASES_SEGMENT = 'no_purchases'
+
+SEGMENTS = (*(rule[0] for rule in SEGMENT_RULES), DEFAULT_SEGMENT, NO_PURCHASES_SEGMENT)
+
+
+def segment_customers(as_of=None):
+    """Recompute the metrics of every customer; returns the number of customers per segment"""
+    as_of = as_of or datetime.utcnow().date()
+    customer_ids = np.array(db.session.scalars(select(Customer.id).order_by(Customer.id)).all(), dtype=np.int64)
+    db.session.execute(CustomerMetric.__table__.delete())
+    if not len(customer_ids):
+        return {}
+
+    rows = [tuple(row) for row in db.session.execute(
+        select(
+            Invoice.customer_id,
+            func.count(),
+            # Plain floats, skipping the Decimal conversion of every row
+            type_coerce(func.sum(Invoice.total_amount), Float),
+            func.min(Invoice.invoice_date),
+            func.max(Invoice.invoice_date),
+        )
+        .where(
+            Invoice.invoice_type == 'sales',
+            Invoice.status != 'cancelled',
+            Invoice.customer_id.isnot(None),
+            Invoice.invoice_date <= as_of,
+        )
+        .group_by(Invoice.customer_id)
+    )]
+
+    count = len(customer_ids)
+    invoice_count = np.zeros(count, dtype=np.int64)
+    lifetime_value = np.zeros(count)
+    first_purchase = np.full(count, None, dtype=object)
+    last_purchase = np.full(count, None, dtype=object)
+    if rows:
+        ids, counts, values, firsts, lasts = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(customer_ids, ids), count - 1)
+        known = customer_ids[positions] == ids  # Invoices of deleted customers are dropped
+        positions = positions[known]
+        invoice_count[positions] = np.array(counts, dtype=np.int64)[known]
+        lifetime_value[positions] = np.array(values, dtype=float)[known]
+        first_purchase[positions] = np.array(firsts, dtype=object)[known]
+        last_purchase[positions] = np.array(lasts, dtype=object)[known]
+
+    buyers = invoice_count > 0
+    recency_days = np.full(count, -1, dtype=np.int64)
+    recency_days[buyers] = (
+        np.datetime64(as_of, 'D') - last_purchase[buyers].astype('datetime64[D]')
+    ).astype(np.int64)
+
+    recency_score = np.zeros(count, dtype=np.int64)
+    frequency_score = np.zeros(count, dtype=np.int64)
+    monetary_score = np.zeros(count, dtype=np.int64)
+    recency_score[buyers] = quantile_scores(-recency_days[buyers])
+    frequency_score[buyers] = quantile_scores(invoice_count[buyers])
+    monetary_score[buyers] = quantile_scores(lifetime_value[buyers])
+    segments = np.where(buyers, rfm_segments(recency_score, frequency_score), NO_PURCHASES_SEGMENT)
+
+    average_order_value = np.divide(lifetime_value, invoice_count, out=np.zeros(count), where=buyers)
+    columns = {
+        'customer_id': customer_ids.tolist(),
+        'invoice_count': invoice_count.tolist(),
+        'lifetime_value': np.round(lifetime_value, 2).tolist(),
+        'average_order_value': np.round(average_order_value, 2).tolist(),
+        'first_purchase_on': first_purchase.tolist(),
+        'last_purchase_on': last_purchase.tolist(),
+        'recency_days': [days if days >= 0 else None for days in recency_days.tolist()],
+        'recency_score': recency_score.tolist(),
+        'frequency_score': frequency_score.tolist(),
+        'monetary_score': monetary_score.tolist(),
+        'segment': segments.tolist(),
+    }
+    names = list(columns)
+    db.session.execute(
+        insert(CustomerMetric),
+        [{'computed_on': as_of, **dict(zip(names, values))} for values in zip(*columns.values())],
+    )
+
+    segment_names, segment_counts = np.unique(segments, return_counts=True)
+    return dict(zip(segment_names.tolist(), segment_counts.tolist()))
+
+
+def quantile_scores(values, bins=SCORE_BINS):
+    """1..bins by quantile, higher for larger values.
+
+    Tied values share the quantile of their midpoint, so a value held by
+    most customers (one invoice, bought today) lands in a middle score
+    rather than the lowest or highest.
+    """
+    if not len(values):
+        return np.zeros(0, dtype=np.int64)
+    ordered = np.sort(values)
+    below = np.searchsorted(ordered, values, side='left')
+    up_to = np.searchsorted(ordered, values, side='right')
+    quantile = (below + up_to) / (2.0 * len(values))
+    return np.clip(np.ceil(quantile * bins), 1, bins).astype(np.int64)
+
+
+def rfm_segments(recency_score, frequency_score):
+    """Segment name for each pair of recency and frequency scores"""
+    conditions = [
+        (recency_score >= r_min) & (recency_score <= r_max) & (frequency_score >= f_min) & (frequency_score <= f_max)
+        for _, r_min, r_max, f_min, f_max in SEGMENT_RULES
+    ]
+    return np.select(conditions, [rule[0] for rule in SEGMENT_RULES], default=DEFAULT_SEGMENT)
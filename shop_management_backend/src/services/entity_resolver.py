@@ -0,0 +1,258 @@
+"""In-memory fuzzy index mapping names in chat messages to entity ids.
+
+Customer, supplier and product names are indexed by character trigrams,
+word tokens and phonetic keys tuned for Indian names ("Bharat"/"Barat",
+"Sharma"/"Sarma", "Preeti"/"Priti"), so a mention with a typo or an
+alternative spelling still resolves to ranked ids without a LIKE scan.
+Committed inserts, renames and deletes are applied to the index
+incrementally through session events.
+"""
+import re
+import threading
+from collections import defaultdict
+from difflib import SequenceMatcher
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from src.models.customer import Customer
+from src.models.supplier import Supplier
+from src.models.product import Product
+
+KINDS = {'customer': Customer, 'supplier': Supplier, 'product': Product}
+
+# Matches scoring below this are not used to filter queries
+DEFAULT_MIN_SCORE = 0.6
+
+# Applied in order; aspirated consonants and long vowels are spelled
+# inconsistently in transliterated names
+PHONETIC_RULES = [
+    ('bh', 'b'), ('kh', 'k'), ('gh', 'g'), ('ch', 'c'), ('jh', 'j'),
+    ('th', 't'), ('dh', 'd'), ('ph', 'f'), ('sh', 's'),
+    ('aa', 'a'), ('ee', 'i'), ('ii', 'i'), ('oo', 'u'), ('uu', 'u'),
+    ('w', 'v'), ('z', 'j'), ('q', 'k'), ('y', 'i'),
+]
+DOUBLED_RE = re.compile(r'(.)\1+')
+
+# Phonetic keys this similar still count as a (partial) word match
+MIN_WORD_SIMILARITY = 0.75
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'\w+', (text or '').lower()))
+
+
+def phonetic_key(token):
+    """Collapse spelling variants of a transliterated word to one key"""
+    for pattern, replacement in PHONETIC_RULES:
+        token = token.replace(pattern, replacement)
+    return DOUBLED_RE.sub(r'\1', token)
+
+
+def word_similarity(key, keys):
+    """Best similarity between a phonetic key and any key of a name"""
+    if key in keys:
+        return 1.0
+    best = 0.0
+    for other in keys:
+        ratio = SequenceMatcher(None, key, other).ratio()
+        if ratio > best:
+            best = ratio
+    return best if best >= MIN_WORD_SIMILARITY else 0.0
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class _Entry:
+    __slots__ = ('entity_id', 'name', 'normalized', 'tokens', 'phonetic', 'grams')
+
+    def __init__(self, entity_id, name):
+        self.entity_id = entity_id
+        self.name = name
+        self.normalized = normalize(name)
+        self.tokens = frozenset(self.normalized.split())
+        self.phonetic = frozenset(phonetic_key(token) for token in self.tokens)
+        self.grams = trigrams(self.normalized)
+
+
+class _KindIndex:
+    """Inverted indexes for one entity type"""
+
+    def __init__(self):
+        self.entries = {}
+        self.by_token = defaultdict(set)
+        self.by_phonetic = defaultdict(set)
+        self.by_gram = defaultdict(set)
+
+    def add(self, entity_id, name):
+        self.remove(entity_id)
+        entry = _Entry(entity_id, name)
+        if not entry.normalized:
+            return
+        self.entries[entity_id] = entry
+        for token in entry.tokens:
+            self.by_token[token].add(entity_id)
+        for key in entry.phonetic:
+            self.by_phonetic[key].add(entity_id)
+        for gram in entry.grams:
+            self.by_gram[gram].add(entity_id)
+
+    def remove(self, entity_id):
+        entry = self.entries.pop(entity_id, None)
+        if entry is None:
+            return
+        for index, keys in ((self.by_token, entry.tokens), (self.by_phonetic, entry.phonetic), (self.by_gram, entry.grams)):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(entity_id)
+                    if not ids:
+                        del index[key]
+
+    def search(self, mention, limit):
+        normalized = normalize(mention)
+        if not normalized:
+            return []
+        tokens = normalized.split()
+        phonetic = [phonetic_key(token) for token in tokens]
+        grams = trigrams(normalized)
+
+        # Candidates share a token, a phonetic key or enough trigrams
+        candidates = set()
+        for token in tokens:
+            candidates |= self.by_token.get(token, set())
+        for key in phonetic:
+            candidates |= self.by_phonetic.get(key, set())
+        gram_hits = defaultdict(int)
+        for gram in grams:
+            for entity_id in self.by_gram.get(gram, ()):
+                gram_hits[entity_id] += 1
+        needed = max(2, len(grams) // 3)
+        candidates.update(entity_id for entity_id, hits in gram_hits.items() if hits >= needed)
+
+        ranked = []
+        for entity_id in candidates:
+            entry = self.entries[entity_id]
+            if entry.normalized == normalized:
+                score = 1.0
+            else:
+                # Spelling similarity of the whole name, plus how well each
+                # word of the mention matches a word of the name
+                dice = 2.0 * len(grams & entry.grams) / (len(grams) + len(entry.grams))
+                words = sum(word_similarity(key, entry.phonetic) for key in phonetic) / len(phonetic)
+                score = round(min(0.99, 0.4 * dice + 0.6 * words), 4)
+            ranked.append((score, entry.name, entity_id))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [{'id': entity_id, 'name': name, 'score': score} for score, name, entity_id in ranked[:limit]]
+
+
+class EntityResolver:
+    """Fuzzy name lookup over customers, suppliers and products"""
+
+    def __init__(self):
+        self._indexes = {kind: _KindIndex() for kind in KINDS}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls):
+        resolver = cls()
+        for kind, model in KINDS.items():
+            for entity_id, name in model.query.with_entities(model.id, model.name).all():
+                resolver.add(kind, entity_id, name)
+        return resolver
+
+    def add(self, kind, entity_id, name):
+        with self._lock:
+            self._indexes[kind].add(entity_id, name)
+
+    def remove(self, kind, entity_id):
+        with self._lock:
+            self._indexes[kind].remove(entity_id)
+
+    def resolve(self, kind, mention, limit=5):
+        """Return up to ``limit`` matches as [{'id', 'name', 'score'}], best first"""
+        with self._lock:
+            return self._indexes[kind].search(mention, limit)
+
+    def best_match(self, kind, mention, min_score=DEFAULT_MIN_SCORE):
+        """Return the top match for mention, or None when nothing scores high enough"""
+        matches = self.resolve(kind, mention, limit=1)
+        return matches[0] if matches and matches[0]['score'] >= min_score else None
+
+    def matching_ids(self, kind, mention, min_score=DEFAULT_MIN_SCORE, margin=0.1, limit=20):
+        """Ids scoring at least min_score and within margin of the best match.
+
+        An ambiguous mention ("Singh") keeps every close candidate instead of
+        silently picking one of them.
+        """
+        matches = [match for match in self.resolve(kind, mention, limit) if match['score'] >= min_score]
+        if not matches:
+            return []
+        return [match['id'] for match in matches if match['score'] >= matches[0]['score'] - margin]
+
+    def __len__(self):
+        return sum(len(index.entries) for index in self._indexes.values())
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_entity_resolver():
+    """Return the process-wide resolver, loading it on first use"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = EntityResolver.load()
+    return _resolver
+
+
+def reset_entity_resolver():
+    global _resolver
+    _resolver = None
+
+
+def _kind_of(obj):
+    for kind, model in KINDS.items():
+        if isinstance(obj, model):
+            return kind
+    return None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_name_changes(session, flush_context):
+    if _resolver is None:
+        return
+    changes = session.info.setdefault('entity_resolver_changes', [])
+    for obj in session.new:
+        kind = _kind_of(obj)
+        if kind:
+            changes.append((kind, obj.id, obj.name))
+    for obj in session.dirty:
+        kind = _kind_of(obj)
+        if kind and inspect(obj).attrs.name.history.has_changes():
+            changes.append((kind, obj.id, obj.name))
+    for obj in session.deleted:
+        kind = _kind_of(obj)
+        if kind:
+            changes.append((kind, obj.id, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_name_changes(session):
+    changes = session.info.pop('entity_resolver_changes', None)
+    resolver = _resolver
+    if not changes or resolver is None:
+        return
+    for kind, entity_id, name in changes:
+        if name is None:
+            resolver.remove(kind, entity_id)
+        else:
+            resolver.add(kind, entity_id, name)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_name_changes(session, previous_transaction):
+    session.info.pop('entity_resolver_changes', None)
@@ -0,0 +1,207 @@
+"""Columnar export of tables as Arrow IPC streams or Parquet files.
+
+Rows are read with ``yield_per`` (a server-side cursor where the driver
+supports one) and converted one partition at a time into an Arrow record
+batch, which becomes one Parquet row group or one IPC message. Memory stays
+bounded by the batch size however many rows are exported, and columns
+keep their database types: amounts are decimal128, dates date32 and
+timestamps timestamp[us].
+
+pyarrow is optional and only imported when an export runs.
+"""
+import io
+from datetime import datetime, time, timedelta
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, Numeric, func, or_, select
+from src.models.user import db
+from src.models.customer import Customer
+from src.models.supplier import Supplier
+from src.models.product import Product
+from src.models.invoice import Invoice, InvoiceLineItem
+from src.models.payment import Payment, LedgerEntry
+
+DEFAULT_BATCH_SIZE = 50000
+
+FORMATS = {
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ExportUnavailable(RuntimeError):
+    """pyarrow is not installed"""
+
+
+class ExportTable:
+    """A table that can be exported, with the columns used by the filters.
+
+    ``date_column`` is matched against from/to and ``updated_column``
+    against updated_since. ``join`` adds columns of a parent table, e.g. the
+    invoice date of a line item.
+
+    updated_since is inclusive: a row committed after a pull with the same
+    timestamp as its watermark is still in the next pull, at the cost of
+    re-sending the rows at the watermark, which consumers de-duplicate by
+    id. Rows without an updated_column value have no place in that order;
+    they are only in exports without updated_since.
+    """
+
+    def __init__(self, model, date_column, updated_column, join=None, extra_columns=()):
+        self.model = model
+        self.date_column = date_column
+        self.updated_column = updated_column
+        self.join = join
+        self.extra_columns = extra_columns
+
+    @property
+    def columns(self):
+        return [*self.model.__table__.columns, *self.extra_columns]
+
+    def select(self, start=None, end=None, updated_since=None, updated_until=None):
+        query = select(*self.columns)
+        if self.join is not None:
+            query = query.join(*self.join)
+        if isinstance(self.date_column.type, DateTime):
+            # Whole days for timestamp columns
+            start = datetime.combine(start, time.min) if start else None
+            end = datetime.combine(end + timedelta(days=1), time.min) if end else None
+            if end:
+                query = query.where(self.date_column < end)
+        elif end:
+            query = query.where(self.date_column <= end)
+        if start:
+            query = query.where(self.date_column >= start)
+        if updated_since:
+            query = query.where(self.updated_column >= updated_since)
+        if updated_until:
+            query = query.where(or_(self.updated_column <= updated_until, self.updated_column.is_(None)))
+        return query.order_by(self.model.id)
+
+    def watermark(self, start=None, end=None, updated_since=None):
+        """Latest updated_column value in the export, the next updated_since"""
+        query = self.select(start, end, updated_since).order_by(None).subquery()
+        return db.session.scalar(select(func.max(query.c[self.updated_column.name])))
+
+
+EXPORT_TABLES = {
+    'invoices': ExportTable(Invoice, Invoice.invoice_date, Invoice.updated_at),
+    # Line items change only together with their invoice
+    'line_items': ExportTable(
+        InvoiceLineItem, Invoice.invoice_date, Invoice.updated_at,
+        join=(Invoice, Invoice.id == InvoiceLineItem.invoice_id),
+        extra_columns=(Invoice.invoice_date, Invoice.updated_at),
+    ),
+    'payments': ExportTable(Payment, Payment.payment_date, Payment.updated_at),
+    'ledger': ExportTable(LedgerEntry, LedgerEntry.entry_date, LedgerEntry.created_at),
+    'customers': ExportTable(Customer, Customer.created_at, Customer.updated_at),
+    'suppliers': ExportTable(Supplier, Supplier.created_at, Supplier.updated_at),
+    'products': ExportTable(Product, Product.created_at, Product.updated_at),
+}
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ExportUnavailable('Columnar export requires pyarrow (pip install pyarrow)')
+    return pyarrow
+
+
+def arrow_type(column):
+    pa = require_pyarrow()
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, Float):
+        return pa.float64()
+    if isinstance(column_type, Numeric):
+        return pa.decimal128(column_type.precision or 18, column_type.scale or 0)
+    if isinstance(column_type, DateTime):
+        return pa.timestamp('us')
+    if isinstance(column_type, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def arrow_schema(table):
+    pa = require_pyarrow()
+    return pa.schema([
+        pa.field(column.name, arrow_type(column), nullable=column.nullable is not False)
+        for column in table.columns
+    ])
+
+
+def iter_record_batches(table, schema, batch_size=DEFAULT_BATCH_SIZE, **filters):
+    """Yield the rows of an export as Arrow record batches of up to batch_size rows"""
+    pa = require_pyarrow()
+    result = db.session.execute(table.select(**filters).execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema,
+        )
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file object that hands out what was written since the last call"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def write_export(table, export_format, sink, batch_size=DEFAULT_BATCH_SIZE, **filters):
+    """Write an export to a file object; returns the number of rows"""
+    return sum(_write_batches(table, export_format, sink, batch_size, filters))
+
+
+def stream_export(table, export_format, batch_size=DEFAULT_BATCH_SIZE, **filters):
+    """Yield the bytes of an export as each record batch is written"""
+    sink = ChunkSink()
+    for _ in _write_batches(table, export_format, sink, batch_size, filters):
+        chunk = sink.take()
+        if chunk:
+            yield chunk
+    # Parquet footer / end-of-stream marker written on close
+    tail = sink.take()
+    if tail:
+        yield tail
+
+
+def _write_batches(table, export_format, sink, batch_size, filters):
+    """Write the export to sink batch by batch, yielding the rows of each batch"""
+    pa = require_pyarrow()
+    schema = arrow_schema(table)
+    if export_format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for batch in iter_record_batches(table, schema, batch_size, **filters):
+            if export_format == 'parquet':
+                writer.write_batch(batch, row_group_size=batch_size)
+            else:
+                writer.write_batch(batch)
+            yield batch.num_rows
+    finally:
+        writer.close()
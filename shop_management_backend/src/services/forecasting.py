@@ -0,0 +1,189 @@
+"""Demand forecasts and reorder points for the whole catalog.
+
+Daily sales of every active product over the history window are read with
+one grouped query into a products x days NumPy matrix. Moving-average and
+exponentially smoothed demand, its spread, the lead-time reorder point and
+the suggested min/max levels are then computed for all products at once
+with array operations, and written to product_forecasts with one DELETE
+and an executemany INSERT.
+
+Days before a product was created (or first sold) do not count as days
+without sales, so new products are not forecast at a fraction of their
+demand.
+"""
+from datetime import datetime, timedelta
+from statistics import NormalDist
+import numpy as np
+from sqlalchemy import Float, Integer, cast, func, insert, select, type_coerce, update
+from src.models.user import db
+from src.models.invoice import Invoice, InvoiceLineItem
+from src.models.inventory import ProductForecast
+from src.models.product import Product
+
+
+def run_demand_forecast(config, as_of=None, apply_levels=False):
+    """Recompute the forecasts of all active products; returns (forecasts, products updated).
+
+    The history window ends on ``as_of`` (default today). With
+    ``apply_levels``, products sold in the window get the suggested levels
+    as their min/max stock level; the others keep theirs.
+    """
+    history_days = max(1, config.get('FORECAST_HISTORY_DAYS', 90))
+    lead_time_days = config.get('FORECAST_LEAD_TIME_DAYS', 7)
+    end = as_of or datetime.utcnow().date()
+    start = end - timedelta(days=history_days - 1)
+
+    product_ids, stock, created_offsets = load_products(start, end)
+    sales = load_daily_sales(product_ids, start, end)
+    forecasts = compute_forecasts(
+        sales, created_offsets, stock,
+        moving_average_days=config.get('FORECAST_MOVING_AVERAGE_DAYS', 28),
+        alpha=config.get('FORECAST_SMOOTHING_ALPHA', 0.2),
+        lead_time_days=lead_time_days,
+        review_days=config.get('FORECAST_REVIEW_DAYS', 14),
+        service_level=config.get('FORECAST_SERVICE_LEVEL', 0.95),
+    )
+    write_forecasts(product_ids, forecasts, computed_on=end, history_days=history_days, lead_time_days=lead_time_days)
+    updated = apply_suggested_levels() if apply_levels else 0
+    return len(product_ids), updated
+
+
+def load_products(start, end):
+    """Ids (sorted), stock and creation day (offset from start, 0 if earlier) of the active products"""
+    rows = db.session.execute(
+        select(Product.id, Product.stock_quantity, Product.created_at)
+        .where(Product.is_active.is_(True))
+        .order_by(Product.id)
+    ).all()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    ids, stock, created = zip(*rows)
+    created_on = np.array([value.date() if value else start for value in created], dtype='datetime64[D]')
+    offsets = (created_on - np.datetime64(start, 'D')).astype(np.int64)
+    return (
+        np.array(ids, dtype=np.int64),
+        np.array([value or 0 for value in stock], dtype=float),
+        np.clip(offsets, 0, (end - start).days),
+    )
+
+
+def load_daily_sales(product_ids, start, end):
+    """products x days matrix of the quantity sold on non-cancelled sales invoices"""
+    sales = np.zeros((len(product_ids), (end - start).days + 1))
+    day = day_offset(Invoice.invoice_date, start, db.session.get_bind().dialect.name).label('day')
+    rows = db.session.execute(
+        select(
+            InvoiceLineItem.product_id,
+            day,
+            # Plain floats, skipping the Decimal conversion of every row
+            type_coerce(func.sum(InvoiceLineItem.quantity), Float),
+        )
+        .join(Invoice, Invoice.id == InvoiceLineItem.invoice_id)
+        .where(
+            Invoice.invoice_type == 'sales',
+            Invoice.status != 'cancelled',
+            Invoice.invoice_date >= start,
+            Invoice.invoice_date <= end,
+            InvoiceLineItem.product_id.isnot(None),
+        )
+        .group_by(InvoiceLineItem.product_id, day)
+    ).all()
+    if not rows or not len(product_ids):
+        return sales
+
+    # Plain tuples convert to an array far faster than Row objects
+    ids, days, quantities = np.array([tuple(row) for row in rows], dtype=float).T
+    ids, days = ids.astype(np.int64), days.astype(np.int64)
+    positions = np.minimum(np.searchsorted(product_ids, ids), len(product_ids) - 1)
+    active = product_ids[positions] == ids  # Sales of inactive products are dropped
+    sales[positions[active], days[active]] = quantities[active]
+    return sales
+
+
+def day_offset(column, start, dialect_name):
+    """Whole days from start to a date column, computed in the database"""
+    if dialect_name == 'sqlite':
+        return cast(func.julianday(column) - func.julianday(start.isoformat()), Integer)
+    return type_coerce(column - start, Integer)
+
+
+def compute_forecasts(sales, created_offsets, stock, moving_average_days, alpha, lead_time_days, review_days, service_level):
+    """Demand and suggested stock levels of every row of ``sales``, as arrays.
+
+    A product is observed from its creation or its first sale in the
+    window, whichever is earlier. The smoothed demand starts from the mean
+    of the observed days and is the one the reorder point uses:
+
+        safety_stock  = z(service_level) * std * sqrt(lead_time_days)
+        reorder_point = smoothed * lead_time_days + safety_stock
+        suggested_max = reorder_point + smoothed * review_days
+    """
+    day_count = sales.shape[1]
+    sold = sales > 0
+    first_sale = np.where(sold.any(axis=1), sold.argmax(axis=1), day_count)
+    observed = (day_count - np.minimum(created_offsets, first_sale)).astype(float)
+    observed = np.maximum(observed, 1.0)
+
+    mean = sales.sum(axis=1) / observed
+    variance = ((sales ** 2).sum(axis=1) - observed * mean ** 2) / np.maximum(observed - 1, 1)
+    std = np.sqrt(np.maximum(variance, 0))
+
+    window = max(1, min(moving_average_days, day_count))
+    average = sales[:, day_count - window:].sum(axis=1) / np.minimum(observed, window)
+
+    # level_n = sum_k alpha * (1 - alpha)^k * sales_{n-k} + (1 - alpha)^observed * mean,
+    # one matrix-vector product; days before the product existed are zeros
+    weights = alpha * (1 - alpha) ** np.arange(day_count - 1, -1, -1, dtype=float)
+    smoothed = sales @ weights + (1 - alpha) ** observed * mean
+
+    z = NormalDist().inv_cdf(min(max(service_level, 0.5), 0.9999))
+    safety_stock = z * std * np.sqrt(lead_time_days)
+    reorder_point = smoothed * lead_time_days + safety_stock
+    suggested_min = np.ceil(np.round(reorder_point, 3))
+    suggested_max = np.maximum(np.ceil(np.round(reorder_point + smoothed * review_days, 3)), suggested_min)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(smoothed > 0, stock / smoothed, np.nan)
+
+    return {
+        'average_demand': np.round(average, 4),
+        'smoothed_demand': np.round(smoothed, 4),
+        'demand_std': np.round(std, 4),
+        'safety_stock': np.round(safety_stock, 3),
+        'reorder_point': np.round(reorder_point, 3),
+        'suggested_min': suggested_min.astype(np.int64),
+        'suggested_max': suggested_max.astype(np.int64),
+        'days_of_cover': np.round(days_of_cover, 1),
+    }
+
+
+def write_forecasts(product_ids, forecasts, **fixed):
+    """Replace the stored forecasts with one executemany INSERT"""
+    db.session.execute(ProductForecast.__table__.delete())
+    if not len(product_ids):
+        return
+    columns = {'product_id': product_ids.tolist()}
+    for name, values in forecasts.items():
+        columns[name] = values.tolist()
+    # NaN (no demand) is stored as NULL
+    columns['days_of_cover'] = [None if value != value else value for value in columns['days_of_cover']]
+    names = list(columns)
+    db.session.execute(
+        insert(ProductForecast),
+        [{**fixed, **dict(zip(names, values))} for values in zip(*columns.values())],
+    )
+
+
+def apply_suggested_levels():
+    """Copy the suggested levels of products with demand to their min/max stock level"""
+    forecast = ProductForecast
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(select(forecast.product_id).where(forecast.smoothed_demand > 0)))
+        .values(
+            min_stock_level=select(forecast.suggested_min).where(forecast.product_id == Product.id).scalar_subquery(),
+            max_stock_level=select(forecast.suggested_max).where(forecast.product_id == Product.id).scalar_subquery(),
+            updated_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
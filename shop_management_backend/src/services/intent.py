@@ -0,0 +1,363 @@
+"""Rule-based intent classifier for common chat queries.
+
+Runs before the LLM: high-confidence read queries ("show unpaid invoices",
+"low stock items", "payments from Rajesh this month") are turned into the
+same plan structure the LLM would return, so the Gemini round trip can be
+skipped. Anything ambiguous, or any write request, falls through to the LLM.
+"""
+import re
+import threading
+from datetime import datetime, timedelta
+from src.models.customer import Customer
+from src.models.supplier import Supplier
+from src.models.product import Product
+from src.services.chat_cache import register_invalidation_callback
+from src.services.entity_resolver import get_entity_resolver
+
+# Plans scoring below this are handed to the LLM instead
+DEFAULT_MIN_CONFIDENCE = 0.8
+# A misspelt name is accepted when a fuzzy match scores this high
+QUOTED_MATCH_MIN_SCORE = 0.8
+
+WRITE_WORDS = {
+    'create', 'add', 'new', 'record', 'make', 'delete', 'remove', 'update',
+    'edit', 'change', 'set', 'cancel', 'pay', 'receive', 'register', 'sell', 'buy',
+}
+# Questions these rules cannot answer correctly (aggregates, comparisons)
+COMPLEX_WORDS = {
+    'compare', 'comparison', 'top', 'best', 'worst', 'trend', 'average', 'total',
+    'sum', 'how many', 'why', 'versus', 'vs', 'growth', 'profit', 'margin',
+    'selling', 'revenue', 'between',
+}
+
+# Let the database pick the single largest invoice
+TOP_INVOICE = {'order_by': 'total_amount', 'order': 'desc', 'limit': 1}
+
+DATE_PHRASES = ['today', 'yesterday', 'last week', 'this month', 'last month']
+ISO_DATE_RE = re.compile(r'\b(\d{4}-\d{2}-\d{2})\b')
+QUOTED_RE = re.compile(r"""['"“‘]([^'"”’]+)['"”’]""")
+# "invoices for <name>": the words after the last for/of/from should name something
+NAME_TAIL_RE = re.compile(r'\b(?:for|of|from)\s+(.*)$')
+# Words in such a tail that are not part of a name
+TAIL_FILLER_WORDS = {
+    'for', 'of', 'from', 'the', 'a', 'an', 'all', 'my', 'our', 'me', 'us', 'any',
+    'this', 'last', 'week', 'month', 'year', 'today', 'yesterday', 'now', 's',
+    'customer', 'customers', 'supplier', 'suppliers', 'vendor', 'vendors',
+    'product', 'products', 'item', 'items', 'invoice', 'invoices', 'bill', 'bills',
+    'payment', 'payments', 'stock', 'inventory', 'sales', 'purchase', 'purchases',
+    'details', 'please', 'pending', 'unpaid', 'paid',
+}
+
+
+def parse_date_expression(date_str):
+    """Parse natural language date expressions into actual dates"""
+    today = datetime.now().date()
+    date_str = date_str.lower().strip()
+
+    if date_str in ['today']:
+        return today.strftime('%Y-%m-%d')
+    elif date_str in ['yesterday']:
+        return (today - timedelta(days=1)).strftime('%Y-%m-%d')
+    elif date_str in ['last week']:
+        start_date = today - timedelta(days=7)
+        return start_date.strftime('%Y-%m-%d')
+    elif date_str in ['this month']:
+        start_date = today.replace(day=1)
+        return start_date.strftime('%Y-%m-%d')
+    elif date_str in ['last month']:
+        if today.month == 1:
+            start_date = today.replace(year=today.year-1, month=12, day=1)
+        else:
+            start_date = today.replace(month=today.month-1, day=1)
+        return start_date.strftime('%Y-%m-%d')
+
+    # Try to parse specific date formats
+    try:
+        # Try YYYY-MM-DD format
+        parsed_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        return parsed_date.strftime('%Y-%m-%d')
+    except ValueError:
+        pass
+
+    return None
+
+
+def extract_date_range(text):
+    """Return (start_date, end_date, matched_phrase) for the first date phrase in text"""
+    for phrase in DATE_PHRASES:
+        if re.search(rf'\b{phrase}\b', text):
+            start_date = parse_date_expression(phrase)
+            end_date = None
+            if phrase in ('today', 'yesterday'):
+                end_date = start_date
+            elif phrase == 'last month':
+                first_of_month = datetime.now().date().replace(day=1)
+                end_date = (first_of_month - timedelta(days=1)).strftime('%Y-%m-%d')
+            return start_date, end_date, phrase
+    dates = ISO_DATE_RE.findall(text)
+    if dates:
+        parsed = [d for d in (parse_date_expression(d) for d in dates) if d]
+        if parsed:
+            return min(parsed), (max(parsed) if len(parsed) > 1 else None), None
+    return None, None, None
+
+
+class KnownEntities:
+    """Snapshot of customer, supplier and product names for entity extraction"""
+
+    # Longest name (in words) that is looked up as a phrase
+    MAX_NAME_TOKENS = 8
+
+    def __init__(self, customers, suppliers, products):
+        self.customers = self._index(customers)
+        self.suppliers = self._index(suppliers)
+        self.products = self._index(products)
+
+    @staticmethod
+    def _index(rows):
+        phrases = {}
+        first_names = {}
+        for entity_id, name in rows:
+            tokens = tokenize(name or '')
+            if not tokens:
+                continue
+            phrases.setdefault(' '.join(tokens), []).append((entity_id, name))
+            if len(tokens[0]) >= 3:
+                first_names.setdefault(tokens[0], []).append((entity_id, name))
+        return phrases, first_names
+
+    @classmethod
+    def load(cls):
+        return cls(
+            Customer.query.with_entities(Customer.id, Customer.name).all(),
+            Supplier.query.with_entities(Supplier.id, Supplier.name).all(),
+            Product.query.with_entities(Product.id, Product.name).all(),
+        )
+
+    def _find(self, index, tokens, allow_first_name=False):
+        phrases, first_names = index
+        # Longest phrase first so "silk saree red" wins over "silk saree"
+        for size in range(min(self.MAX_NAME_TOKENS, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                matches = phrases.get(' '.join(tokens[start:start + size]))
+                if matches:
+                    entity_id, name = matches[0]
+                    return {'id': entity_id, 'name': name}
+        if allow_first_name:
+            # A unique first name ("Rajesh") is still a confident match
+            for token in tokens:
+                matches = first_names.get(token)
+                if matches and len(matches) == 1:
+                    entity_id, name = matches[0]
+                    return {'id': entity_id, 'name': name}
+        return None
+
+    def find_customer(self, tokens):
+        return self._find(self.customers, tokens, allow_first_name=True)
+
+    def find_supplier(self, tokens):
+        return self._find(self.suppliers, tokens, allow_first_name=True)
+
+    def find_product(self, tokens):
+        return self._find(self.products, tokens)
+
+
+_known = None
+_known_lock = threading.Lock()
+
+
+def get_known_entities():
+    """Return the cached name snapshot, loading it on first use"""
+    global _known
+    if _known is None:
+        with _known_lock:
+            if _known is None:
+                _known = KnownEntities.load()
+    return _known
+
+
+def reset_known_entities():
+    global _known
+    _known = None
+
+
+# Reload names after customers, suppliers or products change
+register_invalidation_callback(reset_known_entities)
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def _has_word(text, words):
+    return any(re.search(rf'\b{re.escape(word)}\b', text) for word in words)
+
+
+def _resolve_quoted(resolver, quoted):
+    """Best fuzzy (kind, match) for a misspelt name across all entity kinds"""
+    best = None
+    for kind in ('customer', 'supplier', 'product'):
+        match = resolver.best_match(kind, quoted, min_score=QUOTED_MATCH_MIN_SCORE)
+        if match and (best is None or match['score'] > best[1]['score']):
+            best = (kind, match)
+    return best
+
+
+def _name_tail(text):
+    """Name-like tokens after a trailing for/of/from, e.g. ["xyz", "traders"]"""
+    match = NAME_TAIL_RE.search(ISO_DATE_RE.sub(' ', text))
+    if not match:
+        return []
+    return [token for token in tokenize(match.group(1))
+            if token not in TAIL_FILLER_WORDS and not token.isdigit()]
+
+
+def _plan(action, endpoint, params, message, confidence, entities=None):
+    return {
+        'intent': 'query',
+        'action': action,
+        'entities': entities or {},
+        'api_calls': [{'method': 'GET', 'endpoint': endpoint, 'params': params}],
+        'response_message': message,
+        'requires_confirmation': False,
+        'confidence': confidence,
+    }
+
+
+def classify(message, known=None, resolver=None):
+    """Classify a chat message into a query plan.
+
+    Returns the plan dict (with a ``confidence`` between 0 and 1) or None
+    when no rule applies. Quoted names that are not spelled exactly, and
+    unquoted names after "for", "of" or "from" that match nothing, are
+    looked up in ``resolver`` (the process-wide fuzzy index by default);
+    a name that still does not resolve lowers the confidence below the
+    default threshold.
+    """
+    text = ' '.join(message.lower().split())
+    if not text:
+        return None
+    if _has_word(text, WRITE_WORDS) or _has_word(text, COMPLEX_WORDS):
+        return None
+
+    if known is None:
+        known = get_known_entities()
+        resolver = resolver or get_entity_resolver()
+    tokens = tokenize(text)
+    found = {
+        'customer': known.find_customer(tokens),
+        'supplier': known.find_supplier(tokens),
+        'product': known.find_product(tokens),
+    }
+    start_date, end_date, _ = extract_date_range(text)
+
+    # Quoted names that we could not resolve make the request ambiguous
+    confidence = 1.0
+    for quoted in QUOTED_RE.findall(message):
+        if any(entity and entity['name'].lower() == quoted.lower() for entity in found.values()):
+            continue
+        fuzzy = _resolve_quoted(resolver, quoted) if resolver is not None else None
+        if fuzzy:
+            kind, match = fuzzy
+            if found[kind] is None or found[kind]['id'] == match['id']:
+                found[kind] = {'id': match['id'], 'name': match['name']}
+                continue
+        confidence -= 0.5
+
+    # An unquoted name ("invoices for Rajsh Kumar") that matched nothing
+    tail = [] if QUOTED_RE.search(message) else _name_tail(text)
+    if tail and not (known.find_customer(tail) or known.find_supplier(tail) or known.find_product(tail)):
+        fuzzy = _resolve_quoted(resolver, ' '.join(tail)) if resolver is not None else None
+        kind, match = fuzzy or (None, None)
+        if match and (found[kind] is None or found[kind]['id'] == match['id']):
+            found[kind] = {'id': match['id'], 'name': match['name']}
+        else:
+            confidence -= 0.5
+    customer, supplier, product = found['customer'], found['supplier'], found['product']
+
+    entities = {}
+    if customer:
+        entities['customer'] = customer
+    if supplier:
+        entities['supplier'] = supplier
+    if product:
+        entities['product'] = product
+    if start_date:
+        entities['start_date'] = start_date
+    if end_date:
+        entities['end_date'] = end_date
+
+    # Filters every invoice / payment plan applies
+    party_and_dates = {}
+    if customer:
+        party_and_dates['customer_id'] = customer['id']
+    elif supplier:
+        party_and_dates['supplier_name'] = supplier['name']
+    if start_date:
+        party_and_dates['start_date'] = start_date
+    if end_date:
+        party_and_dates['end_date'] = end_date
+
+    mentions_invoice = _has_word(text, ['invoice', 'invoices', 'bill', 'bills'])
+    mentions_unpaid = _has_word(text, ['unpaid', 'outstanding', 'pending', 'due', 'dues'])
+    mentions_largest = _has_word(text, ['most expensive', 'highest', 'largest', 'biggest'])
+
+    # Invoice analysis queries
+    if mentions_invoice and mentions_largest and mentions_unpaid:
+        return _plan('find_highest_unpaid_invoice', '/api/invoices', {'status': 'unpaid', **TOP_INVOICE, **party_and_dates},
+                     'Finding the highest unpaid invoice.', confidence, entities)
+    if mentions_invoice and mentions_largest:
+        return _plan('find_most_expensive_invoice', '/api/invoices', {**TOP_INVOICE, **party_and_dates},
+                     'Finding the most expensive invoice.', confidence, entities)
+
+    # Invoice listings
+    if mentions_invoice or _has_word(text, ['sales', 'dues']):
+        params = {}
+        action = 'list_invoices'
+        if mentions_unpaid:
+            params['status'] = 'unpaid'
+            action = 'list_unpaid_invoices'
+        elif _has_word(text, ['partially paid', 'partial']):
+            params['status'] = 'partially_paid'
+            action = 'list_partially_paid_invoices'
+        elif _has_word(text, ['paid']):
+            params['status'] = 'paid'
+            action = 'list_paid_invoices'
+        if _has_word(text, ['sales']):
+            params['invoice_type'] = 'sales'
+        elif _has_word(text, ['purchase', 'purchases']):
+            params['invoice_type'] = 'purchase'
+        params.update(party_and_dates)
+        if product and not customer:
+            # Invoices cannot be filtered by product; let the LLM handle it
+            confidence -= 0.5
+        return _plan(action, '/api/invoices', params, 'Fetching invoices.', confidence, entities)
+
+    # Payments
+    if _has_word(text, ['payment', 'payments', 'receipts', 'received']):
+        return _plan('list_payments', '/api/payments', dict(party_and_dates), 'Fetching payments.', confidence, entities)
+
+    # Stock and products
+    if re.search(r'\b(low|short|running out|out of)\b.*\bstock\b|\breorder\b', text):
+        return _plan('list_low_stock_products', '/api/products', {'low_stock': True},
+                     'Fetching products that are low in stock.', confidence, entities)
+    if product and _has_word(text, ['stock', 'price', 'cost', 'available', 'availability', 'product', 'item', 'check', 'details']):
+        return _plan('check_product', '/api/products', {'search': product['name']},
+                     f"Fetching details for {product['name']}.", confidence, entities)
+    if _has_word(text, ['stock', 'inventory', 'products', 'items']) and not product:
+        if _has_word(text, ['check', 'for', 'of']) and not _has_word(text, ['all', 'list', 'show']):
+            # "check stock for <unknown item>" needs a name we could not resolve
+            confidence -= 0.5
+        return _plan('list_products', '/api/products', {}, 'Fetching products.', confidence, entities)
+
+    # Parties
+    if _has_word(text, ['supplier', 'suppliers', 'vendor', 'vendors']):
+        params = {'search': supplier['name']} if supplier else {}
+        return _plan('list_suppliers', '/api/suppliers', params, 'Fetching suppliers.', confidence, entities)
+    if _has_word(text, ['customer', 'customers', 'clients']) or customer:
+        params = {'search': customer['name']} if customer else {}
+        if customer and not _has_word(text, ['customer', 'details', 'phone', 'contact', 'address', 'show', 'find']):
+            confidence -= 0.3
+        return _plan('list_customers', '/api/customers', params, 'Fetching customers.', confidence, entities)
+
+    return None
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+
+DEFAULT_MODEL_NAME = 'gemini-1.5-flash'
+
+USER_MESSAGE_RE = re.compile(r'User message: (.*?)\n\nPlease analyze', re.DOTALL)
+
+
+def user_message_from_prompt(prompt):
+    """Extract the user's message from a prompt built by the chat route"""
+    match = USER_MESSAGE_RE.search(prompt)
+    return match.group(1) if match else prompt
+
+
+def _in_fresh_app_context(fn, *args):
+    # Threads started with asyncio.to_thread inherit the caller's app
+    # context; push a fresh one so database work gets its own session
+    from flask import current_app, has_app_context
+    if not has_app_context():
+        return fn(*args)
+    with current_app._get_current_object().app_context():
+        return fn(*args)
+
+
+class LLMProvider:
+    """Interface the chat routes use to talk to a language model.
+
+    Subclasses implement at least one of ``generate`` or ``stream``; each
+    has a default written in terms of the other. The coroutine versions
+    ``agenerate`` and ``astream`` default to running ``generate`` on a
+    worker thread.
+    """
+
+    def generate(self, prompt):
+        """Return the complete response text for prompt"""
+        return ''.join(self.stream(prompt))
+
+    def stream(self, prompt):
+        """Yield the response text in chunks"""
+        yield self.generate(prompt)
+
+    async def agenerate(self, prompt):
+        """Coroutine version of generate; runs generate on a worker thread unless overridden"""
+        return await asyncio.to_thread(_in_fresh_app_context, self.generate, prompt)
+
+    async def astream(self, prompt):
+        """Async generator version of stream; one chunk from agenerate unless overridden"""
+        yield await self.agenerate(prompt)
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini client that is only imported and configured on first use"""
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, api_key=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    # Deferred import: the SDK pulls in grpc/protobuf and costs
+                    # hundreds of milliseconds and tens of MB per process.
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key or os.getenv('GEMINI_API_KEY'))
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    @property
+    def is_initialized(self):
+        return self._model is not None
+
+    def generate(self, prompt):
+        """Send prompt to the model and return the raw response text"""
+        response = self._get_model().generate_content(prompt)
+        return response.text
+
+    async def agenerate(self, prompt):
+        """Await the model's response without holding a thread"""
+        model = self._get_model() if self.is_initialized else await asyncio.to_thread(self._get_model)
+        response = await model.generate_content_async(prompt)
+        return response.text
+
+    def stream(self, prompt):
+        """Yield the response text in chunks as the model produces them"""
+        for chunk in self._get_model().generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    async def astream(self, prompt):
+        """Async-iterate the response chunks without holding a thread"""
+        model = self._get_model() if self.is_initialized else await asyncio.to_thread(self._get_model)
+        async for chunk in await model.generate_content_async(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeLLMProvider(LLMProvider):
+    """Offline stand-in for the Gemini client.
+
+    Answers with a canned response when one is registered for the user
+    message, otherwise synthesizes a plan with the local intent classifier.
+    ``latency`` seconds (plus up to ``jitter`` random seconds) are spent
+    before the first chunk to mimic a network round trip, and the text is
+    streamed in ``chunk_size`` pieces.
+    """
+
+    def __init__(self, responses=None, latency=0.0, chunk_size=24, jitter=0.0):
+        self.responses = responses or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_size = chunk_size
+
+    def _respond(self, prompt):
+        user_message = user_message_from_prompt(prompt)
+        if user_message in self.responses:
+            response = self.responses[user_message]
+            return response if isinstance(response, str) else json.dumps(response)
+
+        from src.services.intent import classify
+        plan = classify(user_message)
+        if plan is None:
+            plan = {
+                'intent': 'unknown',
+                'action': 'unknown',
+                'entities': {},
+                'api_calls': [],
+                'response_message': "I'm sorry, I couldn't understand your request.",
+                'requires_confirmation': False,
+            }
+        plan.pop('confidence', None)
+        return json.dumps(plan)
+
+    def _delay(self):
+        return self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def _wait(self):
+        delay = self._delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def agenerate(self, prompt):
+        delay = self._delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Synthesized plans may look names up in the database
+        return await asyncio.to_thread(_in_fresh_app_context, self._respond, prompt)
+
+    def stream(self, prompt):
+        self._wait()
+        text = self._respond(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+
+    async def astream(self, prompt):
+        text = await self.agenerate(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+
+
+class ReplayProvider(FakeLLMProvider):
+    """Serves LLM responses recorded earlier, for offline load tests.
+
+    Recordings are JSON lines of ``{"message": ..., "response": ...}``.
+    Messages missing from the recording are synthesized like
+    FakeLLMProvider, unless ``record_from`` is given: then they are sent to
+    that provider and its answer is appended to the recording.
+    """
+
+    def __init__(self, path=None, record_from=None, latency=0.0, chunk_size=24, jitter=0.0):
+        super().__init__(self.load(path), latency=latency, chunk_size=chunk_size, jitter=jitter)
+        self.path = path
+        self.record_from = record_from
+        self._write_lock = threading.Lock()
+
+    @staticmethod
+    def load(path):
+        responses = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        responses[entry['message']] = entry['response']
+        return responses
+
+    def _record(self, user_message, text):
+        with self._write_lock:
+            self.responses[user_message] = text
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'message': user_message, 'response': text}) + '\n')
+
+    def stream(self, prompt):
+        user_message = user_message_from_prompt(prompt)
+        if self.record_from is None or user_message in self.responses:
+            yield from super().stream(prompt)
+            return
+        chunks = []
+        for chunk in self.record_from.stream(prompt):
+            chunks.append(chunk)
+            yield chunk
+        self._record(user_message, ''.join(chunks))
+
+    async def agenerate(self, prompt):
+        user_message = user_message_from_prompt(prompt)
+        if self.record_from is None or user_message in self.responses:
+            return await super().agenerate(prompt)
+        text = await self.record_from.agenerate(prompt)
+        await asyncio.to_thread(self._record, user_message, text)
+        return text
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_llm_provider(config=None):
+    """Return the process-wide LLM provider, constructing it lazily"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = build_llm_provider(config or {})
+    return _provider
+
+
+def build_llm_provider(config):
+    """Construct the provider selected by LLM_PROVIDER (gemini, fake or replay)"""
+    name = config.get('LLM_PROVIDER', 'gemini')
+    latency = {
+        'latency': config.get('FAKE_LLM_LATENCY_SECONDS', 0.0),
+        'jitter': config.get('FAKE_LLM_JITTER_SECONDS', 0.0),
+    }
+    gemini = GeminiProvider(
+        model_name=config.get('LLM_MODEL', DEFAULT_MODEL_NAME),
+        api_key=config.get('GEMINI_API_KEY'),
+    )
+    if name == 'fake':
+        return FakeLLMProvider(**latency)
+    if name == 'replay':
+        return ReplayProvider(
+            config.get('LLM_REPLAY_PATH'),
+            record_from=gemini if config.get('LLM_REPLAY_RECORD') else None,
+            **latency,
+        )
+    if name != 'gemini':
+        raise ValueError(f"Unknown LLM_PROVIDER '{name}'")
+    return gemini
+
+
+def reset_llm_provider():
+    """Forget the cached provider (used when the configuration changes)"""
+    global _provider
+    with _provider_lock:
+        _provider = None
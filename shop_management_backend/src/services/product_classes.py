@@ -0,0 +1,120 @@
+"""ABC (Pareto) classes and slow movers for the whole catalog.
+
+One grouped query over the sales line items gives every product's revenue
+in the classification window and the date it last sold. Products are then
+ranked by revenue and classified with a cumulative sum over NumPy arrays:
+class A holds the best sellers up to ABC_CLASS_A_SHARE of revenue, class B
+the next ones up to ABC_CLASS_B_SHARE, and class C the rest, including
+products without sales. Products that have not sold for SLOW_MOVER_DAYS
+(and are older than that) are slow movers.
+
+Only products whose class, last sale or slow-mover flag changed are
+written, with one executemany UPDATE.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import Float, and_, bindparam, case, func, select, type_coerce, update
+from src.models.user import db
+from src.models.invoice import Invoice, InvoiceLineItem
+from src.models.product import Product
+
+CLASSES = np.array(['A', 'B', 'C'])
+
+
+def classify_products(config, as_of=None):
+    """Recompute the classes of all active products; returns counts per class, slow movers and rows updated"""
+    as_of = as_of or datetime.utcnow().date()
+    start = as_of - timedelta(days=config.get('ABC_HISTORY_DAYS', 365) - 1)
+    slow_since = as_of - timedelta(days=config.get('SLOW_MOVER_DAYS', 90))
+
+    products = db.session.execute(
+        select(Product.id, Product.created_at, Product.abc_class, Product.last_sold_on, Product.is_slow_mover)
+        .where(Product.is_active.is_(True))
+        .order_by(Product.id)
+    ).all()
+    if not products:
+        return {'A': 0, 'B': 0, 'C': 0, 'slow_movers': 0, 'updated': 0}
+    product_ids = np.array([row.id for row in products], dtype=np.int64)
+
+    revenue = np.zeros(len(product_ids))
+    last_sold = np.full(len(product_ids), None, dtype=object)
+    rows = [tuple(row) for row in db.session.execute(product_sales_query(start, as_of))]
+    if rows:
+        ids, amounts, dates = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(product_ids, ids), len(product_ids) - 1)
+        active = product_ids[positions] == ids  # Sales of inactive products are dropped
+        revenue[positions[active]] = np.array(amounts, dtype=float)[active]
+        last_sold[positions[active]] = np.array(dates, dtype=object)[active]
+
+    classes = abc_classes(revenue, config.get('ABC_CLASS_A_SHARE', 0.8), config.get('ABC_CLASS_B_SHARE', 0.95))
+    created_on = np.array([row.created_at.date() if row.created_at else as_of for row in products], dtype=object)
+    last_activity = np.where(last_sold == None, created_on, last_sold)  # noqa: E711 (elementwise)
+    slow = last_activity < slow_since
+
+    changes = [
+        {'b_id': product_id, 'abc_class': abc_class, 'last_sold_on': sold_on, 'is_slow_mover': is_slow}
+        for product_id, abc_class, sold_on, is_slow, row in zip(
+            product_ids.tolist(), classes.tolist(), last_sold.tolist(), slow.tolist(), products
+        )
+        if (abc_class, sold_on, is_slow) != (row.abc_class, row.last_sold_on, bool(row.is_slow_mover))
+    ]
+    if changes:
+        # Derived data: updated_at is kept so incremental exports do not pick up every product
+        db.session.execute(
+            update(Product.__table__)
+            .where(Product.__table__.c.id == bindparam('b_id'))
+            .values(
+                abc_class=bindparam('abc_class'), last_sold_on=bindparam('last_sold_on'),
+                is_slow_mover=bindparam('is_slow_mover'), updated_at=Product.__table__.c.updated_at,
+            ),
+            changes,
+        )
+
+    counts = dict(zip(*np.unique(classes, return_counts=True)))
+    return {
+        **{abc_class: int(counts.get(abc_class, 0)) for abc_class in CLASSES.tolist()},
+        'slow_movers': int(slow.sum()),
+        'updated': len(changes),
+    }
+
+
+def product_sales_query(start, end):
+    """Revenue (net of tax) from start to end and last sale date of every product ever sold"""
+    in_window = and_(Invoice.invoice_date >= start, Invoice.invoice_date <= end)
+    return (
+        select(
+            InvoiceLineItem.product_id,
+            # Plain floats, skipping the Decimal conversion of every row
+            type_coerce(func.sum(case((in_window, InvoiceLineItem.line_total - InvoiceLineItem.tax_amount), else_=0)), Float),
+            func.max(Invoice.invoice_date),
+        )
+        .join(Invoice, Invoice.id == InvoiceLineItem.invoice_id)
+        .where(
+            Invoice.invoice_type == 'sales',
+            Invoice.status != 'cancelled',
+            Invoice.invoice_date <= end,
+            InvoiceLineItem.product_id.isnot(None),
+        )
+        .group_by(InvoiceLineItem.product_id)
+    )
+
+
+def abc_classes(revenue, a_share, b_share):
+    """'A'/'B'/'C' for each revenue, by the cumulative share of the products ranked above it.
+
+    A product is in class A while the better sellers before it hold less
+    than a_share of the total, so the product that crosses the threshold
+    is still A. Products without revenue are always C.
+    """
+    classes = np.full(len(revenue), 'C', dtype=CLASSES.dtype)
+    total = revenue.sum()
+    if total <= 0:
+        return classes
+    order = np.argsort(-revenue, kind='stable')
+    ranked = revenue[order]
+    share_before = (np.cumsum(ranked) - ranked) / total
+    ranked_classes = np.where(share_before < a_share, 'A', np.where(share_before < b_share, 'B', 'C'))
+    ranked_classes[ranked <= 0] = 'C'
+    classes[order] = ranked_classes
+    return classes
@@ -0,0 +1,349 @@
+"""Declarative, whitelisted query language used by the chatbot.
+
+The LLM describes analytical questions as a small JSON document instead of
+picking one of the fixed list endpoints:
+
+    {
+      "entity": "line_items",
+      "filters": [{"field": "invoice_date", "op": ">=", "value": "2025-10-01"}],
+      "group_by": ["product_name"],
+      "metrics": [{"fn": "sum", "field": "quantity", "as": "units_sold"}],
+      "order": [{"field": "units_sold", "dir": "desc"}],
+      "limit": 5
+    }
+
+Every entity, field, operator and function is checked against the whitelist
+below and the document is compiled into one SQLAlchemy Core SELECT, so the
+grouping and aggregation run inside the database.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import select, func, and_
+from src.models.user import db
+from src.models.customer import Customer
+from src.models.supplier import Supplier
+from src.models.product import Product
+from src.models.invoice import Invoice, InvoiceLineItem
+from src.models.payment import Payment
+
+MAX_LIMIT = 100
+DEFAULT_LIMIT = 10
+
+OPERATORS = {
+    '=': lambda column, value: column == value,
+    '!=': lambda column, value: column != value,
+    '>': lambda column, value: column > value,
+    '>=': lambda column, value: column >= value,
+    '<': lambda column, value: column < value,
+    '<=': lambda column, value: column <= value,
+    'in': lambda column, value: column.in_(value),
+    'contains': lambda column, value: column.ilike(f"%{value}%"),
+    'between': lambda column, value: column.between(value[0], value[1]),
+}
+
+AGGREGATES = {
+    'count': func.count,
+    'count_distinct': lambda column: func.count(column.distinct()),
+    'sum': func.sum,
+    'avg': func.avg,
+    'min': func.min,
+    'max': func.max,
+}
+NUMERIC_AGGREGATES = {'sum', 'avg'}
+
+
+class QueryValidationError(ValueError):
+    """Raised when a query document uses something outside the whitelist"""
+
+
+def _month(column, dialect_name):
+    if dialect_name == 'sqlite':
+        return func.strftime('%Y-%m', column)
+    return func.to_char(column, 'YYYY-MM')
+
+
+def _day(column, dialect_name):
+    if dialect_name == 'sqlite':
+        return func.strftime('%Y-%m-%d', column)
+    return func.to_char(column, 'YYYY-MM-DD')
+
+
+class Field:
+    def __init__(self, build, kind='text'):
+        self.build = build  # dialect_name -> column expression
+        self.kind = kind    # text, number, date, bool
+
+
+def _col(column, kind='text'):
+    return Field(lambda dialect_name: column, kind)
+
+
+def _invoice_fields():
+    return {
+        'invoice_id': _col(Invoice.id, 'number'),
+        'invoice_number': _col(Invoice.invoice_number),
+        'invoice_type': _col(Invoice.invoice_type),
+        'invoice_status': _col(Invoice.status),
+        'invoice_date': _col(Invoice.invoice_date, 'date'),
+        'invoice_month': Field(lambda d: _month(Invoice.invoice_date, d)),
+        'invoice_day': Field(lambda d: _day(Invoice.invoice_date, d)),
+        'customer_id': _col(Invoice.customer_id, 'number'),
+        'customer_name': _col(Customer.name),
+        'customer_type': _col(Customer.customer_type),
+        'supplier_id': _col(Invoice.supplier_id, 'number'),
+        'supplier_name': _col(Supplier.name),
+    }
+
+
+ENTITIES = {
+    'invoices': {
+        'description': 'one row per invoice (sales and purchase bills)',
+        'from': lambda: Invoice.__table__
+            .outerjoin(Customer.__table__, Customer.id == Invoice.customer_id)
+            .outerjoin(Supplier.__table__, Supplier.id == Invoice.supplier_id),
+        'exclude_cancelled': Invoice.status,
+        'fields': {
+            **_invoice_fields(),
+            'due_date': _col(Invoice.due_date, 'date'),
+            'subtotal': _col(Invoice.subtotal, 'number'),
+            'tax_amount': _col(Invoice.tax_amount, 'number'),
+            'discount_amount': _col(Invoice.discount_amount, 'number'),
+            'total_amount': _col(Invoice.total_amount, 'number'),
+            'paid_amount': _col(Invoice.paid_amount, 'number'),
+            'outstanding_amount': Field(lambda d: Invoice.total_amount - Invoice.paid_amount, 'number'),
+        },
+    },
+    'line_items': {
+        'description': 'one row per invoice line, joined to its invoice, product and customer',
+        'from': lambda: InvoiceLineItem.__table__
+            .join(Invoice.__table__, Invoice.id == InvoiceLineItem.invoice_id)
+            .outerjoin(Product.__table__, Product.id == InvoiceLineItem.product_id)
+            .outerjoin(Customer.__table__, Customer.id == Invoice.customer_id)
+            .outerjoin(Supplier.__table__, Supplier.id == Invoice.supplier_id),
+        'exclude_cancelled': Invoice.status,
+        'fields': {
+            **_invoice_fields(),
+            'product_id': _col(InvoiceLineItem.product_id, 'number'),
+            'product_name': Field(lambda d: func.coalesce(Product.name, InvoiceLineItem.item_name)),
+            'category': _col(Product.category),
+            'quantity': _col(InvoiceLineItem.quantity, 'number'),
+            'unit_price': _col(InvoiceLineItem.unit_price, 'number'),
+            'line_total': _col(InvoiceLineItem.line_total, 'number'),
+            'tax_amount': _col(InvoiceLineItem.tax_amount, 'number'),
+            'revenue': Field(lambda d: InvoiceLineItem.line_total - InvoiceLineItem.tax_amount, 'number'),
+        },
+    },
+    'payments': {
+        'description': "one row per payment ('received' from customers, 'made' to suppliers)",
+        'from': lambda: Payment.__table__
+            .outerjoin(Customer.__table__, Customer.id == Payment.customer_id)
+            .outerjoin(Supplier.__table__, Supplier.id == Payment.supplier_id),
+        'exclude_cancelled': Payment.status,
+        'fields': {
+            'payment_id': _col(Payment.id, 'number'),
+            'payment_number': _col(Payment.payment_number),
+            'payment_date': _col(Payment.payment_date, 'date'),
+            'payment_month': Field(lambda d: _month(Payment.payment_date, d)),
+            'payment_day': Field(lambda d: _day(Payment.payment_date, d)),
+            'payment_type': _col(Payment.payment_type),
+            'payment_method': _col(Payment.payment_method),
+            'payment_status': _col(Payment.status),
+            'amount': _col(Payment.amount, 'number'),
+            'invoice_id': _col(Payment.invoice_id, 'number'),
+            'customer_id': _col(Payment.customer_id, 'number'),
+            'customer_name': _col(Customer.name),
+            'supplier_id': _col(Payment.supplier_id, 'number'),
+            'supplier_name': _col(Supplier.name),
+        },
+    },
+    'products': {
+        'description': 'one row per product with current stock and prices',
+        'from': lambda: Product.__table__,
+        'fields': {
+            'product_id': _col(Product.id, 'number'),
+            'product_name': _col(Product.name),
+            'sku': _col(Product.sku),
+            'category': _col(Product.category),
+            'stock_quantity': _col(Product.stock_quantity, 'number'),
+            'min_stock_level': _col(Product.min_stock_level, 'number'),
+            'retail_price': _col(Product.retail_price, 'number'),
+            'wholesale_price': _col(Product.wholesale_price, 'number'),
+            'cost_price': _col(Product.cost_price, 'number'),
+            'stock_value': Field(lambda d: Product.retail_price * Product.stock_quantity, 'number'),
+            'stock_cost_value': Field(lambda d: Product.cost_price * Product.stock_quantity, 'number'),
+            'is_active': _col(Product.is_active, 'bool'),
+            'abc_class': _col(Product.abc_class),
+            'last_sold_on': _col(Product.last_sold_on, 'date'),
+            'is_slow_mover': _col(Product.is_slow_mover, 'bool'),
+        },
+    },
+}
+
+
+def describe_query_dsl():
+    """Plain-text summary of the whitelist, embedded in the LLM prompt"""
+    lines = []
+    for name, entity in ENTITIES.items():
+        lines.append(f"   - {name}: {entity['description']}")
+        lines.append(f"     fields: {', '.join(entity['fields'])}")
+    return "\n".join(lines)
+
+
+def _coerce(value, kind, field_name):
+    if isinstance(value, list):
+        return [_coerce(item, kind, field_name) for item in value]
+    try:
+        if kind == 'number':
+            return Decimal(str(value))
+        if kind == 'date':
+            from src.services.intent import parse_date_expression
+            parsed = parse_date_expression(str(value))
+            if parsed is None:
+                raise ValueError(value)
+            return datetime.strptime(parsed, '%Y-%m-%d').date()
+        if kind == 'bool':
+            return value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+    except (ValueError, ArithmeticError):
+        raise QueryValidationError(f"Invalid value {value!r} for field '{field_name}'")
+    return str(value)
+
+
+def _objects(spec, key):
+    """spec[key] as a list of JSON objects (filters, metrics, order)"""
+    items = spec.get(key) or []
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise QueryValidationError(f"'{key}' must be a list of objects")
+    return items
+
+
+def _names(spec, key):
+    """spec[key] as a list of field names (group_by, fields)"""
+    items = spec.get(key) or []
+    if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+        raise QueryValidationError(f"'{key}' must be a list of field names")
+    return items
+
+
+def compile_query(spec, dialect_name='sqlite'):
+    """Validate a query document and compile it into a Core SELECT.
+
+    Returns (statement, column_names).
+    """
+    if not isinstance(spec, dict):
+        raise QueryValidationError('Query must be a JSON object')
+    entity_name = spec.get('entity')
+    entity = ENTITIES.get(entity_name)
+    if entity is None:
+        raise QueryValidationError(f"Unknown entity '{entity_name}'. Use one of: {', '.join(ENTITIES)}")
+    fields = entity['fields']
+
+    def field(name, context):
+        if not isinstance(name, str) or name not in fields:
+            raise QueryValidationError(f"Unknown {context} field '{name}' for entity '{entity_name}'")
+        return fields[name]
+
+    # WHERE
+    conditions = []
+    filters = _objects(spec, 'filters')
+    filtered_fields = set()
+    for condition in filters:
+        name, op = condition.get('field'), condition.get('op', '=')
+        if not isinstance(op, str) or op not in OPERATORS:
+            raise QueryValidationError(f"Unknown operator '{op}'. Use one of: {', '.join(OPERATORS)}")
+        value = condition.get('value')
+        if op in ('in', 'between') and not isinstance(value, list):
+            raise QueryValidationError(f"Operator '{op}' needs a list value")
+        if op == 'between' and len(value) != 2:
+            raise QueryValidationError("Operator 'between' needs exactly two values")
+        definition = field(name, 'filter')
+        kind = 'text' if op == 'contains' else definition.kind
+        conditions.append(OPERATORS[op](definition.build(dialect_name), _coerce(value, kind, name)))
+        filtered_fields.add(name)
+
+    # Cancelled documents are excluded unless the caller filters on status
+    status_column = entity.get('exclude_cancelled')
+    if status_column is not None and not filtered_fields & {'invoice_status', 'payment_status'}:
+        conditions.append(status_column != 'cancelled')
+
+    # SELECT list
+    group_by = _names(spec, 'group_by')
+    metrics = _objects(spec, 'metrics')
+    order_by = _objects(spec, 'order')
+    columns = {}
+    for name in group_by:
+        columns[name] = field(name, 'group_by').build(dialect_name)
+    for metric in metrics:
+        fn = metric.get('fn')
+        if not isinstance(fn, str) or fn not in AGGREGATES:
+            raise QueryValidationError(f"Unknown metric function '{fn}'. Use one of: {', '.join(AGGREGATES)}")
+        target = metric.get('field')
+        if target in (None, '*'):
+            if fn != 'count':
+                raise QueryValidationError(f"Metric '{fn}' needs a field")
+            expression = func.count()
+            target = 'rows'
+        else:
+            definition = field(target, 'metric')
+            if fn in NUMERIC_AGGREGATES and definition.kind != 'number':
+                raise QueryValidationError(f"Metric '{fn}' needs a numeric field, got '{target}'")
+            expression = AGGREGATES[fn](definition.build(dialect_name))
+        alias = metric.get('as') or f"{fn}_{target}"
+        if not isinstance(alias, str):
+            raise QueryValidationError(f"Metric alias must be a string, got {alias!r}")
+        if alias in columns:
+            raise QueryValidationError(f"Duplicate output column '{alias}'")
+        columns[alias] = expression
+    if not columns:
+        requested = _names(spec, 'fields') or list(fields)[:8]
+        for name in requested:
+            columns[name] = field(name, 'select').build(dialect_name)
+    elif group_by and not metrics:
+        metrics = [{'fn': 'count'}]
+        columns['rows'] = func.count()
+
+    statement = select(*[expression.label(alias) for alias, expression in columns.items()]).select_from(entity['from']())
+    if conditions:
+        statement = statement.where(and_(*conditions))
+    if group_by:
+        statement = statement.group_by(*[columns[name] for name in group_by])
+
+    # ORDER BY an output column, or any whitelisted field for plain selects
+    for order in order_by:
+        name = order.get('field')
+        direction = str(order.get('dir', 'desc')).lower()
+        if direction not in ('asc', 'desc'):
+            raise QueryValidationError(f"Order direction must be 'asc' or 'desc', got '{direction}'")
+        if name in columns:
+            expression = columns[name]
+        elif not metrics and not group_by:
+            expression = field(name, 'order').build(dialect_name)
+        else:
+            raise QueryValidationError(f"Can only order by output columns: {', '.join(columns)}")
+        statement = statement.order_by(expression.desc() if direction == 'desc' else expression.asc())
+
+    try:
+        limit = int(spec.get('limit') or DEFAULT_LIMIT)
+    except (TypeError, ValueError):
+        raise QueryValidationError('limit must be an integer')
+    statement = statement.limit(max(1, min(limit, MAX_LIMIT)))
+
+    return statement, list(columns)
+
+
+def _jsonable(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def run_query(spec):
+    """Validate, compile and execute a query document"""
+    dialect_name = db.session.get_bind().dialect.name
+    statement, column_names = compile_query(spec, dialect_name)
+    rows = db.session.execute(statement).all()
+    return {
+        'columns': column_names,
+        'rows': [{name: _jsonable(value) for name, value in zip(column_names, row)} for row in rows],
+    }
@@ -0,0 +1,229 @@
+"""Incremental maintenance of the daily_sales_facts rollup.
+
+Invoice writes collect the lines they add and remove in a SalesFactChanges
+and apply them in the same transaction: customer types and product costs
+are resolved with IN queries, the changes are summed per fact key and
+written with one INSERT ... ON CONFLICT DO UPDATE per batch. Cancelled
+invoices contribute nothing, so cancelling an invoice removes its lines.
+
+The customer type and unit cost a line was added with are stored on the
+line item, and removing the line uses them rather than the current ones,
+so changing a customer's type or a product's cost does not leave part of
+an old line behind in its fact row.
+
+rebuild_sales_facts() recomputes the whole table from the line items with
+a single INSERT ... SELECT, e.g. after an import that bypassed the routes.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import and_, case, func, literal, or_, select, update
+from src.models.user import db
+from src.models.analytics import DailySalesFact
+from src.models.invoice import Invoice, InvoiceLineItem
+from src.models.customer import Customer
+from src.models.product import Product
+
+MEASURES = ('line_count', 'quantity', 'revenue', 'tax', 'cost')
+
+# Rows per upsert statement, within SQLite's bound parameter limit
+UPSERT_BATCH_SIZE = 500
+
+
+def invoice_lines(invoice):
+    """Fact inputs of an invoice as (invoice_type, sale_date, customer_id, product_id, quantity, revenue, tax,
+    customer_type, unit_cost); the last two are the values the line was posted with, None before that"""
+    if invoice.status == 'cancelled':
+        return []
+    return [
+        (
+            invoice.invoice_type, invoice.invoice_date, invoice.customer_id, item.product_id or 0,
+            Decimal(str(item.quantity)), Decimal(str(item.line_total)) - Decimal(str(item.tax_amount)),
+            Decimal(str(item.tax_amount)), item.fact_customer_type, item.fact_unit_cost,
+        )
+        for item in invoice.line_items
+    ]
+
+
+class SalesFactChanges:
+    """Line items to add to or subtract from the facts, applied together"""
+
+    def __init__(self):
+        # (invoice_type, sale_date, customer_id, product_id, customer_type, unit_cost) -> [lines, quantity, revenue, tax]
+        self._totals = defaultdict(lambda: [0, Decimal('0'), Decimal('0'), Decimal('0')])
+        self._removed = False
+        # Invoices whose line items get the customer type and cost they were added with
+        self._posted = set()
+
+    def add_invoice(self, invoice):
+        for line in invoice_lines(invoice):
+            self.add_line(*line[:7], invoice_id=invoice.id)
+
+    def remove_invoice(self, invoice):
+        for line in invoice_lines(invoice):
+            self.add_line(*line, sign=-1)
+
+    def add_line(self, invoice_type, sale_date, customer_id, product_id, quantity, revenue, tax,
+                 customer_type=None, unit_cost=None, sign=1, invoice_id=None):
+        """Add (or with sign=-1 subtract) one line.
+
+        Removed lines pass the customer_type and unit_cost they were posted
+        with; None (and every added line) takes the current ones. Added lines
+        of ``invoice_id`` are stamped with the values used.
+        """
+        key = (
+            invoice_type, sale_date, customer_id if invoice_type == 'sales' else None, product_id or 0,
+            customer_type, None if unit_cost is None else Decimal(str(unit_cost)),
+        )
+        totals = self._totals[key]
+        totals[0] += sign
+        totals[1] += sign * quantity
+        totals[2] += sign * revenue
+        totals[3] += sign * tax
+        if sign < 0:
+            self._removed = True
+        elif invoice_id is not None:
+            self._posted.add(invoice_id)
+
+    def apply(self):
+        """Write the accumulated changes to daily_sales_facts"""
+        if not self._totals:
+            return
+        customer_ids = {key[2] for key in self._totals if key[2] and key[4] is None}
+        product_ids = {key[3] for key in self._totals if key[3] and key[5] is None}
+        customer_types = dict(_fetch_in((Customer.id, Customer.customer_type), Customer.id, customer_ids))
+        costs = dict(_fetch_in((Product.id, Product.cost_price), Product.id, product_ids))
+
+        facts = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+        for key, (lines, quantity, revenue, tax) in self._totals.items():
+            invoice_type, sale_date, customer_id, product_id, customer_type, unit_cost = key
+            if not lines and not quantity and not revenue and not tax:
+                continue
+            if customer_type is None:
+                customer_type = customer_types.get(customer_id, '') or ''
+            if unit_cost is None:
+                unit_cost = Decimal(str(costs.get(product_id) or 0))
+            fact = facts[(sale_date, product_id, customer_type, invoice_type)]
+            fact['line_count'] += lines
+            fact['quantity'] += quantity
+            fact['revenue'] += revenue
+            fact['tax'] += tax
+            fact['cost'] += quantity * unit_cost
+
+        now = datetime.utcnow()
+        rows = [
+            {'sale_date': sale_date, 'product_id': product_id, 'customer_type': customer_type,
+             'invoice_type': invoice_type, 'updated_at': now, **measures}
+            for (sale_date, product_id, customer_type, invoice_type), measures in facts.items()
+        ]
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            _upsert(rows[start:start + UPSERT_BATCH_SIZE])
+        posted = list(self._posted)
+        for start in range(0, len(posted), UPSERT_BATCH_SIZE):
+            _stamp_lines(InvoiceLineItem.invoice_id.in_(posted[start:start + UPSERT_BATCH_SIZE]))
+        if self._removed:
+            # A negative count means lines were taken out that were never added; keep it visible
+            db.session.execute(DailySalesFact.__table__.delete().where(DailySalesFact.line_count == 0))
+        self._totals.clear()
+        self._removed = False
+        self._posted.clear()
+
+
+def record_invoice_change(before, invoice):
+    """Replace the fact contribution ``before`` (from invoice_lines) with the invoice's current lines"""
+    changes = SalesFactChanges()
+    for line in before:
+        changes.add_line(*line, sign=-1)
+    changes.add_invoice(invoice)
+    changes.apply()
+
+
+def _stamp_lines(condition):
+    """Store the current customer type and product cost on the line items matching condition"""
+    customer_type = (
+        select(case((Invoice.invoice_type == 'sales', func.coalesce(Customer.customer_type, '')), else_=''))
+        .select_from(Invoice)
+        .outerjoin(Customer, Customer.id == Invoice.customer_id)
+        .where(Invoice.id == InvoiceLineItem.invoice_id)
+        .scalar_subquery()
+    )
+    unit_cost = func.coalesce(
+        select(Product.cost_price).where(Product.id == InvoiceLineItem.product_id).scalar_subquery(), 0
+    )
+    db.session.execute(
+        update(InvoiceLineItem)
+        .where(condition)
+        .values(fact_customer_type=customer_type, fact_unit_cost=unit_cost)
+        .execution_options(synchronize_session='fetch')
+    )
+
+
+def _fetch_in(columns, key_column, keys):
+    keys = list(keys)
+    rows = []
+    for start in range(0, len(keys), UPSERT_BATCH_SIZE):
+        rows.extend(db.session.execute(select(*columns).where(key_column.in_(keys[start:start + UPSERT_BATCH_SIZE]))).all())
+    return rows
+
+
+def _upsert(rows):
+    """Add rows' measures to existing facts, inserting the missing ones"""
+    table = DailySalesFact.__table__
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        for row in rows:
+            key = and_(*(table.c[column] == row[column] for column in ('sale_date', 'product_id', 'customer_type', 'invoice_type')))
+            result = db.session.execute(
+                table.update().where(key).values(
+                    updated_at=row['updated_at'], **{measure: table.c[measure] + row[measure] for measure in MEASURES}
+                )
+            )
+            if not result.rowcount:
+                db.session.execute(table.insert().values(**row))
+        return
+    statement = dialect_insert(table).values(rows)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['sale_date', 'product_id', 'customer_type', 'invoice_type'],
+        set_={
+            'updated_at': statement.excluded.updated_at,
+            **{measure: table.c[measure] + statement.excluded[measure] for measure in MEASURES},
+        },
+    ))
+
+
+def rebuild_sales_facts():
+    """Recompute daily_sales_facts from the line items; returns the row count.
+
+    Lines keep the customer type and cost they were posted with; lines
+    never posted (e.g. saved before those were stored) take the current ones.
+    """
+    db.session.execute(DailySalesFact.__table__.delete())
+    _stamp_lines(or_(InvoiceLineItem.fact_customer_type.is_(None), InvoiceLineItem.fact_unit_cost.is_(None)))
+    customer_type = InvoiceLineItem.fact_customer_type
+    product_id = func.coalesce(InvoiceLineItem.product_id, 0)
+    source = (
+        select(
+            Invoice.invoice_date,
+            product_id,
+            customer_type,
+            Invoice.invoice_type,
+            func.count(InvoiceLineItem.id),
+            func.sum(InvoiceLineItem.quantity),
+            func.sum(InvoiceLineItem.line_total - InvoiceLineItem.tax_amount),
+            func.sum(InvoiceLineItem.tax_amount),
+            func.sum(InvoiceLineItem.quantity * InvoiceLineItem.fact_unit_cost),
+            literal(datetime.utcnow(), DailySalesFact.updated_at.type),
+        )
+        .select_from(InvoiceLineItem)
+        .join(Invoice, Invoice.id == InvoiceLineItem.invoice_id)
+        .where(Invoice.status != 'cancelled')
+        .group_by(Invoice.invoice_date, product_id, customer_type, Invoice.invoice_type)
+    )
+    db.session.execute(DailySalesFact.__table__.insert().from_select(
+        ['sale_date', 'product_id', 'customer_type', 'invoice_type', *MEASURES, 'updated_at'], source
+    ))
+    return db.session.scalar(select(func.count()).select_from(DailySalesFact))
@@ -0,0 +1,93 @@
+"""Streaming responses for list endpoints that can return every row.
+
+Rows are read with ``yield_per`` and serialized one at a time into either
+the endpoint's usual JSON envelope (the list, then any totals, which are
+only known at the end) or NDJSON, one object per line. Output is flushed
+in chunks of about STREAM_CHUNK_BYTES, and the opening of the envelope is
+sent before the query runs so the first byte goes out immediately.
+
+Clients opt in with ``?stream=json`` / ``?stream=ndjson`` or an
+``Accept: application/x-ndjson`` header.
+"""
+import json
+from itertools import islice
+from flask import Response, request, stream_with_context
+
+STREAM_BATCH_SIZE = 500
+STREAM_CHUNK_BYTES = 64 * 1024
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def streaming_format():
+    """'json' or 'ndjson' when the request asks for a streamed list, else None"""
+    stream = request.args.get('stream', '').lower()
+    if stream == 'ndjson':
+        return 'ndjson'
+    if stream in ('1', 'true', 'json'):
+        return 'json'
+    if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    return None
+
+
+def batched(rows, size=STREAM_BATCH_SIZE):
+    """Split an iterable into lists of up to size items"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+
+def iter_json_list(key, items, head=None, tail=None):
+    """Yield ``{**head, key: [items...], **tail()}`` as JSON text in chunks"""
+    opening = _dumps(head or {})[:-1]
+    yield f"{opening}{',' if head else ''}\"{key}\":["
+
+    buffer, size, first = [], 0, True
+    for item in items:
+        text = _dumps(item) if first else ',' + _dumps(item)
+        first = False
+        buffer.append(text)
+        size += len(text)
+        if size >= STREAM_CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+
+    closing = ''.join(f",{_dumps(name)}:{_dumps(value)}" for name, value in (tail() if tail else {}).items())
+    buffer.append(f"]{closing}}}")
+    yield ''.join(buffer)
+
+
+def iter_ndjson(items):
+    """Yield one JSON object per line, in chunks"""
+    buffer, size = [], 0
+    for item in items:
+        text = _dumps(item) + '\n'
+        buffer.append(text)
+        size += len(text)
+        if size >= STREAM_CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_list_response(stream_format, key, items, head=None, tail=None):
+    """Response streaming items as a JSON envelope or NDJSON.
+
+    ``tail`` is called after the last item and returns the fields that
+    follow the list (totals accumulated while streaming); NDJSON responses
+    carry only the items.
+    """
+    if stream_format == 'ndjson':
+        chunks, mimetype = iter_ndjson(items), NDJSON_MIMETYPE
+    else:
+        chunks, mimetype = iter_json_list(key, items, head, tail), 'application/json'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={'X-Accel-Buffering': 'no'})
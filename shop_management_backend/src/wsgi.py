@@ -0,0 +1,9 @@
+"""Production WSGI entry point.
+
+Run with gunicorn from the backend directory:
+
+    gunicorn -c gunicorn.conf.py src.wsgi:app
+"""
+from src.main import create_app
+
+app = create_app('production')
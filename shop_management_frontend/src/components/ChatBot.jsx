@@ -6,6 +6,34 @@ import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { ScrollArea } from './ui/scroll-area';
 import { Badge } from './ui/badge';
 
+// Read a text/event-stream response body and call onEvent(event, data)
+// for every complete event
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      onEvent(event, data ? JSON.parse(data) : {});
+    }
+  }
+};
+
 const ChatBot = () => {
   const [messages, setMessages] = useState([
     {
@@ -42,8 +70,15 @@ const ChatBot = () => {
     setInputMessage('');
     setIsLoading(true);
 
+    const botId = Date.now() + 1;
+    const updateBotMessage = (patch) => {
+      setMessages(prev => prev.map(m => (m.id === botId ? { ...m, ...patch } : m)));
+    };
+
     try {
-      const response = await fetch('http://localhost:5000/api/chat', {
+      // Stream the answer over Server-Sent Events so the reply shows up as
+      // soon as each stage (plan, query results, final text) is ready
+      const response = await fetch('http://localhost:5000/api/chat/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -51,44 +86,59 @@ const ChatBot = () => {
         body: JSON.stringify({ message }),
       });
 
-      const data = await response.json();
-
-      if (response.ok) {
-        const botMessage = {
-          id: Date.now() + 1,
-          type: 'bot',
-          content: data.response,
-          timestamp: new Date(),
-          intent: data.intent,
-          action: data.action,
-          requiresConfirmation: data.requires_confirmation,
-          entities: data.entities,
-          apiCalls: data.api_calls,
-          data: data.data
-        };
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.error || 'Failed to get response');
+      }
 
-        setMessages(prev => [...prev, botMessage]);
+      setMessages(prev => [...prev, {
+        id: botId,
+        type: 'bot',
+        content: 'Thinking...',
+        timestamp: new Date()
+      }]);
+      setIsLoading(false);
 
-        // If action requires confirmation, set it as pending
-        if (data.requires_confirmation) {
-          setPendingAction({
-            message: data.response,
+      let plan = null;
+      const results = [];
+      await readEventStream(response, (event, data) => {
+        if (event === 'plan') {
+          plan = data;
+          updateBotMessage({
+            content: data.api_calls?.length && !data.requires_confirmation ? 'Looking that up...' : 'Thinking...',
+            intent: data.intent,
+            action: data.action,
+            requiresConfirmation: data.requires_confirmation,
             entities: data.entities,
             apiCalls: data.api_calls
           });
+        } else if (event === 'result') {
+          results[data.index] = data.data;
+          updateBotMessage({ data: [...results] });
+        } else if (event === 'response') {
+          updateBotMessage({ content: data.response });
+        } else if (event === 'error') {
+          throw new Error(data.error || 'Failed to get response');
         }
-      } else {
-        throw new Error(data.error || 'Failed to get response');
+      });
+
+      // If action requires confirmation, set it as pending
+      if (plan?.requires_confirmation) {
+        setPendingAction({
+          message: plan.response_message,
+          entities: plan.entities,
+          apiCalls: plan.api_calls
+        });
       }
     } catch (error) {
       const errorMessage = {
-        id: Date.now() + 1,
+        id: botId,
         type: 'bot',
         content: `Sorry, I encountered an error: ${error.message}. Please try again.`,
         timestamp: new Date(),
         isError: true
       };
-      setMessages(prev => [...prev, errorMessage]);
+      setMessages(prev => [...prev.filter(m => m.id !== botId), errorMessage]);
     } finally {
       setIsLoading(false);
     }